@@ -0,0 +1 @@
+"""Benchmarks of rosbag-tools on deterministic synthetic rosbags"""
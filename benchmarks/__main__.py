@@ -0,0 +1,177 @@
+import click
+
+from benchmarks.suite import (
+    CASES,
+    compare_results,
+    load_results,
+    run_suite,
+    save_results,
+    startup_errors,
+)
+from benchmarks.synthetic import PRESETS, generate_rosbag
+
+CONTEXT_SETTINGS = {"help_option_names": ["-h", "--help"]}
+
+
+def spec_options(f):
+    """Options that select a preset spec and override some of its values"""
+    options = [
+        click.option(
+            "-p",
+            "--preset",
+            type=click.Choice(list(PRESETS)),
+            default="small",
+            show_default=True,
+            help="Synthetic rosbag preset",
+        ),
+        click.option("--duration", type=click.FLOAT, help="Duration of the rosbag (s)"),
+        click.option("--seed", type=click.INT, help="Seed of the message content"),
+        click.option(
+            "--image-size",
+            type=(click.INT, click.INT),
+            help="Image width and height, in pixels",
+        ),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+
+def make_preset_spec(preset, duration=None, seed=None, image_size=None):
+    """Spec of a preset, with overridden values"""
+    spec = PRESETS[preset]
+    if duration is not None:
+        spec = spec._replace(duration=duration)
+    if seed is not None:
+        spec = spec._replace(seed=seed)
+    if image_size is not None:
+        spec = spec._replace(image_width=image_size[0], image_height=image_size[1])
+    return spec
+
+
+def print_comparison(comparisons, threshold):
+    """Print a comparison table and return the regressions"""
+    regressions = [c for c in comparisons if c.is_regression(threshold)]
+    width = max((len(c.name) for c in comparisons), default=4)
+    print(f"{'case':<{width}}  {'baseline':>10}  {'current':>10}  {'ratio':>6}")
+    for comp in comparisons:
+        flag = "  REGRESSION" if comp in regressions else ""
+        print(
+            f"{comp.name:<{width}}  {comp.baseline:>9.3f}s  {comp.current:>9.3f}s"
+            f"  {comp.ratio:>6.2f}{flag}"
+        )
+    return regressions
+
+
+@click.group(context_settings=CONTEXT_SETTINGS)
+def cli():
+    """Benchmarks of rosbag-tools on synthetic rosbags"""
+    pass
+
+
+@cli.command("generate")
+@click.argument("outbag", type=click.Path())
+@spec_options
+@click.option("-f", "--force", is_flag=True, help="Overwrite an existing rosbag")
+def generate(outbag, preset, duration, seed, image_size, force):
+    """Generate a synthetic rosbag in OUTBAG
+
+    OUTBAG is a ROS 1 rosbag if it ends with .bag, else a ROS 2 rosbag.
+    """
+    spec = make_preset_spec(preset, duration, seed, image_size)
+    path = generate_rosbag(outbag, spec, force=force)
+    print(f"[benchmarks] Generated {spec.message_count} messages in {path}")
+
+
+@cli.command("run")
+@spec_options
+@click.option(
+    "-c",
+    "--case",
+    "cases",
+    multiple=True,
+    type=click.Choice([c.name for c in CASES]),
+    help="Benchmark case to run. Can be repeated. Defaults to all cases.",
+)
+@click.option(
+    "-r",
+    "--repeat",
+    default=3,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Number of timed runs of each case",
+)
+@click.option(
+    "-d",
+    "--data-dir",
+    type=click.Path(file_okay=False),
+    help="Directory where synthetic rosbags are kept between runs. Defaults to a temporary directory.",
+)
+@click.option("-o", "--output", type=click.Path(), help="JSON results output path")
+@click.option(
+    "-b", "--baseline", type=click.Path(exists=True), help="JSON baseline results"
+)
+@click.option(
+    "-t",
+    "--threshold",
+    default=0.1,
+    type=click.FloatRange(min=0),
+    show_default=True,
+    help="Relative slowdown above which a case is a regression",
+)
+@click.option("--no-startup", is_flag=True, help="Do not time the CLI startup")
+def run(
+    preset,
+    duration,
+    seed,
+    image_size,
+    cases,
+    repeat,
+    data_dir,
+    output,
+    baseline,
+    threshold,
+    no_startup,
+):
+    """Time the rosbag tools on synthetic rosbags"""
+    spec = make_preset_spec(preset, duration, seed, image_size)
+    results = run_suite(spec, data_dir, cases, repeat=repeat, startup=not no_startup)
+    if output is not None:
+        print(f"[benchmarks] Results saved in {save_results(results, output)}")
+
+    failed = False
+    heavy = startup_errors(results)
+    if heavy:
+        print(f"[benchmarks] rosbag-tools --help imports {', '.join(heavy)}")
+        failed = True
+    if baseline is not None:
+        regressions = print_comparison(
+            compare_results(load_results(baseline), results), threshold
+        )
+        failed = failed or bool(regressions)
+    if failed:
+        raise click.ClickException("Benchmark regressions")
+
+
+@cli.command("compare")
+@click.argument("baseline", type=click.Path(exists=True))
+@click.argument("current", type=click.Path(exists=True))
+@click.option(
+    "-t",
+    "--threshold",
+    default=0.1,
+    type=click.FloatRange(min=0),
+    show_default=True,
+    help="Relative slowdown above which a case is a regression",
+)
+def compare(baseline, current, threshold):
+    """Compare CURRENT benchmark results to BASELINE results"""
+    regressions = print_comparison(
+        compare_results(load_results(baseline), load_results(current)), threshold
+    )
+    if regressions:
+        raise click.ClickException(f"{len(regressions)} benchmark regressions")
+
+
+if __name__ == "__main__":
+    cli()
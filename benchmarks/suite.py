@@ -0,0 +1,388 @@
+"""Benchmark cases of the rosbag tools, JSON results and baseline comparison
+
+Each case times a public method of a tool on a synthetic rosbag, in ROS 1 and in
+ROS 2. Results are saved in JSON files, which can be compared between commits.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
+
+from benchmarks.synthetic import BagSpec, generate_rosbag
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Modules that `rosbag-tools --help` should not import
+HEAVY_MODULES = ("pandas", "matplotlib", "rosbags", "yaml", "tqdm", "numpy")
+
+
+class Case(NamedTuple):
+    """Benchmark case : run(inbag, outdir, spec) runs the timed operation"""
+
+    name: str
+    run: Callable[[Path, Path, BagSpec], Any]
+    formats: Tuple[str, ...] = ("ros1", "ros2")
+
+    def available(self, spec: BagSpec) -> bool:
+        """Can the case run on a rosbag of this spec ?"""
+        if self.name.startswith("export-odometry"):
+            return bool(spec.topics_of("odometry"))
+        return True
+
+
+def _output(inbag: Path, outdir: Path, name: str) -> Path:
+    """Output path with the same rosbag format as `inbag`"""
+    return outdir / (f"{name}.bag" if inbag.suffix == ".bag" else name)
+
+
+def _clip(inbag: Path, outdir: Path, spec: BagSpec) -> None:
+    from rosbag_tools.clip import BagClipper
+
+    with BagClipper(inbag) as clipper:
+        clipper.clip_rosbag(
+            spec.duration / 3, 2 * spec.duration / 3, _output(inbag, outdir, "clip")
+        )
+
+
+def _clip_intervals(inbag: Path, outdir: Path, spec: BagSpec) -> None:
+    from rosbag_tools.clip import BagClipper
+
+    step = spec.duration / 7
+    intervals = [(step, 2 * step), (3 * step, 4 * step), (5 * step, 6 * step)]
+    with BagClipper(inbag) as clipper:
+        clipper.clip_rosbag_intervals(intervals, _output(inbag, outdir, "clips"))
+
+
+def _split(inbag: Path, outdir: Path, spec: BagSpec) -> None:
+    from rosbag_tools.split import BagSplitter
+
+    with BagSplitter(inbag) as splitter:
+        splitter.split_rosbag(
+            [spec.duration / 3, 2 * spec.duration / 3], _output(inbag, outdir, "split")
+        )
+
+
+def _topic_remove(inbag: Path, outdir: Path, spec: BagSpec) -> None:
+    from rosbag_tools.topic_remove import BagTopicRemover
+
+    with BagTopicRemover(inbag) as remover:
+        remover.remove(spec.topics_of("image") or spec.topics[-1].topic)
+        remover.export(_output(inbag, outdir, "filt"))
+
+
+def _topic_remove_small(inbag: Path, outdir: Path, spec: BagSpec) -> None:
+    from rosbag_tools.topic_remove import BagTopicRemover
+
+    with BagTopicRemover(inbag) as remover:
+        remover.remove(spec.topics_of("imu") or spec.topics[0].topic)
+        remover.export(_output(inbag, outdir, "filt"))
+
+
+def _topic_remove_prefetch(inbag: Path, outdir: Path, spec: BagSpec) -> None:
+    from rosbag_tools.topic_remove import BagTopicRemover
+
+    with BagTopicRemover(inbag) as remover:
+        remover.remove(spec.topics_of("imu") or spec.topics[0].topic)
+        remover.export(_output(inbag, outdir, "filt"), prefetch=1024)
+
+
+def _export_odometry(inbag: Path, outdir: Path, spec: BagSpec) -> None:
+    from rosbag_tools.export_odom import OdometryExporter
+
+    with OdometryExporter(inbag) as exporter:
+        exporter.export_odometry(
+            spec.topics_of("odometry")[0], export_path=outdir / "odom.txt"
+        )
+
+
+def _pipeline(inbag: Path, outdir: Path, spec: BagSpec) -> None:
+    from rosbag_tools.pipeline import BagPipeline, Decimate, TimeWindow, TopicFilter
+
+    stages = [
+        TimeWindow(spec.duration / 4, 3 * spec.duration / 4),
+        TopicFilter(spec.topics_of("image") or ("/none",)),
+        Decimate(2, spec.topics_of("imu") or ("*",)),
+    ]
+    with BagPipeline(inbag, stages) as pipeline:
+        pipeline.run(_output(inbag, outdir, "pipeline"))
+
+
+def _session(inbag: Path, outdir: Path, spec: BagSpec) -> None:
+    from rosbag_tools.session import BagSession
+
+    with BagSession(inbag) as session:
+        session.open()
+
+
+def _read_summary(inbag: Path, outdir: Path, spec: BagSpec) -> None:
+    from rosbag_tools.metadata import read_summary
+
+    read_summary(inbag)
+
+
+def _compute_duration(inbag: Path, outdir: Path, spec: BagSpec) -> None:
+    from rosbag_tools.compute_duration import DurationCalculator
+
+    DurationCalculator(inbag.parent).extract_data(use_cache=False)
+
+
+def _topic_compare(inbag: Path, outdir: Path, spec: BagSpec) -> None:
+    from rosbag_tools.topic_compare import BagTopicComparator
+
+    BagTopicComparator(inbag.parent).extract_data(use_cache=False)
+
+
+CASES = (
+    Case("clip", _clip),
+    Case("clip-intervals", _clip_intervals),
+    Case("split", _split),
+    Case("topic-remove", _topic_remove),
+    Case("topic-remove-imu", _topic_remove_small),
+    Case("topic-remove-prefetch", _topic_remove_prefetch),
+    Case("export-odometry", _export_odometry),
+    Case("pipeline", _pipeline),
+    Case("session-open", _session),
+    Case("read-summary", _read_summary),
+    Case("compute-duration", _compute_duration, ("dataset",)),
+    Case("topic-compare", _topic_compare, ("dataset",)),
+)
+
+
+def _stats(times: Sequence[float]) -> Dict[str, Any]:
+    """Summary statistics of timing runs, in seconds"""
+    return {
+        "runs": list(times),
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+
+def _rosbag_size(path: Path) -> int:
+    """Size of a rosbag, in bytes"""
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.iterdir() if p.is_file())
+    return path.stat().st_size
+
+
+def time_case(
+    case: Case, inbag: Path, workdir: Path, spec: BagSpec, repeat: int = 3
+) -> Dict[str, Any]:
+    """Time a benchmark case, with a fresh output directory for each run
+
+    Args:
+        case: Benchmark case
+        inbag: Input rosbag
+        workdir: Directory of the outputs, emptied between runs
+        spec: Spec of the input rosbag
+        repeat: Number of timed runs. Defaults to 3.
+
+    Returns:
+        Dict[str, Any]: Timing statistics (s), and throughputs of the median run
+    """
+    from rosbag_tools.progress import set_quiet
+
+    set_quiet(True)
+    times = []
+    for _ in range(repeat):
+        shutil.rmtree(workdir, ignore_errors=True)
+        workdir.mkdir(parents=True)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            case.run(inbag, workdir, spec)
+            times.append(time.perf_counter() - start)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    result = _stats(times)
+    result["msgs_per_s"] = spec.message_count / result["median"]
+    result["mb_per_s"] = _rosbag_size(inbag) / 1e6 / result["median"]
+    return result
+
+
+def time_startup(repeat: int = 10) -> Dict[str, Any]:
+    """Time `rosbag-tools --help` in a new interpreter, and list the heavy modules it imports
+
+    Args:
+        repeat: Number of timed runs. Defaults to 10.
+
+    Returns:
+        Dict[str, Any]: Timing statistics (s), and heavy modules imported at startup
+    """
+    cmd = [sys.executable, "-m", "rosbag_tools", "--help"]
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, check=True, capture_output=True)
+        times.append(time.perf_counter() - start)
+
+    script = (
+        "import sys; from click.testing import CliRunner; "
+        "from rosbag_tools.__main__ import cli_main; "
+        "CliRunner().invoke(cli_main, ['--help']); "
+        "print(' '.join(m for m in sys.modules if m.split('.')[0] in sys.argv[1:]))"
+    )
+    modules = subprocess.run(
+        [sys.executable, "-c", script, *HEAVY_MODULES],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split()
+
+    result = _stats(times)
+    result["heavy_modules"] = sorted({m.split(".")[0] for m in modules})
+    return result
+
+
+def _git_commit() -> Optional[str]:
+    """Current git commit of the repository, if available"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(
+    spec: BagSpec,
+    data_dir: Optional[Path | str] = None,
+    cases: Sequence[str] = (),
+    repeat: int = 3,
+    startup: bool = True,
+    log: Callable[[str], None] = print,
+) -> Dict[str, Any]:
+    """Generate the synthetic rosbags of a spec and time the benchmark cases
+
+    Args:
+        spec: Spec of the synthetic rosbags
+        data_dir: Directory of the synthetic rosbags, reused between runs. Defaults to None, a temporary directory.
+        cases: Names of the cases to run. Defaults to all cases.
+        repeat: Number of timed runs of each case. Defaults to 3.
+        startup: Time the startup of the command line interface. Defaults to True.
+        log: Progress messages callback. Defaults to print.
+
+    Returns:
+        Dict[str, Any]: Environment and results of the benchmark
+    """
+    from rosbag_tools import __version__
+
+    unknown = set(cases) - {c.name for c in CASES}
+    if unknown:
+        raise ValueError(f"Unknown benchmark cases : {', '.join(sorted(unknown))}")
+    selected = [c for c in CASES if (not cases or c.name in cases) and c.available(spec)]
+
+    results: Dict[str, Any] = {}
+    with contextlib.ExitStack() as stack:
+        if data_dir is None:
+            data_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        data_dir = Path(data_dir)
+        workdir = data_dir / "_outputs"
+
+        log(f"Generating synthetic rosbags ({spec.message_count} messages) in {data_dir}")
+        inbags = {
+            "ros1": generate_rosbag(data_dir / "dataset" / "synthetic.bag", spec),
+            "ros2": generate_rosbag(data_dir / "dataset" / "synthetic2", spec),
+        }
+        # Dataset cases scan the dataset directory, that contains both rosbags
+        inbags["dataset"] = inbags["ros1"]
+
+        for case in selected:
+            for fmt in case.formats:
+                name = f"{fmt}/{case.name}"
+                log(f"Running {name}")
+                results[name] = time_case(case, inbags[fmt], workdir, spec, repeat)
+                log(f"  median {results[name]['median']:.3f} s")
+
+    if startup:
+        log("Running cli/startup")
+        results["cli/startup"] = time_startup()
+        log(f"  median {results['cli/startup']['median']:.3f} s")
+
+    return {
+        "environment": {
+            "rosbag_tools": __version__,
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        },
+        "spec": spec.to_dict(),
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def save_results(results: Dict[str, Any], path: Path | str) -> Path:
+    """Save benchmark results in a JSON file"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    return path
+
+
+def load_results(path: Path | str) -> Dict[str, Any]:
+    """Load benchmark results from a JSON file"""
+    return json.loads(Path(path).read_text(encoding="utf-8"))
+
+
+class Comparison(NamedTuple):
+    """Comparison of a benchmark case between a baseline and current results"""
+
+    name: str
+    baseline: float
+    current: float
+
+    @property
+    def ratio(self) -> float:
+        """Current median time relative to the baseline median time"""
+        return self.current / self.baseline if self.baseline else float("inf")
+
+    def is_regression(self, threshold: float) -> bool:
+        """Is the current time more than `threshold` slower than the baseline ?"""
+        return self.ratio > 1 + threshold
+
+
+def compare_results(
+    baseline: Dict[str, Any], current: Dict[str, Any]
+) -> List[Comparison]:
+    """Compare the median times of the cases present in both results
+
+    Args:
+        baseline: Baseline results
+        current: Current results
+
+    Returns:
+        List[Comparison]: Comparison of each common case
+    """
+    if baseline.get("spec") != current.get("spec"):
+        raise ValueError(
+            "Results were measured on synthetic rosbags with different specs"
+        )
+    base, cur = baseline["results"], current["results"]
+    return [
+        Comparison(name, base[name]["median"], cur[name]["median"])
+        for name in cur
+        if name in base
+    ]
+
+
+def startup_errors(results: Dict[str, Any]) -> List[str]:
+    """Heavy modules imported by `rosbag-tools --help`, which should start without them"""
+    return results["results"].get("cli/startup", {}).get("heavy_modules", [])
@@ -0,0 +1,256 @@
+"""Deterministic synthetic rosbags for the benchmarks
+
+A synthetic rosbag mixes small high-rate messages (IMU), medium messages (odometry)
+and large blobs (images), written with the `rosbags` writers. The same `BagSpec`
+always produces the same messages, in ROS 1 and in ROS 2.
+"""
+
+from __future__ import annotations
+
+import heapq
+import json
+import shutil
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+from rosbags.rosbag1 import Writer as Writer1
+from rosbags.rosbag2 import Writer as Writer2
+from rosbags.serde import serialize_cdr, serialize_ros1
+from rosbags.typesys.types import builtin_interfaces__msg__Time as Time
+from rosbags.typesys.types import geometry_msgs__msg__Point as Point
+from rosbags.typesys.types import geometry_msgs__msg__Pose as Pose
+from rosbags.typesys.types import geometry_msgs__msg__PoseWithCovariance as PoseCov
+from rosbags.typesys.types import geometry_msgs__msg__Quaternion as Quaternion
+from rosbags.typesys.types import geometry_msgs__msg__Twist as Twist
+from rosbags.typesys.types import geometry_msgs__msg__TwistWithCovariance as TwistCov
+from rosbags.typesys.types import geometry_msgs__msg__Vector3 as Vector3
+from rosbags.typesys.types import nav_msgs__msg__Odometry as Odometry
+from rosbags.typesys.types import sensor_msgs__msg__Image as Image
+from rosbags.typesys.types import sensor_msgs__msg__Imu as Imu
+from rosbags.typesys.types import std_msgs__msg__Header as Header
+
+if TYPE_CHECKING:
+    from typing import Any, Dict, Iterator, Tuple
+
+# Timestamp of the first message : 2020-09-13T12:26:40 UTC
+START_TIME = 1_600_000_000 * 10**9
+
+MSGTYPES = {
+    "imu": "sensor_msgs/msg/Imu",
+    "odometry": "nav_msgs/msg/Odometry",
+    "image": "sensor_msgs/msg/Image",
+}
+
+
+class TopicSpec(NamedTuple):
+    """Topic of a synthetic rosbag"""
+
+    topic: str
+    kind: str
+    rate: float
+
+    @property
+    def msgtype(self) -> str:
+        """Message type of the topic"""
+        return MSGTYPES[self.kind]
+
+
+class BagSpec(NamedTuple):
+    """Content of a synthetic rosbag"""
+
+    duration: float
+    topics: Tuple[TopicSpec, ...]
+    image_width: int = 640
+    image_height: int = 480
+    seed: int = 0
+
+    @property
+    def message_count(self) -> int:
+        """Number of messages of the rosbag"""
+        return sum(int(self.duration * t.rate) for t in self.topics)
+
+    def topics_of(self, kind: str) -> Tuple[str, ...]:
+        """Topics of a message kind ('imu', 'odometry' or 'image')"""
+        return tuple(t.topic for t in self.topics if t.kind == kind)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-compatible description of the spec"""
+        dct = self._asdict()
+        dct["topics"] = [t._asdict() for t in self.topics]
+        return dct
+
+    @classmethod
+    def from_dict(cls, dct: Dict[str, Any]) -> BagSpec:
+        """Spec from the output of `to_dict`"""
+        topics = tuple(TopicSpec(**t) for t in dct["topics"])
+        return cls(**{**dct, "topics": topics})
+
+
+def make_spec(
+    duration: float = 10.0,
+    imu_topics: int = 1,
+    odom_topics: int = 1,
+    image_topics: int = 1,
+    imu_rate: float = 200.0,
+    odom_rate: float = 50.0,
+    image_rate: float = 10.0,
+    image_width: int = 640,
+    image_height: int = 480,
+    seed: int = 0,
+) -> BagSpec:
+    """Build the spec of a synthetic rosbag from topic counts and rates
+
+    Args:
+        duration: Duration of the rosbag, in seconds. Defaults to 10.0.
+        imu_topics: Number of IMU topics. Defaults to 1.
+        odom_topics: Number of odometry topics. Defaults to 1.
+        image_topics: Number of image topics. Defaults to 1.
+        imu_rate: Rate of each IMU topic, in Hz. Defaults to 200.0.
+        odom_rate: Rate of each odometry topic, in Hz. Defaults to 50.0.
+        image_rate: Rate of each image topic, in Hz. Defaults to 10.0.
+        image_width: Image width, in pixels. Defaults to 640.
+        image_height: Image height, in pixels. Defaults to 480.
+        seed: Seed of the message content. Defaults to 0.
+
+    Returns:
+        BagSpec: Spec of the rosbag
+    """
+    topics = (
+        [TopicSpec(f"/imu{i}/data", "imu", imu_rate) for i in range(imu_topics)]
+        + [TopicSpec(f"/odom{i}", "odometry", odom_rate) for i in range(odom_topics)]
+        + [
+            TopicSpec(f"/camera{i}/image_raw", "image", image_rate)
+            for i in range(image_topics)
+        ]
+    )
+    return BagSpec(duration, tuple(topics), image_width, image_height, seed)
+
+
+PRESETS = {
+    "tiny": make_spec(duration=5.0, image_width=160, image_height=120),
+    "small": make_spec(duration=30.0),
+    "imu": make_spec(duration=60.0, imu_topics=4, image_topics=0, imu_rate=1000.0),
+    "medium": make_spec(duration=120.0, imu_topics=2, image_topics=2),
+    "large": make_spec(duration=600.0, imu_topics=2, image_topics=2),
+}
+
+
+def _header(timestamp: int, frame_id: str) -> Header:
+    """Header of a message published at `timestamp` (ns)"""
+    return Header(Time(sec=timestamp // 10**9, nanosec=timestamp % 10**9), frame_id)
+
+
+def _quaternion(yaw: float) -> Quaternion:
+    """Quaternion of a rotation of `yaw` radians around z"""
+    return Quaternion(0.0, 0.0, float(np.sin(yaw / 2)), float(np.cos(yaw / 2)))
+
+
+def _make_message(
+    topic: TopicSpec, timestamp: int, rng: np.random.Generator, spec: BagSpec
+) -> Any:
+    """Build a message of a topic, published at `timestamp` (ns)"""
+    elapsed = (timestamp - START_TIME) / 1e9
+    if topic.kind == "imu":
+        noise = rng.normal(0.0, 0.01, 6)
+        return Imu(
+            _header(timestamp, "imu"),
+            _quaternion(0.1 * elapsed),
+            np.zeros(9),
+            Vector3(noise[0], noise[1], 0.1 + noise[2]),
+            np.zeros(9),
+            Vector3(noise[3], noise[4], 9.81 + noise[5]),
+            np.zeros(9),
+        )
+    if topic.kind == "odometry":
+        pose = Pose(
+            Point(np.cos(0.1 * elapsed), np.sin(0.1 * elapsed), 0.0),
+            _quaternion(0.1 * elapsed + np.pi / 2),
+        )
+        twist = Twist(Vector3(0.1, 0.0, 0.0), Vector3(0.0, 0.0, 0.1))
+        return Odometry(
+            _header(timestamp, "odom"),
+            "base_link",
+            PoseCov(pose, np.zeros(36)),
+            TwistCov(twist, np.zeros(36)),
+        )
+    if topic.kind == "image":
+        width, height = spec.image_width, spec.image_height
+        return Image(
+            _header(timestamp, "camera"),
+            height,
+            width,
+            "rgb8",
+            0,
+            3 * width,
+            rng.integers(0, 256, 3 * width * height, dtype=np.uint8),
+        )
+    raise ValueError(f"Unknown message kind {topic.kind!r}")
+
+
+def generate_messages(
+    spec: BagSpec, ros1: bool = False
+) -> Iterator[Tuple[TopicSpec, int, bytes]]:
+    """Generate the serialized messages of a synthetic rosbag, in timestamp order
+
+    Args:
+        spec: Spec of the rosbag
+        ros1: If True, messages are serialized for ROS 1, else in CDR for ROS 2. Defaults to False.
+
+    Yields:
+        Tuple[TopicSpec, int, bytes]: Topic, timestamp (ns) and serialized data of each message
+    """
+    serialize = serialize_ros1 if ros1 else serialize_cdr
+
+    def topic_messages(tidx: int, topic: TopicSpec):
+        # One random generator per topic : messages do not depend on the other topics
+        rng = np.random.default_rng([spec.seed, tidx])
+        period = 10**9 / topic.rate
+        # Topics are offset by a few microseconds, to avoid identical timestamps
+        offset = tidx * 1000
+        for idx in range(int(spec.duration * topic.rate)):
+            timestamp = START_TIME + int(idx * period) + offset
+            yield timestamp, tidx, rng
+
+    streams = [topic_messages(tidx, topic) for tidx, topic in enumerate(spec.topics)]
+    for timestamp, tidx, rng in heapq.merge(*streams, key=lambda x: x[:2]):
+        topic = spec.topics[tidx]
+        msg = _make_message(topic, timestamp, rng, spec)
+        yield topic, timestamp, bytes(serialize(msg, topic.msgtype))
+
+
+def generate_rosbag(path: Path | str, spec: BagSpec, force: bool = False) -> Path:
+    """Write a synthetic rosbag
+
+    A ROS 1 rosbag is written if `path` ends with `.bag`, else a ROS 2 rosbag.
+    The spec is saved next to the rosbag (`<path>.spec.json`) : an existing rosbag
+    with the same spec is not written again, unless `force` is set.
+
+    Args:
+        path: Path of the rosbag
+        spec: Spec of the rosbag
+        force: Overwrite the rosbag, even if it has the same spec. Defaults to False.
+
+    Returns:
+        Path: Path of the rosbag
+    """
+    path = Path(path)
+    spec_path = path.with_name(f"{path.name}.spec.json")
+    if not force and path.exists() and spec_path.exists():
+        if json.loads(spec_path.read_text(encoding="utf-8")) == spec.to_dict():
+            return path
+    if path.is_dir():
+        shutil.rmtree(path)
+    elif path.exists():
+        path.unlink()
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    ros1 = path.suffix == ".bag"
+    Writer = Writer1 if ros1 else Writer2
+    with Writer(path) as writer:
+        conns = {t.topic: writer.add_connection(t.topic, t.msgtype) for t in spec.topics}
+        for topic, timestamp, data in generate_messages(spec, ros1=ros1):
+            writer.write(conns[topic.topic], timestamp, data)
+
+    spec_path.write_text(json.dumps(spec.to_dict(), indent=2), encoding="utf-8")
+    return path
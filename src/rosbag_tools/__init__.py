@@ -1,11 +1,29 @@
 """A ROS-agnostic toolbox for common rosbag operations"""
 
-
-from .clip import clip
-from .compute_duration import compute_duration
-from .export_odom import export_odometry
-from .split import split
-from .topic_compare import topic_compare
-from .topic_remove import topic_remove
+from rosbag_tools.utils import lazy_getattr
 
 __version__ = "0.0.10"
+
+__all__ = (
+    "clip",
+    "compute_duration",
+    "export_odometry",
+    "pipeline",
+    "split",
+    "topic_compare",
+    "topic_remove",
+)
+
+# Subcommands are imported on first access, to keep the CLI startup fast
+__getattr__ = lazy_getattr(
+    __name__,
+    {
+        "clip": ".clip.main:cli",
+        "compute_duration": ".compute_duration.main:cli",
+        "export_odometry": ".export_odom.main:cli",
+        "pipeline": ".pipeline.main:cli",
+        "split": ".split.main:cli",
+        "topic_compare": ".topic_compare.main:cli",
+        "topic_remove": ".topic_remove.main:cli",
+    },
+)
@@ -1,32 +1,50 @@
+from importlib import import_module
+
 import click
 
-from rosbag_tools import (
-    __version__,
-    clip,
-    compute_duration,
-    export_odometry,
-    split,
-    topic_compare,
-    topic_remove,
-)
+from rosbag_tools import __version__
 
 CONTEXT_SETTINGS = {"help_option_names": ["-h", "--help"]}
 
+# Subcommand name => module and name of its click command
+SUBCOMMANDS = {
+    "clip": ("rosbag_tools.clip.main", "cli"),
+    "split": ("rosbag_tools.split.main", "cli"),
+    "compute-duration": ("rosbag_tools.compute_duration.main", "cli"),
+    "export-odometry": ("rosbag_tools.export_odom.main", "cli"),
+    "pipeline": ("rosbag_tools.pipeline.main", "cli"),
+    "topic-compare": ("rosbag_tools.topic_compare.main", "cli"),
+    "topic-remove": ("rosbag_tools.topic_remove.main", "cli"),
+}
+
+
+class LazyGroup(click.Group):
+    """LazyGroup - click group that imports a subcommand only when it is used
+
+    Importing every tool at startup pulls in rosbags, numpy and yaml, which costs
+    hundreds of milliseconds on each call of the CLI.
+    """
+
+    def __init__(self, *args, lazy_commands=None, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = dict(lazy_commands or {})
 
-@click.group(context_settings=CONTEXT_SETTINGS)
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_commands and cmd_name not in self.commands:
+            module, attr = self.lazy_commands[cmd_name]
+            self.add_command(getattr(import_module(module), attr), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+
+@click.group(cls=LazyGroup, lazy_commands=SUBCOMMANDS, context_settings=CONTEXT_SETTINGS)
 @click.version_option(__version__)
 def cli_main():
     """A ROS-agnostic toolbox for common rosbag operations"""
     pass
 
 
-cli_main.add_command(clip)
-cli_main.add_command(split)
-cli_main.add_command(compute_duration)
-cli_main.add_command(export_odometry)
-cli_main.add_command(topic_compare)
-cli_main.add_command(topic_remove)
-
-
 if __name__ == "__main__":
     cli_main()
@@ -1,16 +1,31 @@
 from __future__ import annotations
 
 import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any, Dict, NamedTuple
 
 from rosbags.rosbag1 import Reader as Reader1
 from rosbags.rosbag1 import Writer as Writer1
 from rosbags.rosbag2 import Reader as Reader2
 from rosbags.rosbag2 import Writer as Writer2
 
+from rosbag_tools.mcap import McapReader, McapWriter
+from rosbag_tools.progress import is_quiet, set_quiet
+from rosbag_tools.session import BagSession
+from rosbag_tools.utils import (
+    custom_message_paths,
+    register_custom_messages,
+    rosbags_internals_supported,
+)
+from rosbag_tools.writers import add_writer_connections, output_writer_class
+
 if TYPE_CHECKING:
-    from typing import Tuple, Type
+    from typing import Callable, List, Optional, Sequence, Tuple, Type
+
+    from rosbags.interfaces import Connection
+
+    from rosbag_tools.conversion import MessageConverter
 
 
 class ROSBagTool:
@@ -27,6 +42,8 @@ class ROSBagTool:
         self._intopics: Tuple[str] = None
         self._is_ros1_reader: bool = None
         self._is_ros1_writer: bool = None
+        self._converter: Optional[MessageConverter] = None
+        self._session: BagSession = None
         self.inbag = Path(path)
 
     @property
@@ -40,32 +57,94 @@ class ROSBagTool:
         vpath = Path(value)
         if vpath.is_file() or vpath.is_dir():
             self._inbag = vpath
-            Reader = self.get_reader_class(self._inbag)
-            with Reader(self._inbag) as inbag:
-                self._intopics = tuple(inbag.topics.keys())
+            self.get_reader_class(self._inbag)
+            if self._session is not None:
+                self._session.close()
+            self._session = BagSession(self._inbag)
+            self._intopics = self._session.topics
         else:
             raise ValueError(f"{value} is not an existing file")
 
+    @property
+    def session(self) -> BagSession:
+        """Session of the input rosbag, shared by the operations of the tool"""
+        return self._session
+
     @property
     def topics(self):
         """The topics property."""
         return self._intopics
 
-    def get_reader_class(self, filename: Path | str) -> Type[Reader1 | Reader2]:
+    def close(self) -> None:
+        """Close the input rosbag"""
+        self._session.close()
+
+    def __enter__(self) -> ROSBagTool:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.close()
+        return False
+
+    def get_reader_class(
+        self, filename: Path | str
+    ) -> Type[Reader1 | Reader2 | McapReader]:
         """Return the reader class that corresponds to the filename
         Needs the filename of the rosbag to read from
         """
-        is_ros1 = Path(filename).suffix == ".bag"
+        path = Path(filename)
+        is_ros1 = path.suffix == ".bag"
         self._is_ros1_reader = is_ros1
+        if path.suffix == ".mcap" and not path.is_dir():
+            return McapReader
         return Reader1 if is_ros1 else Reader2
 
-    def get_writer_class(self, filename: Path | str) -> Type[Writer1 | Writer2]:
+    def get_writer_class(
+        self, filename: Path | str
+    ) -> Type[Writer1 | Writer2 | McapWriter]:
         """Return the writer class that corresponds to the filename
         Needs the filename of the rosbag to write in
         """
-        is_ros1 = Path(filename).suffix == ".bag"
-        self._is_ros1_writer = is_ros1
-        return Writer1 if is_ros1 else Writer2
+        Writer = output_writer_class(filename)
+        self._is_ros1_writer = issubclass(Writer, Writer1)
+        return Writer
+
+    def _add_writer_connections(
+        self, writer: Writer1 | Writer2 | McapWriter, connections: Sequence[Connection]
+    ) -> dict:
+        """Add connections of the input rosbag to an open writer, see `add_writer_connections`
+
+        Connections are converted when the input and the output are of different ROS versions.
+
+        Args:
+            writer: Open writer of the output rosbag
+            connections: Connections of the input rosbag to add
+
+        Returns:
+            dict: Connection map, from the ids of the input connections to the output connections
+        """
+        return add_writer_connections(
+            writer, connections, self._is_ros1_writer, self._converter
+        )
+
+    def _copies_chunks(self, chunk_copy: bool) -> bool:
+        """Are the ROS 1 chunks of the input rosbag copied verbatim in the output ?
+
+        Chunks are copied between ROS 1 rosbags, with the version of rosbags whose
+        internals are used by `ChunkCopier`.
+
+        Args:
+            chunk_copy: Is the chunk copy requested ?
+
+        Returns:
+            bool: If True, the chunks that stay unchanged are copied verbatim
+        """
+        return (
+            chunk_copy
+            and self._is_ros1_reader
+            and self._converter is None
+            and rosbags_internals_supported()
+        )
 
     def _delete_rosbag(self, path: Path | str) -> None:
         """Function to delete a rosbag at path `path`, to use with caution
@@ -75,7 +154,7 @@ class ROSBagTool:
         """
         is_ros1 = self.is_ros1bag(path)
         is_ros2 = self.is_ros2bag(path)
-        if is_ros1:
+        if is_ros1 or self.is_mcap(path):
             path.unlink()
         elif is_ros2:
             shutil.rmtree(path)
@@ -159,11 +238,172 @@ class ROSBagTool:
             )
         is_deletable: bool = export_path.exists() and force_out
         if is_deletable:
-            if self.is_ros1bag(export_path) or self.is_ros2bag(export_path):
+            if (
+                self.is_ros1bag(export_path)
+                or self.is_ros2bag(export_path)
+                or self.is_mcap(export_path)
+            ):
                 self._delete_rosbag(export_path)
             else:
                 self._delete_file(export_path)
 
 
+def _init_worker(quiet: bool, msg_paths: Sequence[Path]) -> None:
+    """Apply the settings of the main process in a worker process of `DatasetTool.run`"""
+    set_quiet(quiet)
+    if msg_paths:
+        register_custom_messages(msg_paths)
+
+
+class DatasetReport(NamedTuple):
+    """Results and failures of an operation applied on every rosbag of a dataset"""
+
+    results: Dict[Path, Any]
+    errors: Dict[Path, str]
+
+    def summary(self) -> str:
+        """Human-readable summary of the report
+
+        Returns:
+            str: Number of processed and failed rosbags, followed by the error of each failed rosbag
+        """
+        lines = [
+            f"{len(self.results)} rosbags processed, {len(self.errors)} rosbags failed"
+        ]
+        lines.extend(f"  {path} : {error}" for path, error in self.errors.items())
+        return "\n".join(lines)
+
+
 class DatasetTool:
-    pass
+    """DatasetTool - Base class for a tool that applies an operation on every rosbag of a dataset"""
+
+    def __init__(self, path: Path | str, name: str) -> None:
+        """Create a DatasetTool instance
+
+        Args:
+            path: Path to a dataset directory that contains rosbags
+            name: Tool name
+        """
+        self._tool_name: str = name
+        self.folder = Path(path)
+
+    @property
+    def folder(self) -> Path:
+        """The folder property."""
+        return self._folder
+
+    @folder.setter
+    def folder(self, value: Path | str):
+        """Setter for `folder`"""
+        if Path(value).is_dir():
+            self._folder = Path(value)
+        else:
+            raise ValueError(f"{value} is not a valid directory")
+
+    @staticmethod
+    def is_dataset(path: Path | str) -> bool:
+        """Is `path` a dataset directory, rather than a single rosbag ?
+
+        Args:
+            path (Path | str): Path to check
+
+        Returns:
+            bool: If True, `path` is a directory that is not a ROS 2 rosbag.
+        """
+        path = Path(path)
+        return path.is_dir() and not (path / "metadata.yaml").is_file()
+
+    @staticmethod
+    def find_rosbags(root: Path | str, exclude: Sequence[Path] = ()) -> List[Path]:
+        """Find the rosbags under a directory
+
+        ROS 1 rosbags (.bag files), ROS 2 rosbags (directories with a metadata.yaml file)
+        and MCAP files are found. The content of ROS 2 rosbag directories is not searched.
+
+        Args:
+            root (Path | str): Directory to search
+            exclude (Sequence[Path]): Directories that are not searched, such as output directories. Defaults to ().
+
+        Returns:
+            List[Path]: Sorted rosbag paths
+        """
+        excluded = {Path(p).resolve() for p in exclude}
+        rosbags = []
+        dirs = [Path(root)]
+        while dirs:
+            directory = dirs.pop()
+            for path in directory.iterdir():
+                if path.resolve() in excluded:
+                    continue
+                if path.is_dir():
+                    if (path / "metadata.yaml").is_file():
+                        rosbags.append(path)
+                    else:
+                        dirs.append(path)
+                elif path.suffix in (".bag", ".mcap"):
+                    rosbags.append(path)
+        return sorted(rosbags)
+
+    def output_path(self, inbag: Path, outdir: Path | str) -> Path:
+        """Output path of a rosbag of the dataset, at the same relative location in `outdir`
+
+        Args:
+            inbag (Path): Input rosbag of the dataset
+            outdir (Path | str): Output directory
+
+        Returns:
+            Path: Output path, whose parent directory exists
+        """
+        outpath = Path(outdir) / inbag.relative_to(self._folder)
+        outpath.parent.mkdir(parents=True, exist_ok=True)
+        return outpath
+
+    def run(
+        self,
+        func: Callable[..., Any],
+        tasks: Dict[Path, Tuple],
+        jobs: int = 1,
+    ) -> DatasetReport:
+        """Apply an operation on rosbags of the dataset, with `jobs` worker processes
+
+        A rosbag that fails does not stop the other ones : its error is reported.
+
+        Args:
+            func (Callable[..., Any]): Operation to apply. Should be a module-level function, to be sent to worker processes.
+            tasks (Dict[Path, Tuple]): Arguments of `func` for each rosbag
+            jobs (int): Number of worker processes. If 1, rosbags are processed in the current process. Defaults to 1.
+
+        Returns:
+            DatasetReport: Result or error of each rosbag, in the order of `tasks`
+        """
+        results, errors = {}, {}
+        print(
+            f"[{self._tool_name}] Processing {len(tasks)} rosbags in {self._folder.resolve().name}"
+        )
+        if jobs <= 1:
+            for path, args in tasks.items():
+                try:
+                    results[path] = func(*args)
+                except Exception as err:  # pylint: disable=broad-except
+                    errors[path] = f"{type(err).__name__}: {err}"
+        else:
+            # Worker processes follow the --quiet setting of the current process, and
+            # know its custom message types : they are not inherited without fork
+            with ProcessPoolExecutor(
+                max_workers=jobs,
+                initializer=_init_worker,
+                initargs=(is_quiet(), custom_message_paths()),
+            ) as executor:
+                futures = {
+                    executor.submit(func, *args): path for path, args in tasks.items()
+                }
+                for future in as_completed(futures):
+                    path = futures[future]
+                    try:
+                        results[path] = future.result()
+                    except Exception as err:  # pylint: disable=broad-except
+                        errors[path] = f"{type(err).__name__}: {err}"
+        return DatasetReport(
+            {p: results[p] for p in tasks if p in results},
+            {p: errors[p] for p in tasks if p in errors},
+        )
@@ -0,0 +1,221 @@
+"""Persistent cache of rosbag summaries for dataset-level tools
+
+The summary of every scanned rosbag is stored in a sqlite file at the root of the
+dataset, keyed by the path, size and modification time of the rosbag. Later scans
+only read the rosbags that are new or that changed since they were cached.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+import warnings
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from rosbag_tools.metadata import BagSummary, read_summary
+from rosbag_tools.utils import map_rosbags
+
+if TYPE_CHECKING:
+    from typing import Dict, Optional, Sequence, Tuple
+
+
+class ScanCache:
+    """ScanCache - sqlite cache of rosbag summaries, with least recently used eviction"""
+
+    FILENAME = ".rosbag_tools_cache.db"
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS summaries(
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            start_time INTEGER NOT NULL,
+            end_time INTEGER NOT NULL,
+            message_count INTEGER NOT NULL,
+            topics TEXT NOT NULL,
+            last_used REAL NOT NULL
+        )
+    """
+
+    def __init__(self, folder: Path | str, max_entries: int = 10000) -> None:
+        """Open the cache of a dataset, creating it if needed
+
+        Args:
+            folder: Path to the dataset directory, where the cache file is stored
+            max_entries: Maximum number of cached rosbags. Defaults to 10000.
+        """
+        if max_entries < 1:
+            raise ValueError(
+                f"The cache should hold at least one entry [got {max_entries}]"
+            )
+        self._folder = Path(folder)
+        self._max_entries = max_entries
+        self._conn = sqlite3.connect(self._folder / self.FILENAME)
+        self._conn.execute(self.SCHEMA)
+
+    @property
+    def path(self) -> Path:
+        """Path of the cache file"""
+        return self._folder / self.FILENAME
+
+    @staticmethod
+    def signature(path: Path) -> Tuple[int, int]:
+        """Size and modification time of a rosbag
+
+        For ROS 2 rosbags, the files of the rosbag directory are taken into account.
+
+        Args:
+            path: Path of a ROS 1 rosbag file or of a ROS 2 rosbag directory
+
+        Returns:
+            Tuple[int, int]: Size (bytes) and latest modification time (ns)
+        """
+        files = [p for p in path.iterdir() if p.is_file()] if path.is_dir() else [path]
+        stats = [p.stat() for p in files]
+        size = sum(s.st_size for s in stats)
+        mtime_ns = max((s.st_mtime_ns for s in stats), default=0)
+        return size, mtime_ns
+
+    def _key(self, path: Path) -> str:
+        """Cache key of a rosbag : its path relative to the dataset directory"""
+        path = Path(path).resolve()
+        try:
+            return path.relative_to(self._folder.resolve()).as_posix()
+        except ValueError:
+            return path.as_posix()
+
+    def get(self, path: Path) -> Optional[BagSummary]:
+        """Get the cached summary of a rosbag
+
+        Args:
+            path: Path of the rosbag
+
+        Returns:
+            Optional[BagSummary]: Cached summary, or None if the rosbag is not cached or changed since
+        """
+        row = self._conn.execute(
+            "SELECT size, mtime_ns, start_time, end_time, message_count, topics "
+            "FROM summaries WHERE path = ?",
+            (self._key(path),),
+        ).fetchone()
+        if row is None:
+            return None
+        size, mtime_ns, start_time, end_time, message_count, topics = row
+        if (size, mtime_ns) != self.signature(path):
+            return None
+        topics = json.loads(topics)
+        return BagSummary(
+            path,
+            start_time,
+            end_time,
+            message_count,
+            {topic: msgtype for topic, msgtype, _ in topics},
+            {topic: count for topic, _, count in topics},
+        )
+
+    def put(self, summary: BagSummary) -> None:
+        """Cache the summary of a rosbag, replacing any previous entry
+
+        Args:
+            summary: Summary of the rosbag
+        """
+        size, mtime_ns = self.signature(summary.path)
+        topics = [
+            [topic, msgtype, summary.topic_counts[topic]]
+            for topic, msgtype in summary.msgtypes.items()
+        ]
+        self._conn.execute(
+            "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                self._key(summary.path),
+                size,
+                mtime_ns,
+                summary.start_time,
+                summary.end_time,
+                summary.message_count,
+                json.dumps(topics),
+                time.time(),
+            ),
+        )
+
+    def touch(self, paths: Sequence[Path]) -> None:
+        """Mark cached rosbags as used now, to keep them from eviction"""
+        now = time.time()
+        self._conn.executemany(
+            "UPDATE summaries SET last_used = ? WHERE path = ?",
+            [(now, self._key(p)) for p in paths],
+        )
+
+    def invalidate(self, path: Optional[Path] = None) -> None:
+        """Remove a rosbag from the cache
+
+        Args:
+            path: Path of the rosbag. If None, the whole cache is cleared. Defaults to None.
+        """
+        if path is None:
+            self._conn.execute("DELETE FROM summaries")
+        else:
+            self._conn.execute("DELETE FROM summaries WHERE path = ?", (self._key(path),))
+
+    def evict(self) -> None:
+        """Remove the least recently used entries above the maximum number of entries"""
+        self._conn.execute(
+            "DELETE FROM summaries WHERE path NOT IN "
+            "(SELECT path FROM summaries ORDER BY last_used DESC LIMIT ?)",
+            (self._max_entries,),
+        )
+
+    def close(self) -> None:
+        """Evict extra entries, save the cache and close it"""
+        self.evict()
+        self._conn.commit()
+        self._conn.close()
+
+    def __enter__(self) -> ScanCache:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.close()
+        return False
+
+
+def scan_rosbags(
+    folder: Path | str,
+    paths: Sequence[Path],
+    jobs: int = 1,
+    use_cache: bool = True,
+) -> Tuple[Dict[Path, BagSummary], Dict[Path, str]]:
+    """Read the summaries of the rosbags of a dataset, using the dataset cache
+
+    Only rosbags that are not cached, or that changed since they were cached, are read.
+    If the cache cannot be opened (e.g. read-only dataset), every rosbag is read.
+
+    Args:
+        folder: Path to the dataset directory
+        paths: Rosbag paths
+        jobs: Number of rosbags that are read concurrently. Defaults to 1.
+        use_cache: If False, read every rosbag and leave the cache untouched. Defaults to True.
+
+    Returns:
+        Tuple[Dict[Path, BagSummary], Dict[Path, str]]: Summaries and errors of each rosbag, in the order of `paths`
+    """
+    cache = None
+    if use_cache:
+        try:
+            cache = ScanCache(folder)
+        except sqlite3.Error as err:
+            warnings.warn(f"Scan cache is disabled : {err}", RuntimeWarning)
+    if cache is None:
+        return map_rosbags(read_summary, paths, jobs=jobs)
+
+    with cache:
+        cached = {p: cache.get(p) for p in paths}
+        missing = [p for p, summary in cached.items() if summary is None]
+        results, errors = map_rosbags(read_summary, missing, jobs=jobs)
+        cache.touch([p for p, summary in cached.items() if summary is not None])
+        for summary in results.values():
+            cache.put(summary)
+
+    summaries = {p: cached[p] or results[p] for p in paths if p not in errors}
+    return summaries, errors
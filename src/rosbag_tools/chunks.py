@@ -0,0 +1,339 @@
+"""Chunk-level copy of ROS 1 rosbags
+
+A ROS 1 rosbag stores its messages in compressed chunks. When every message of a
+chunk ends up unchanged in an output rosbag, the compressed bytes of the chunk can
+be copied as is, instead of being decompressed, re-chunked and compressed again.
+Only the index records of the copied chunk are rebuilt.
+
+Chunks can also be read ahead in a background thread (`ChunkCopier.read_chunks`) :
+the reader thread reads the compressed bytes of the chunks that are copied, and
+decompresses the chunks whose messages are needed, while the main thread writes.
+"""
+
+from __future__ import annotations
+
+import heapq
+from collections import defaultdict
+from io import BytesIO
+from typing import TYPE_CHECKING, NamedTuple
+
+from rosbags.rosbag1.reader import Header, RecordType, read_bytes, read_uint32
+from rosbags.rosbag1.writer import Header as WriteHeader
+from rosbags.rosbag1.writer import WriteChunk, serialize_time, serialize_uint32
+
+from rosbag_tools.prefetch import DEFAULT_MAX_BYTES, read_ahead
+from rosbag_tools.profiling import profile_messages, profile_stage, profile_write
+from rosbag_tools.reading import read_chunk_entry, read_rosbag1_entries, slice_index
+from rosbag_tools.writers import flush_chunks
+
+if TYPE_CHECKING:
+    from typing import (
+        Callable,
+        Dict,
+        Iterable,
+        Iterator,
+        List,
+        Optional,
+        Tuple,
+    )
+
+    from rosbags.interfaces import Connection
+    from rosbags.rosbag1 import Reader as Reader1
+    from rosbags.rosbag1 import Writer as Writer1
+    from rosbags.rosbag1.reader import IndexData
+
+
+class ChunkEntries(NamedTuple):
+    """Messages of a ROS 1 chunk that are read"""
+
+    pos: int
+    start_time: int
+    end_time: int
+    entries: Dict[int, List[IndexData]]
+    complete: bool
+
+    @property
+    def message_count(self) -> int:
+        """Number of messages read in the chunk"""
+        return sum(len(items) for items in self.entries.values())
+
+
+class ChunkRecord(NamedTuple):
+    """Compressed data of a ROS 1 chunk, as stored in the rosbag"""
+
+    compression: str
+    size: int
+    data: bytes
+
+
+class ReadChunk(NamedTuple):
+    """Chunk that was read ahead, with its compressed data or its messages"""
+
+    chunk: ChunkEntries
+    record: Optional[ChunkRecord] = None
+    messages: Optional[List[Tuple[Connection, int, bytes]]] = None
+
+
+class ChunkCopier:
+    """ChunkCopier - Walk through the chunks of a ROS 1 rosbag and copy them verbatim when possible"""
+
+    def __init__(
+        self,
+        reader: Reader1,
+        connections: Iterable[Connection] = (),
+        start: Optional[int] = None,
+        stop: Optional[int] = None,
+        compression: Optional[str] = None,
+    ) -> None:
+        """Create a ChunkCopier instance
+
+        Args:
+            reader: Open ROS 1 rosbag reader
+            connections: Connections to read. An empty iterable reads all connections.
+            start: Read only messages at or after this timestamp (ns). Defaults to None.
+            stop: Read only messages before this timestamp (ns). Defaults to None.
+            compression: Compression of the output rosbag ('none', 'lz4' or 'bz2'). Chunks stored with another compression are not copied verbatim. Defaults to None, chunks are copied whatever their compression.
+        """
+        self._reader = reader
+        self._compression = compression
+        connections = list(connections) or reader.connections
+
+        # Index entries of the messages to read, grouped by chunk
+        by_chunk: Dict[int, Dict[int, List[IndexData]]] = defaultdict(dict)
+        for conn in connections:
+            for entry in slice_index(reader.indexes[conn.id], start, stop):
+                by_chunk[entry.chunk_pos].setdefault(conn.id, []).append(entry)
+
+        counts = {
+            info.pos: sum(info.connection_counts.values()) for info in reader.chunk_infos
+        }
+        self._chunks: List[ChunkEntries] = []
+        for pos, entries in sorted(by_chunk.items()):
+            times = [item.time for items in entries.values() for item in items]
+            chunk = ChunkEntries(pos, min(times), max(times), entries, False)
+            self._chunks.append(
+                chunk._replace(complete=chunk.message_count == counts[pos])
+            )
+
+    @property
+    def chunks(self) -> Tuple[ChunkEntries]:
+        """Chunks to read, sorted by position in the rosbag"""
+        return tuple(self._chunks)
+
+    @property
+    def message_count(self) -> int:
+        """Number of messages to read"""
+        return sum(chunk.message_count for chunk in self._chunks)
+
+    def chunk_size(self, chunk: ChunkEntries) -> int:
+        """Size in bytes of the compressed data of a chunk"""
+        return self._reader.chunks[chunk.pos].datasize
+
+    @staticmethod
+    def can_copy(chunk: ChunkEntries, conn_map: dict) -> bool:
+        """Can `chunk` be copied verbatim in a writer with connection map `conn_map` ?
+
+        Every message of the chunk has to be read, and its connection has to keep the
+        same id in the output rosbag, since the message records of the chunk refer to it.
+
+        Args:
+            chunk: Chunk to copy
+            conn_map: Connection map from reader connection ids to writer connections
+
+        Returns:
+            bool: If True, the chunk can be copied verbatim
+        """
+        return chunk.complete and all(
+            cid in conn_map and conn_map[cid].id == cid for cid in chunk.entries
+        )
+
+    def messages(
+        self, chunk: ChunkEntries, read: Optional[ReadChunk] = None
+    ) -> Iterable[Tuple[Connection, int, bytes]]:
+        """Read the messages of a chunk
+
+        Args:
+            chunk: Chunk to read
+            read: Chunk read ahead by `read_chunks`. If None, the chunk is read from the rosbag. Defaults to None.
+
+        Returns:
+            Iterable[Tuple[Connection, int, bytes]]: connection, timestamp (ns) and raw data of each message
+        """
+        if read is None or (read.record is None and read.messages is None):
+            messages = read_rosbag1_entries(self._reader, chunk.entries.values())
+            return profile_messages("read", messages)
+        if read.messages is None:
+            return self.record_messages(chunk, read.record)
+        return read.messages
+
+    def keeps(self, record: ChunkRecord) -> bool:
+        """Can a chunk stored as `record` keep its compression in the output rosbag ?"""
+        return self._compression is None or record.compression == self._compression
+
+    def read_record(self, chunk: ChunkEntries) -> ChunkRecord:
+        """Read the compressed data of a chunk
+
+        Args:
+            chunk: Chunk to read
+
+        Returns:
+            ChunkRecord: Compression, uncompressed size and compressed data of the chunk
+        """
+        with profile_stage("chunk-read", nbytes=self.chunk_size(chunk)):
+            bio = self._reader.bio
+            bio.seek(chunk.pos)
+            header = Header.read(bio, RecordType.CHUNK)
+            compression = header.get_string("compression")
+            size = header.get_uint32("size")
+            data = read_bytes(bio, read_uint32(bio))
+        return ChunkRecord(compression, size, data)
+
+    def record_messages(
+        self, chunk: ChunkEntries, record: ChunkRecord
+    ) -> List[Tuple[Connection, int, bytes]]:
+        """Decompress the data of a chunk and read its messages
+
+        The rosbag is not accessed : this can run while another thread reads the rosbag.
+
+        Args:
+            chunk: Chunk to read
+            record: Compressed data of the chunk
+
+        Returns:
+            List[Tuple[Connection, int, bytes]]: connection, timestamp (ns) and raw data of each message
+        """
+        with profile_stage("decompress", nbytes=len(record.data)):
+            rawbytes = self._reader.chunks[chunk.pos].decompressor(record.data)
+        with profile_stage("read", chunk.message_count, record.size):
+            data = BytesIO(rawbytes)
+            connmap = {x.id: x for x in self._reader.connections}
+            return [
+                read_chunk_entry(data, entry, connmap)
+                for entry in heapq.merge(*chunk.entries.values())
+            ]
+
+    def read_chunks(
+        self,
+        decode: Callable[[ChunkEntries], bool],
+        depth: int = 0,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ) -> Iterator[ReadChunk]:
+        """Walk through the chunks, optionally reading them ahead in a background thread
+
+        With prefetching, the reader thread reads the compressed data of each chunk,
+        and decompresses the chunks whose messages are needed. While the chunks are
+        iterated, the rosbag reader should only be used through `write` and
+        `messages`, with the read chunks.
+
+        Args:
+            decode: Function that tells if the messages of a chunk are needed, i.e. if it is not copied verbatim
+            depth: Maximum number of messages read ahead. If 0, chunks are read when they are written. Defaults to 0.
+            max_bytes: Maximum size of the data read ahead, in bytes. Defaults to DEFAULT_MAX_BYTES.
+
+        Returns:
+            Iterator[ReadChunk]: Chunks, sorted by position in the rosbag
+        """
+        if not depth:
+            return (ReadChunk(chunk) for chunk in self._chunks)
+
+        def source():
+            for chunk in self._chunks:
+                record = self.read_record(chunk)
+                if decode(chunk) or not self.keeps(record):
+                    yield ReadChunk(chunk, messages=self.record_messages(chunk, record))
+                else:
+                    yield ReadChunk(chunk, record=record)
+
+        def weigh(read: ReadChunk) -> Tuple[int, int]:
+            if read.record is not None:
+                return read.chunk.message_count, len(read.record.data)
+            return read.chunk.message_count, sum(len(m[2]) for m in read.messages)
+
+        return read_ahead(source, depth, max_bytes, weigh)
+
+    def write(
+        self,
+        chunk: ChunkEntries,
+        writer: Writer1,
+        conn_map: dict,
+        read: Optional[ReadChunk] = None,
+    ) -> bool:
+        """Write the messages of a chunk in a writer, copying the chunk verbatim when possible
+
+        Messages from connections that are not in the connection map are ignored.
+
+        Args:
+            chunk: Chunk to write
+            writer: Open ROS 1 rosbag writer
+            conn_map: Connection map from reader connection ids to writer connections
+            read: Chunk read ahead by `read_chunks`. If None, the chunk is read from the rosbag. Defaults to None.
+
+        Returns:
+            bool: If True, the chunk was copied verbatim
+        """
+        if self.can_copy(chunk, conn_map) and (read is None or read.messages is None):
+            # Chunks read ahead to be copied come with their compressed data
+            record = None if read is None else read.record
+            if record is None:
+                record = self.read_record(chunk)
+            if self.keeps(record):
+                self.copy(chunk, writer, record)
+                return True
+            read = ReadChunk(chunk, record=record)
+        write = profile_write("write", writer.write)
+        for conn, timestamp, data in self.messages(chunk, read):
+            if conn.id in conn_map:
+                write(conn_map[conn.id], timestamp, data)
+        return False
+
+    def copy(
+        self, chunk: ChunkEntries, writer: Writer1, record: Optional[ChunkRecord] = None
+    ) -> None:
+        """Copy the compressed bytes of a chunk in a writer and write its index records
+
+        Args:
+            chunk: Chunk to copy. Should satisfy `can_copy`.
+            writer: Open ROS 1 rosbag writer
+            record: Compressed data of the chunk. If None, it is read from the rosbag. Defaults to None.
+        """
+        if record is None:
+            record = self.read_record(chunk)
+        with profile_stage("chunk-copy", chunk.message_count, len(record.data)):
+            self._copy(chunk, writer, record)
+
+    def _copy(self, chunk: ChunkEntries, writer: Writer1, record: ChunkRecord) -> None:
+        """Copy a chunk in a writer, without profiling"""
+        # Write the chunk in progress first, so that its content stays before the copy.
+        # A chunk that only holds connection records gets the start of the copied chunk
+        # as time range : the writer would give it a start time of 0 in its chunk info.
+        pending = writer.chunks[-1]
+        if not pending.connections:
+            pending.start, pending.end = chunk.start_time, chunk.start_time
+        flush_chunks(writer)
+
+        pos = writer.bio.tell()
+        chunk_header = WriteHeader()
+        chunk_header.set_string("compression", record.compression)
+        chunk_header.set_uint32("size", record.size)
+        chunk_header.write(writer.bio, RecordType.CHUNK)
+        writer.bio.write(serialize_uint32(len(record.data)))
+        writer.bio.write(record.data)
+
+        connections = {
+            cid: [(item.time, item.offset) for item in items]
+            for cid, items in chunk.entries.items()
+        }
+        for cid, items in connections.items():
+            index_header = WriteHeader()
+            index_header.set_uint32("ver", 1)
+            index_header.set_uint32("conn", cid)
+            index_header.set_uint32("count", len(items))
+            index_header.write(writer.bio, RecordType.IDXDATA)
+            writer.bio.write(serialize_uint32(len(items) * 12))
+            for time, offset in items:
+                writer.bio.write(serialize_time(time) + serialize_uint32(offset))
+
+        # Register the copied chunk before the chunk in progress,
+        # for its chunk info record to be written when the writer is closed
+        copied = WriteChunk(BytesIO(), pos, chunk.start_time, chunk.end_time, connections)
+        writer.chunks.insert(len(writer.chunks) - 1, copied)
@@ -1,9 +1,19 @@
 """Cut out a section of a long rosbag"""
 
-from .clipper import BagClipper
+from rosbag_tools.utils import lazy_getattr
+
 from .main import cli as clip
 
 __all__ = (
     "BagClipper",
+    "DatasetClipper",
     "clip",
 )
+
+__getattr__ = lazy_getattr(
+    __name__,
+    {
+        "BagClipper": ".clipper",
+        "DatasetClipper": ".clipper",
+    },
+)
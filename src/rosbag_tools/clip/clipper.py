@@ -2,89 +2,65 @@
 
 from __future__ import annotations
 
-import shutil
+import math
 import warnings
+from bisect import bisect_left, bisect_right
 from pathlib import Path
-from typing import TYPE_CHECKING, List, cast
-
-from rosbags.interfaces import Connection, ConnectionExtRosbag1, ConnectionExtRosbag2
-from rosbags.rosbag1 import Reader as Reader1
-from rosbags.rosbag1 import Writer as Writer1
-from rosbags.rosbag2 import Reader as Reader2
-from rosbags.rosbag2 import Writer as Writer2
-from tqdm import tqdm
+from typing import TYPE_CHECKING, Sequence
 
 from rosbag_tools import exceptions
+from rosbag_tools.base import DatasetReport, DatasetTool, ROSBagTool
+from rosbag_tools.chunks import ChunkCopier
+from rosbag_tools.conversion import session_converter
+from rosbag_tools.prefetch import prefetch_messages
+from rosbag_tools.profiling import profile_stage, profile_write
+from rosbag_tools.progress import Progress
+from rosbag_tools.reading import count_messages
+from rosbag_tools.writers import WriterOptions, WriterPool, writer_factory
 
 if TYPE_CHECKING:
-    from typing import Type
+    from typing import Optional, Tuple
 
 
-class BagClipper:
-    """Clipper: Cut a rosbag based on timestamps."""
+def clip_window(
+    bag_start: int,
+    bag_end: int,
+    start: float | None = None,
+    end: float | None = None,
+) -> Tuple[int, int]:
+    """Convert clip limits, relative to the beginning of a rosbag, to a window of absolute timestamps
 
-    def __init__(
-        self,
-        path: Path | str,
-    ) -> None:
-        self._bag_start: float = None
-        self._bag_end: float = None
-        self._bag_duration: float = None
-        self._is_ros1_reader: bool = None
-        self._is_ros1_writer: bool = None
-        self.inbag: Path = Path(path)
-
-    @property
-    def inbag(self) -> Path:
-        """Path to input rosbag"""
-        return self._inbag
-
-    @inbag.setter
-    def inbag(self, value: Path | str):
-        # Check that path exists
-        if not Path(value).exists():
-            raise FileNotFoundError(
-                f"File {value} is not an existing file. Please provide a path that exists in your file system"
-            )
-        self._inbag = Path(value)
-        Reader = self.get_reader_class(self._inbag)
-        with Reader(self._inbag) as bag:
-            self._bag_start = bag.start_time
-            self._bag_end = bag.end_time
-            self._bag_duration = bag.duration
+    Args:
+        bag_start (int): Timestamp (ns) of the first message of the rosbag
+        bag_end (int): Timestamp (ns) right after the last message of the rosbag
+        start (float, optional): Start of the clip, in seconds relative to the beginning of the bag. Defaults to None.
+        end (float, optional): End of the clip, in seconds relative to the beginning of the bag. Defaults to None.
 
-    def get_reader_class(self, filename: Path | str) -> Type[Reader1 | Reader2]:
-        """Return the reader class that corresponds to the filename
+    Returns:
+        Tuple[int, int]: ROS timestamps (ns) of the first message in the clip and right after the last message in the clip
+    """
+    if start is None:
+        s_cliptstamp = bag_start
+    else:
+        s_cliptstamp = bag_start + start * 10**9
 
-        Needs the filename of the rosbag to read from
-        """
-        is_ros1 = Path(filename).suffix == ".bag"
-        self._is_ros1_reader = is_ros1
-        return Reader1 if is_ros1 else Reader2
+    if end is None:
+        e_cliptstamp = bag_end
+    else:
+        e_cliptstamp = bag_start + end * 10**9
 
-    def get_writer_class(self, filename: Path | str) -> Type[Writer1 | Writer2]:
-        """Return the writer class that corresponds to the filename
+    # Messages in [s_cliptstamp, e_cliptstamp]
+    return math.ceil(s_cliptstamp), math.floor(e_cliptstamp) + 1
 
-        Needs the filename of the rosbag to write in
-        """
-        is_ros1 = Path(filename).suffix == ".bag"
-        self._is_ros1_writer = is_ros1
-        return Writer1 if is_ros1 else Writer2
 
-    def _delete_rosbag(self, path: Path | str):
-        """Function to delete a rosbag at path `path`, to use with caution
+class BagClipper(ROSBagTool):
+    """Clipper: Cut a rosbag based on timestamps."""
 
-        Args:
-            path: Path to rosbag to delete.
-        """
-        is_ros1 = path.is_file() and path.suffix == ".bag"
-        is_ros2 = path.is_dir() and len(tuple(path.glob("*.db3"))) > 0
-        if is_ros1:
-            path.unlink()
-        elif is_ros2:
-            shutil.rmtree(path)
-        else:
-            raise ValueError(f"Path {path} is not a valid rosbag")
+    def __init__(
+        self,
+        path: Path | str,
+    ) -> None:
+        super().__init__(path, "clip")
 
     def _check_cutoff_limits(
         self,
@@ -106,15 +82,15 @@ class BagClipper:
         elimit = end is not None
         start_ns = start * 10**9 if slimit else start
         end_ns = end * 10**9 if elimit else end
-        if slimit and start_ns < 0 and start_ns > self._bag_duration:
+        if slimit and start_ns < 0 and start_ns > self._session.duration:
             raise exceptions.InvalidTimestampError(
                 f"Start time ({start} s) is not in the bag. "
-                f"Start time should be defined between 0 and {self._bag_duration} s."
+                f"Start time should be defined between 0 and {self._session.duration} s."
             )
-        if elimit and end_ns < 0 and end_ns > self._bag_duration:
+        if elimit and end_ns < 0 and end_ns > self._session.duration:
             raise exceptions.InvalidTimestampError(
                 f"End time ({end} s) is not in the bag. "
-                f"End time should be defined between 0 and {self._bag_duration} s."
+                f"End time should be defined between 0 and {self._session.duration} s."
             )
         if slimit and elimit and end < start:
             raise exceptions.InvalidTimestampError(
@@ -125,63 +101,27 @@ class BagClipper:
         """Check export path
         Avoids overwriting when not requested
         """
-        if export_path == self._inbag:
-            raise FileExistsError(
-                f"Cannot use same file as input and output [{export_path.name}]"
-            )
-        if export_path.exists() and not force_out:
-            raise FileExistsError(
-                f"Path {export_path.name} already exists. "
-                "Use 'force_out=True' or 'rosbag-tools clip -f' to "
-                f"export to {export_path.name} even if output bag already exists."
-            )
-        if export_path.exists() and force_out:
+        if export_path != self._inbag and export_path.exists() and force_out:
             warnings.warn(
                 f"Output path {export_path.name} already exists, output overwriting flag has been set, deleting old output file"
             )
-            self._delete_rosbag(export_path)
+        super()._check_export_path(export_path, force_out)
 
-    def _set_writer_connections(
+    def _clip_window(
         self,
-        writer: Writer1 | Writer2,
-        connections: List[Connection],
-    ) -> dict:
-        """Generate connection map from Reader connections and a Writer instance
+        start: float | None = None,
+        end: float | None = None,
+    ) -> Tuple[int, int]:
+        """Convert clip limits to a window of absolute timestamps
 
         Args:
-            writer (Writer1 | Writer2): Writer Instance
-            connections (List[Connection]): List of connections from Reader
+            start (float, optional): Start of the clip, in seconds relative to the beginning of the bag. Defaults to None.
+            end (float, optional): End of the clip, in seconds relative to the beginning of the bag. Defaults to None.
 
         Returns:
-            dict: Connection Map dictionary
+            Tuple[int, int]: ROS timestamps (ns) of the first message in the clip and right after the last message in the clip
         """
-        conn_map = {}
-        ConnectionExt = (
-            ConnectionExtRosbag1 if self._is_ros1_writer else ConnectionExtRosbag2
-        )
-        for conn in connections:
-            if conn.topic == "/events/write_split":
-                continue
-            ext = cast(ConnectionExt, conn.ext)
-            if self._is_ros1_writer:
-                # ROS 1
-                conn_map[conn.id] = writer.add_connection(
-                    conn.topic,
-                    conn.msgtype,
-                    conn.msgdef,
-                    conn.md5sum,
-                    ext.callerid,
-                    ext.latching,
-                )
-            else:
-                # ROS 2
-                conn_map[conn.id] = writer.add_connection(
-                    conn.topic,
-                    conn.msgtype,
-                    serialization_format=ext.serialization_format,
-                    offered_qos_profiles=ext.offered_qos_profiles,
-                )
-        return conn_map
+        return clip_window(self._session.start_time, self._session.end_time, start, end)
 
     def clip_rosbag(
         self,
@@ -189,47 +129,244 @@ class BagClipper:
         end: float | None = None,
         outbag_path: Path | str = None,
         force_out: bool = False,
+        chunk_copy: bool = True,
+        prefetch: int = 0,
+        writer_options: Optional[WriterOptions] = None,
     ):
         """Clip rosbag between two elapsed times, given relative to the beginning of the rosbag
 
+        The input rosbag is read from its index : only the messages published
+        between `start` and `end` are read. For ROS 1 rosbags, chunks that are
+        entirely in the clip are copied without being decompressed.
+
         Args:
             start (float, optional): Start of the clip, in seconds relative to the beginning of the bag. Defaults to None. If None, the clip starts at the beginning of the rosbag.
             end (float, optional): End of the clip, in seconds relative to the beginning of the bag. Defaults to None. If None, the clip stops at the end of the rosbag.
             outbag_path (Path | str): Path of output bag.
             force_squash (bool); Force output bag overwriting, if outbag already exists. Defaults to False.
+            chunk_copy (bool): Copy ROS 1 chunks verbatim when possible. Defaults to True.
+            prefetch (int): Number of messages read ahead in a background thread, while the outputs are written. 0 reads in the main thread. Defaults to 0.
+            writer_options (WriterOptions, optional): Settings of the output rosbags : compression, chunk size and compression threads. Defaults to None, the writer defaults.
         """
         self._check_cutoff_limits(start, end)
+        start_ns, stop_ns = self._clip_window(start, end)
 
-        if start is None:
-            s_cliptstamp = self._bag_start
-        else:
-            s_cliptstamp = self._bag_start + start * 10**9
-
-        if end is None:
-            e_cliptstamp = self._bag_end
-        else:
-            e_cliptstamp = self._bag_start + end * 10**9
-
-        # Reader / Writer classes
-        Reader = self.get_reader_class(self._inbag)
+        # Writer class, the input rosbag is read from the session
         Writer = self.get_writer_class(outbag_path)
         export_path = Path(outbag_path)
         self._check_export_path(export_path, force_out)
-        if self._is_ros1_reader != self._is_ros1_writer:
-            raise NotImplementedError(
-                "Rosbag conversion (ROS 1->ROS 2 / ROS 2->ROS 1) is not supported. "
-                "Use `rosbags` to convert your rosbag before using `rosbag-tools clip`."
-            )
-        with Reader(self._inbag) as reader, Writer(export_path) as writer:
-            conn_map = self._set_writer_connections(
-                writer,
-                reader.connections,
-            )
+        self._converter = session_converter(self._session, self._is_ros1_writer)
+        Writer = writer_factory(Writer, writer_options)
+        reader = self._session.reader
+        written = [
+            conn for conn in reader.connections if conn.topic != "/events/write_split"
+        ]
+        with Writer(export_path) as writer:
+            with profile_stage("connections"):
+                conn_map = self._add_writer_connections(writer, written)
 
-            with tqdm(total=reader.message_count) as pbar:
-                for conn, timestamp, data in reader.messages():
-                    if s_cliptstamp <= timestamp <= e_cliptstamp:
-                        writer.write(conn_map[conn.id], timestamp, data)
-                    pbar.update(1)
+            if self._copies_chunks(chunk_copy):
+                copier = ChunkCopier(
+                    reader,
+                    start=start_ns,
+                    stop=stop_ns,
+                    compression=writer_options and writer_options.compression,
+                )
+                chunks = copier.read_chunks(
+                    lambda chunk: not copier.can_copy(chunk, conn_map), depth=prefetch
+                )
+                with Progress(total=copier.message_count) as progress:
+                    for read in chunks:
+                        chunk = read.chunk
+                        copier.write(chunk, writer, conn_map, read)
+                        progress.update(chunk.message_count, copier.chunk_size(chunk))
+            else:
+                msgcount = count_messages(reader, start=start_ns, stop=stop_ns)
+                messages = prefetch_messages(
+                    reader, windows=[(start_ns, stop_ns)], depth=prefetch
+                )
+                if self._converter is not None:
+                    messages = self._converter.convert_messages(messages, written)
+                write = profile_write("write", writer.write)
+                with Progress(total=msgcount) as progress:
+                    for conn, timestamp, data in messages:
+                        if conn.id in conn_map:
+                            write(conn_map[conn.id], timestamp, data)
+                        progress.update(1, len(data))
 
         print(f"[clip] Clipping done ! Exported in {outbag_path}")
+
+    def clip_rosbag_intervals(
+        self,
+        intervals: Sequence[Tuple[Optional[float], Optional[float]]],
+        outbag_path: Path | str = None,
+        merge: bool = False,
+        force_out: bool = False,
+        max_open_writers: int = 2,
+        prefetch: int = 0,
+        writer_options: Optional[WriterOptions] = None,
+    ):
+        """Clip several sections of the rosbag in a single pass
+
+        Each interval is a pair of elapsed times, given relative to the beginning of
+        the rosbag. The input rosbag is read once, from its index : only the messages
+        published in one of the intervals are read.
+
+        Args:
+            intervals (Sequence[Tuple[float, float]]): Start and end of each clip, in seconds relative to the beginning of the bag. A None start or end is the beginning or the end of the rosbag.
+            outbag_path (Path | str): Path of output bag. Without `merge`, clips are exported in `outbag_path_[1-N]`.
+            merge (bool): Export all the clips in a single output bag. Defaults to False.
+            force_out (bool); Force output bag overwriting, if outbag already exists. Defaults to False.
+            max_open_writers (int): Maximum number of output bags that are open at once. Defaults to 2. Raised to the largest number of overlapping clips, which are written at the same time.
+            prefetch (int): Number of messages read ahead in a background thread, while the outputs are written. 0 reads in the main thread. Defaults to 0.
+            writer_options (WriterOptions, optional): Settings of the output rosbags : compression, chunk size and compression threads. Defaults to None, the writer defaults.
+        """
+        if not intervals:
+            raise exceptions.InvalidTimestampError("No clip interval was provided.")
+        for start, end in intervals:
+            self._check_cutoff_limits(start, end)
+        windows = [self._clip_window(start, end) for start, end in intervals]
+
+        # Writer class, the input rosbag is read from the session
+        Writer = self.get_writer_class(outbag_path)
+        self._converter = session_converter(self._session, self._is_ros1_writer)
+        Writer = writer_factory(Writer, writer_options)
+
+        base_path = Path(outbag_path)
+        if merge:
+            export_paths = [base_path]
+            outputs = [0] * len(windows)
+        else:
+            export_paths = [
+                base_path.with_name(f"{base_path.stem}_{idx:02d}{base_path.suffix}")
+                for idx in range(1, len(windows) + 1)
+            ]
+            outputs = list(range(len(windows)))
+        for export_path in export_paths:
+            self._check_export_path(export_path, force_out)
+
+        # Sorted limits of all windows. Between two consecutive limits,
+        # messages go to the outputs of every window that covers the section.
+        limits = sorted({tstamp for window in windows for tstamp in window})
+        sections = [set() for _ in limits]
+        for (w_start, w_stop), out in zip(windows, outputs):
+            for idx in range(bisect_left(limits, w_start), bisect_left(limits, w_stop)):
+                sections[idx].add(out)
+        section_outputs = [tuple(sorted(section)) for section in sections]
+
+        # Overlapping clips are written at the same time : their writers stay open.
+        # An output is closed once its last window has ended.
+        max_open = max(max_open_writers, max(map(len, section_outputs)))
+        stops = [0] * len(export_paths)
+        for (_, w_stop), out in zip(windows, outputs):
+            stops[out] = max(stops[out], w_stop)
+
+        # Contiguous blocks of covered sections, read one after the other
+        blocks = []
+        for idx, section in enumerate(section_outputs):
+            if not section:
+                continue
+            if blocks and blocks[-1][1] == limits[idx]:
+                blocks[-1] = (blocks[-1][0], limits[idx + 1])
+            else:
+                blocks.append((limits[idx], limits[idx + 1]))
+
+        reader = self._session.reader
+        written = [
+            conn for conn in reader.connections if conn.topic != "/events/write_split"
+        ]
+        with WriterPool(
+            export_paths,
+            Writer,
+            written,
+            self._add_writer_connections,
+            max_open=max_open,
+            stops=stops,
+        ) as pool:
+            counts = [count_messages(reader, start=a, stop=b) for a, b in blocks]
+            msgcount = None if None in counts else sum(counts)
+            messages = prefetch_messages(reader, windows=blocks, depth=prefetch)
+            if self._converter is not None:
+                messages = self._converter.convert_messages(messages, written)
+            write = profile_write("write", pool.write)
+            with Progress(total=msgcount) as progress:
+                for conn, timestamp, data in messages:
+                    idx = bisect_right(limits, timestamp) - 1
+                    for out in section_outputs[idx]:
+                        write(out, conn, timestamp, data)
+                    progress.update(1, len(data))
+
+        print(f"[clip] Clipping done ! Exported {len(windows)} clips in {outbag_path}")
+
+
+def _clip_rosbag(
+    inbag: Path,
+    outbag: Path,
+    start: Optional[float],
+    end: Optional[float],
+    force_out: bool,
+    prefetch: int = 0,
+    writer_options: Optional[WriterOptions] = None,
+) -> Path:
+    """Clip a rosbag, as a dataset task"""
+    with BagClipper(inbag) as clipper:
+        clipper.clip_rosbag(
+            start=start,
+            end=end,
+            outbag_path=outbag,
+            force_out=force_out,
+            prefetch=prefetch,
+            writer_options=writer_options,
+        )
+    return outbag
+
+
+class DatasetClipper(DatasetTool):
+    """Dataset Clipper : Clip every rosbag of a dataset between the same elapsed times"""
+
+    def __init__(self, path: Path | str) -> None:
+        """Create a DatasetClipper instance
+
+        Args:
+            path: Path to a dataset directory that contains rosbags
+        """
+        super().__init__(path, "clip")
+
+    def clip(
+        self,
+        start: float | None = None,
+        end: float | None = None,
+        outdir: Path | str = None,
+        force_out: bool = False,
+        jobs: int = 1,
+        prefetch: int = 0,
+        writer_options: Optional[WriterOptions] = None,
+    ) -> DatasetReport:
+        """Clip every rosbag of the dataset between two elapsed times
+
+        Args:
+            start (float, optional): Start of the clips, in seconds relative to the beginning of each bag. Defaults to None.
+            end (float, optional): End of the clips, in seconds relative to the beginning of each bag. Defaults to None.
+            outdir (Path | str): Output directory. Clips keep the location of their rosbag relative to the dataset directory.
+            force_out (bool): Force output bag overwriting, if outbag already exists. Defaults to False.
+            jobs (int): Number of rosbags that are processed in parallel. Defaults to 1.
+            prefetch (int): Number of messages read ahead in a background thread, while the outputs are written. 0 reads in the main thread. Defaults to 0.
+            writer_options (WriterOptions, optional): Settings of the output rosbags : compression, chunk size and compression threads. Defaults to None, the writer defaults.
+
+        Returns:
+            DatasetReport: Output path or error of each rosbag
+        """
+        rosbags = self.find_rosbags(self.folder, exclude=[Path(outdir)])
+        tasks = {
+            bag: (
+                bag,
+                self.output_path(bag, outdir),
+                start,
+                end,
+                force_out,
+                prefetch,
+                writer_options,
+            )
+            for bag in rosbags
+        }
+        return self.run(_clip_rosbag, tasks, jobs=jobs)
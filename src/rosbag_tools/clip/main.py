@@ -2,8 +2,35 @@ from pathlib import Path
 
 import click
 
-from rosbag_tools.clip.clipper import BagClipper
-from rosbag_tools.utils import custom_message_path
+from rosbag_tools import exceptions
+from rosbag_tools.utils import (
+    check_writer_options,
+    compression_options,
+    custom_message_path,
+    print_dataset_report,
+    profile_option,
+    quiet_option,
+)
+
+
+def read_intervals_file(path: Path):
+    """Read clip intervals from a file, with the start and the end of a clip on each line"""
+    lines = [
+        line for line in path.read_text(encoding="utf-8").splitlines() if line.strip()
+    ]
+    if not lines:
+        raise exceptions.FileContentError(f"Intervals file '{path.resolve()}' is empty")
+    intervals = []
+    for line in lines:
+        values = line.replace(",", " ").split()
+        isContentNumeric = all(v.replace(".", "", 1).isdigit() for v in values)
+        if len(values) != 2 or not isContentNumeric:
+            raise exceptions.FileContentError(
+                f"Intervals file '{path.resolve()}' contains "
+                f"a line that cannot be interpreted as a clip interval : '{line}'"
+            )
+        intervals.append((float(values[0]), float(values[1])))
+    return intervals
 
 
 @click.command(
@@ -20,7 +47,7 @@ from rosbag_tools.utils import custom_message_path
     "--output",
     "--outbag",
     "outbag",
-    help="Clipped bag. Defaults to INBAG_clip",
+    help="Clipped bag, or output directory for a dataset. Defaults to INBAG_clip",
 )
 @click.option(
     "-s",
@@ -38,6 +65,52 @@ from rosbag_tools.utils import custom_message_path
     type=click.FLOAT,
     help="End of the clip, in elapsed seconds since the start of the rosbag",
 )
+@click.option(
+    "-i",
+    "--interval",
+    "intervals",
+    nargs=2,
+    type=click.FLOAT,
+    multiple=True,
+    help="Start and end of a clip, in elapsed seconds since the start of the rosbag. "
+    "Can be repeated to export several clips in a single pass.",
+)
+@click.option(
+    "--intervals-file",
+    "intervals_file",
+    type=click.Path(exists=True),
+    help="Path to a file containing clip intervals. "
+    "Each line contains the start and the end of a clip, in elapsed seconds since the start of the rosbag.",
+)
+@click.option(
+    "--merge",
+    help="Export all the clip intervals in a single output bag",
+    is_flag=True,
+)
+@click.option(
+    "--max-open-writers",
+    "max_open_writers",
+    default=2,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Maximum number of clip bag files that are open at once. "
+    "Overlapping clips are always open at the same time.",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Number of rosbags that are processed in parallel, when INBAG is a dataset directory",
+)
+@click.option(
+    "--prefetch",
+    default=0,
+    type=click.IntRange(min=0),
+    show_default=True,
+    help="Number of messages read ahead in a background thread, while the output is written. 0 disables prefetching.",
+)
 @click.option(
     "-f",
     "--force-overwriting",
@@ -45,21 +118,68 @@ from rosbag_tools.utils import custom_message_path
     help="Force output file overwriting",
     is_flag=True,
 )
+@compression_options
+@profile_option
+@quiet_option
 @custom_message_path
-def cli(inbag, outbag, force, start_time=None, end_time=None):
+def cli(
+    inbag,
+    outbag,
+    force,
+    merge,
+    max_open_writers,
+    jobs,
+    prefetch,
+    writer_options,
+    start_time=None,
+    end_time=None,
+    intervals=(),
+    intervals_file=None,
+):
     """Clip out a portion of INBAG
 
     INBAG is the path to a rosbag file
     Can be a bag in ROS 1 or in ROS 2
+
+    INBAG can also be a dataset directory : every rosbag of the dataset is clipped,
+    and clips are exported in the --output directory.
     """
-    clipper = BagClipper(inbag)
-    if outbag:
-        clipper.clip_rosbag(
+    # Tools are imported here, to keep the CLI startup fast
+    from rosbag_tools.base import DatasetTool
+    from rosbag_tools.clip.clipper import BagClipper, DatasetClipper
+
+    clip_intervals = list(intervals)
+    if intervals_file is not None:
+        clip_intervals.extend(read_intervals_file(Path(intervals_file)))
+    if clip_intervals and (start_time is not None or end_time is not None):
+        raise click.UsageError(
+            "Use either --start/--end or --interval/--intervals-file, not both."
+        )
+
+    if DatasetTool.is_dataset(inbag):
+        if clip_intervals:
+            raise click.UsageError(
+                "Clip intervals are not supported for a dataset directory, use --start/--end."
+            )
+        # Default output directory : /path/to/dataset => /path/to/dataset_clips
+        inpath = Path(inbag)
+        outdir = Path(outbag) if outbag else inpath.with_name(f"{inpath.name}_clips")
+        # Clips have the format of their rosbag
+        check_writer_options(writer_options, DatasetTool.find_rosbags(inpath))
+        report = DatasetClipper(inpath).clip(
             start=start_time,
             end=end_time,
-            outbag_path=outbag,
+            outdir=outdir,
             force_out=force,
+            jobs=jobs,
+            prefetch=prefetch,
+            writer_options=writer_options,
         )
+        print_dataset_report(report, "clip")
+        return
+
+    if outbag:
+        outpath = outbag
     else:
         inpath = Path(inbag)
         outdir_default = inpath.parent / "rosbags-clips"
@@ -67,7 +187,26 @@ def cli(inbag, outbag, force, start_time=None, end_time=None):
         n_clips = len(list(outdir_default.glob(f"{inpath.stem}*")))
         print(n_clips)
         out_fname = f"{inpath.stem}_clip_{n_clips:02d}{inpath.suffix}"
-        outpath_default = outdir_default / out_fname
-        clipper.clip_rosbag(
-            start=start_time, end=end_time, outbag_path=outpath_default, force_out=force
-        )
+        outpath = outdir_default / out_fname
+    check_writer_options(writer_options, [outpath])
+
+    with BagClipper(inbag) as clipper:
+        if clip_intervals:
+            clipper.clip_rosbag_intervals(
+                clip_intervals,
+                outbag_path=outpath,
+                merge=merge,
+                force_out=force,
+                max_open_writers=max_open_writers,
+                prefetch=prefetch,
+                writer_options=writer_options,
+            )
+        else:
+            clipper.clip_rosbag(
+                start=start_time,
+                end=end_time,
+                outbag_path=outpath,
+                force_out=force,
+                prefetch=prefetch,
+                writer_options=writer_options,
+            )
@@ -1,9 +1,17 @@
 """Compute the duration of every rosbag in a folder"""
 
-from .duration_calculator import DurationCalculator
+from rosbag_tools.utils import lazy_getattr
+
 from .main import cli as compute_duration
 
 __all__ = (
     "DurationCalculator",
     "compute_duration",
 )
+
+__getattr__ = lazy_getattr(
+    __name__,
+    {
+        "DurationCalculator": ".duration_calculator",
+    },
+)
@@ -9,9 +9,10 @@ from pathlib import Path
 from typing import TYPE_CHECKING
 
 import yaml
-from rosbags.rosbag1 import Reader as Reader1
-from rosbags.rosbag2 import Reader as Reader2
-from tqdm import tqdm
+
+from rosbag_tools.base import DatasetTool
+from rosbag_tools.cache import scan_rosbags
+from rosbag_tools.metadata import read_summary
 
 if TYPE_CHECKING:
     from typing import List, Optional
@@ -27,6 +28,7 @@ class DurationCalculator:
             path: Path to a dataset directory that contains rosbag files
         """
         self._folder = Path(path)
+        self.errors = {}
         self.TOTAL_KEY = "Total duration"
         self.durations = {}
 
@@ -90,11 +92,14 @@ class DurationCalculator:
         with open(yaml_path, "r", encoding="utf-8") as file:
             return cls.from_dict(yaml.safe_load(file))
 
-    def extract_data(self) -> None:
-        """Extract the durations of all the rosbags in the path self.folder"""
-        paths_ros1 = self.folder.glob("*.bag")
-        paths_ros2 = (p.parent for p in self.folder.glob("**/*.db3"))
-        paths = list(paths_ros1) + list(paths_ros2)
+    def extract_data(self, jobs: int = 1, use_cache: bool = True) -> None:
+        """Extract the durations of all the rosbags in the path self.folder
+
+        Args:
+            jobs: Number of rosbags that are opened concurrently. Defaults to 1.
+            use_cache: Reuse the summaries of unchanged rosbags from the dataset scan cache. Defaults to True.
+        """
+        paths = DatasetTool.find_rosbags(self.folder)
 
         if len(paths) == 0:
             # Empty list of paths
@@ -109,22 +114,21 @@ class DurationCalculator:
 
         # Create a dictionary with the durations for each bag file
         # {file1: duration1, ...}
-        durations = {}
         print(
             f"Extracting durations from {len(paths)} rosbags in {self.folder.resolve().name}"
         )
-        with tqdm(total=len(paths)) as pbar:
-            for bagfile in paths:
-                pbar.set_description(bagfile.stem)
-                durations[bagfile.stem] = self.get_duration(bagfile)
-                pbar.update(1)
+        summaries, errors = scan_rosbags(self.folder, paths, jobs, use_cache)
+        durations = {p.stem: summary.duration / 1e9 for p, summary in summaries.items()}
+        self.errors = {bagfile.stem: error for bagfile, error in errors.items()}
+        for stem, error in self.errors.items():
+            warnings.warn(f"Could not read rosbag {stem} : {error}", RuntimeWarning)
 
         self.durations = durations
         self._compute_total()
 
     @staticmethod
     def get_duration(filename: Path | str) -> float:
-        """Get the duration of a rosbag file
+        """Get the duration of a rosbag file, from its metadata only
 
         Args:
             filename: path of the rosbag file
@@ -132,10 +136,7 @@ class DurationCalculator:
         Returns:
             float: duration in the rosbag file
         """
-        ros1 = filename.suffix == ".bag"
-        Reader = Reader1 if ros1 else Reader2
-        with Reader(filename) as bag:
-            return (bag.duration) / 1e9
+        return read_summary(filename).duration / 1e9
 
     def _check_data_extraction(self, caller_name: str):
         """Assert that extract_data() was called"""
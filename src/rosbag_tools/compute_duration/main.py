@@ -3,8 +3,7 @@ from pathlib import Path
 
 import click
 
-from rosbag_tools.compute_duration.duration_calculator import DurationCalculator
-from rosbag_tools.utils import custom_message_path
+from rosbag_tools.utils import custom_message_path, quiet_option
 
 
 @click.command(
@@ -27,16 +26,33 @@ from rosbag_tools.utils import custom_message_path
     help="Total duration of all rosbags",
     is_flag=True,
 )
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Number of rosbags that are opened concurrently",
+)
+@click.option(
+    "--no-cache",
+    help="Read every rosbag, ignoring the scan cache of the dataset",
+    is_flag=True,
+)
+@quiet_option
 @custom_message_path
-def cli(bagfolder, metadata, total, *args):
+def cli(bagfolder, metadata, jobs, no_cache, total, *args):
     """Retrieve the duration of every rosbag in BAGFOLDER
 
     BAGFOLDER is the path to a dataset directory
     """
+    # Tools are imported here, to keep the CLI startup fast
+    from rosbag_tools.compute_duration.duration_calculator import DurationCalculator
+
     data_path = Path(bagfolder)
     is_total = total
     rosbag_duracomp = DurationCalculator(data_path)
-    rosbag_duracomp.extract_data()
+    rosbag_duracomp.extract_data(jobs=jobs, use_cache=not no_cache)
     if metadata is not None:
         rosbag_duracomp.export_metadata(metadata)
     if is_total:
@@ -0,0 +1,158 @@
+"""Conversion of messages between ROS 1 and ROS 2 rosbags, while they are written
+
+The tools write a ROS 1 rosbag from a ROS 2 rosbag (and the other way around) in
+the same pass as clipping, splitting or removing topics : there is no temporary
+converted copy of the input rosbag. Serialized messages are converted directly
+between the ROS 1 and CDR formats, without being deserialized, with one converter
+per message type. The output connections get the metadata of their rosbag
+version : message definition and MD5 sum for ROS 1, serialization format and QoS
+profiles for ROS 2.
+"""
+
+from __future__ import annotations
+
+from functools import partial
+from typing import TYPE_CHECKING, cast
+
+from rosbags.convert.converter import LATCH
+from rosbags.interfaces import ConnectionExtRosbag1, ConnectionExtRosbag2
+from rosbags.serde import cdr_to_ros1, ros1_to_cdr
+from rosbags.serde.messages import get_msgdef
+from rosbags.typesys import get_types_from_msg, register_types, types
+from rosbags.typesys.msg import generate_msgdef
+
+from rosbag_tools.profiling import profile_call
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+    from rosbags.interfaces import Connection
+    from rosbags.rosbag1 import Writer as Writer1
+    from rosbags.rosbag2 import Writer as Writer2
+
+    from rosbag_tools.session import BagSession
+
+    Message = Tuple[Connection, int, bytes]
+    Convert = Callable[[bytes], bytes]
+
+
+class MessageConverter:
+    """MessageConverter - Convert the connections and messages of a rosbag to the other ROS version"""
+
+    def __init__(self, typestore: Any, to_ros1: bool) -> None:
+        """Create a MessageConverter instance
+
+        Args:
+            typestore: Type store of the message types of the input rosbag
+            to_ros1: If True, convert ROS 2 messages to ROS 1. Otherwise, convert ROS 1 messages to ROS 2.
+        """
+        self.typestore = typestore
+        self.to_ros1 = to_ros1
+        self._converters: Dict[str, Convert] = {}
+
+    def add_connection(self, writer: Writer1 | Writer2, conn: Connection) -> Connection:
+        """Add the converted connection of an input connection to a writer
+
+        Input connections that only differ by metadata that does not exist in the
+        output rosbag version (e.g. ROS 1 caller ids) share the same output connection.
+
+        Args:
+            writer: Open writer of the output rosbag
+            conn: Connection of the input rosbag
+
+        Returns:
+            Connection: Connection of the output rosbag
+        """
+        if self.to_ros1:
+            ext = cast(ConnectionExtRosbag2, conn.ext)
+            msgdef, digest = generate_msgdef(conn.msgtype, self.typestore)
+            latching = int("durability: 1" in ext.offered_qos_profiles)
+            for wconn in writer.connections:
+                if (
+                    wconn.topic == conn.topic
+                    and wconn.digest == digest
+                    and wconn.ext.latching == latching
+                ):
+                    return wconn
+            return writer.add_connection(
+                conn.topic, conn.msgtype, msgdef, digest, None, latching
+            )
+
+        ext = cast(ConnectionExtRosbag1, conn.ext)
+        if conn.msgtype not in types.FIELDDEFS:
+            # The ROS 2 writer generates message definitions from the global type store
+            typs = get_types_from_msg(conn.msgdef, conn.msgtype)
+            register_types({k: v for k, v in typs.items() if k not in types.FIELDDEFS})
+        qos = LATCH if ext.latching else ""
+        for wconn in writer.connections:
+            if (
+                wconn.topic == conn.topic
+                and wconn.msgtype == conn.msgtype
+                and wconn.ext.offered_qos_profiles == qos
+            ):
+                return wconn
+        return writer.add_connection(
+            conn.topic,
+            conn.msgtype,
+            serialization_format="cdr",
+            offered_qos_profiles=qos,
+        )
+
+    def converter(self, msgtype: str) -> Convert:
+        """Function that converts serialized messages of type `msgtype`, cached by type
+
+        Args:
+            msgtype: Message type name
+
+        Returns:
+            Convert: Function from input to output serialized message data
+        """
+        convert = self._converters.get(msgtype)
+        if convert is None:
+            # Generated once per type : unknown types fail before any message is written
+            get_msgdef(msgtype, self.typestore)
+            func = cdr_to_ros1 if self.to_ros1 else ros1_to_cdr
+            convert = profile_call(
+                "convert", partial(func, typename=msgtype, typestore=self.typestore)
+            )
+            self._converters[msgtype] = convert
+        return convert
+
+    def convert_messages(
+        self, messages: Iterable[Message], connections: Iterable[Connection]
+    ) -> Iterator[Message]:
+        """Convert the messages of `connections` in a stream of messages
+
+        Messages of other connections, which are not written, are not converted.
+
+        Args:
+            messages: Messages of the input rosbag, as (connection, timestamp, data, ...) tuples
+            connections: Connections whose messages are written
+
+        Yields:
+            Message: Messages, with converted data
+        """
+        converters = {conn.id: self.converter(conn.msgtype) for conn in connections}
+        for message in messages:
+            convert = converters.get(message[0].id)
+            if convert is None:
+                yield message
+            else:
+                yield (message[0], message[1], convert(message[2]), *message[3:])
+
+
+def session_converter(
+    session: BagSession, is_ros1_writer: bool
+) -> Optional[MessageConverter]:
+    """Converter from the rosbag of a session to an output rosbag version
+
+    Args:
+        session: Session of the input rosbag
+        is_ros1_writer: Is the output rosbag a ROS 1 rosbag ?
+
+    Returns:
+        Optional[MessageConverter]: Converter, or None if both rosbags have the same ROS version
+    """
+    if session.is_ros1 == is_ros1_writer:
+        return None
+    return MessageConverter(session.typestore, to_ros1=is_ros1_writer)
@@ -1,9 +1,19 @@
 """Export odometry topics from bags"""
 
+from rosbag_tools.utils import lazy_getattr
+
 from .main import cli as export_odometry
-from .odometry_exporter import OdometryExporter
 
 __all__ = (
+    "DatasetOdometryExporter",
     "OdometryExporter",
     "export_odometry",
 )
+
+__getattr__ = lazy_getattr(
+    __name__,
+    {
+        "DatasetOdometryExporter": ".odometry_exporter",
+        "OdometryExporter": ".odometry_exporter",
+    },
+)
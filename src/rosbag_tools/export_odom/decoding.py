@@ -0,0 +1,192 @@
+"""Fast extraction of poses from serialized odometry messages
+
+Exporting a trajectory only needs the header stamp, the position and the
+orientation of each `nav_msgs/msg/Odometry` message. Instead of deserializing
+every message (header, pose, twist and both 36-element covariances), the fields
+are read straight from the serialized buffers, at offsets computed for a whole
+batch of messages with NumPy :
+
+* ROS 1 : stamp, frame ids (uint32 length + bytes), then the pose, unaligned
+* ROS 2 (little-endian CDR) : 4-byte encapsulation header, stamp, frame ids
+  (uint32 length + bytes, aligned on 4 bytes), then the pose, aligned on 8 bytes
+
+Messages whose layout is not the expected one (other message definition,
+big-endian CDR, inconsistent lengths) are fully deserialized instead.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+from rosbags.typesys.msg import generate_msgdef
+
+from rosbag_tools.export_odom.poses import PoseBatch
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Sequence, Tuple
+
+    from rosbag_tools.session import BagSession
+
+ODOMETRY_MSGTYPE = "nav_msgs/msg/Odometry"
+# MD5 sum of the standard nav_msgs/Odometry definition
+ODOMETRY_MD5 = "cd5e73d190d741a2f92e81eda573aca7"
+# Pose, pose covariance, twist and twist covariance : 7 + 36 + 6 + 36 float64
+ODOMETRY_TAIL_SIZE = (7 + 36 + 6 + 36) * 8
+# Little-endian CDR encapsulation header
+CDR_LE_HEADER = (0x00, 0x01)
+
+
+def _gather(buf: np.ndarray, pos: np.ndarray, dtype: str, count: int = 1) -> np.ndarray:
+    """Read `count` values of type `dtype` at byte positions `pos` of `buf`
+
+    Args:
+        buf: Bytes, as a uint8 array
+        pos: Byte positions, one per message
+        dtype: Little-endian value type
+        count: Number of consecutive values to read at each position. Defaults to 1.
+
+    Returns:
+        np.ndarray: Values, of shape (len(pos), count)
+    """
+    size = np.dtype(dtype).itemsize * count
+    idx = np.minimum(pos[:, None] + np.arange(size), len(buf) - 1)
+    return buf[idx].view(dtype)
+
+
+def pose_from_message(msg: Any) -> Tuple[int, Tuple[float, ...]]:
+    """Header stamp and pose of a deserialized odometry message
+
+    Args:
+        msg: Deserialized nav_msgs/msg/Odometry message
+
+    Returns:
+        Tuple[int, Tuple[float, ...]]: Header stamp (ns), and values of the columns of `POSE_COLUMNS`
+    """
+    tstamp = msg.header.stamp
+    pose = msg.pose.pose
+    position = pose.position
+    orient = pose.orientation
+    return tstamp.sec * 10**9 + tstamp.nanosec, (
+        position.x,
+        position.y,
+        position.z,
+        orient.x,
+        orient.y,
+        orient.z,
+        orient.w,
+    )
+
+
+class OdometryDecoder:
+    """OdometryDecoder - Extract the stamp and pose of batches of serialized odometry messages"""
+
+    def __init__(
+        self, typestore: Any, is_ros1: bool, deserialize: Callable[[bytes, str], Any]
+    ) -> None:
+        """Create an OdometryDecoder instance
+
+        Args:
+            typestore: Type store of the message types of the rosbag
+            is_ros1: Are the messages serialized in the ROS 1 format ? Otherwise, in CDR.
+            deserialize: Function that deserializes a message, from its data and type, for unexpected layouts
+        """
+        self.is_ros1 = is_ros1
+        self.deserialize = deserialize
+        # A rosbag can hold its own Odometry definition : fields are only read at
+        # computed offsets if it is the standard one
+        _, digest = generate_msgdef(ODOMETRY_MSGTYPE, typestore)
+        self.is_standard = digest == ODOMETRY_MD5
+        # Number of messages that were fully deserialized
+        self.fallbacks = 0
+
+    @classmethod
+    def from_session(cls, session: BagSession) -> OdometryDecoder:
+        """Decoder of the odometry messages of a rosbag session"""
+        return cls(session.typestore, session.is_ros1, session.deserialize)
+
+    def decode(self, datas: Sequence[bytes]) -> PoseBatch:
+        """Extract the header stamps and poses of a batch of serialized odometry messages
+
+        Args:
+            datas: Serialized nav_msgs/msg/Odometry messages
+
+        Returns:
+            PoseBatch: Header stamps and poses of the messages
+        """
+        batch = PoseBatch.empty(len(datas))
+        if not len(datas):
+            return batch
+        if self.is_standard:
+            sizes = np.fromiter((len(data) for data in datas), np.int64, len(datas))
+            starts = np.zeros(len(datas), dtype=np.int64)
+            np.cumsum(sizes[:-1], out=starts[1:])
+            buf = np.frombuffer(b"".join(datas), dtype=np.uint8)
+            decode = self._decode_ros1 if self.is_ros1 else self._decode_cdr
+            valid = decode(buf, starts, sizes, batch)
+        else:
+            valid = np.zeros(len(datas), dtype=bool)
+
+        for idx in np.flatnonzero(~valid):
+            msg = self.deserialize(datas[idx], ODOMETRY_MSGTYPE)
+            batch.stamps[idx], batch.poses[:, idx] = pose_from_message(msg)
+        self.fallbacks += len(datas) - int(valid.sum())
+        return batch
+
+    @staticmethod
+    def _read_frame_id(
+        buf: np.ndarray, starts: np.ndarray, offset: np.ndarray, valid: np.ndarray
+    ) -> np.ndarray:
+        """Offset after a frame id string, relative to the start of each message"""
+        length = _gather(buf, starts + offset, "<u4")[:, 0].astype(np.int64)
+        return offset + 4 + np.where(valid, length, 0)
+
+    def _decode_ros1(
+        self, buf: np.ndarray, starts: np.ndarray, sizes: np.ndarray, batch: PoseBatch
+    ) -> np.ndarray:
+        """Read the poses of ROS 1 messages, return the mask of messages with the expected layout"""
+        # seq, stamp (sec, nsec), frame_id
+        valid = sizes >= 20 + ODOMETRY_TAIL_SIZE
+        offset = self._read_frame_id(buf, starts, np.full_like(starts, 12), valid)
+        valid &= offset + 4 + ODOMETRY_TAIL_SIZE <= sizes
+        # child_frame_id
+        offset = self._read_frame_id(buf, starts, np.where(valid, offset, 0), valid)
+        valid &= offset + ODOMETRY_TAIL_SIZE == sizes
+        self._read_pose(buf, starts, starts + 4, np.where(valid, offset, 0), batch)
+        return valid
+
+    def _decode_cdr(
+        self, buf: np.ndarray, starts: np.ndarray, sizes: np.ndarray, batch: PoseBatch
+    ) -> np.ndarray:
+        """Read the poses of CDR messages, return the mask of messages with the expected layout"""
+        valid = (sizes >= 24 + ODOMETRY_TAIL_SIZE) & (
+            (buf[np.minimum(starts, len(buf) - 1)] == CDR_LE_HEADER[0])
+            & (buf[np.minimum(starts + 1, len(buf) - 1)] == CDR_LE_HEADER[1])
+        )
+        # Offsets are relative to the message body, after the encapsulation header
+        body = starts + 4
+        bodysizes = sizes - 4
+        # stamp (sec, nanosec), frame_id
+        offset = self._read_frame_id(buf, body, np.full_like(starts, 8), valid)
+        offset = (offset + 3) & ~3
+        valid &= offset + 4 + ODOMETRY_TAIL_SIZE <= bodysizes
+        # child_frame_id, then the pose, aligned on 8 bytes
+        offset = self._read_frame_id(buf, body, np.where(valid, offset, 0), valid)
+        offset = (offset + 7) & ~7
+        valid &= offset + ODOMETRY_TAIL_SIZE <= bodysizes
+        self._read_pose(buf, body, body, np.where(valid, offset, 0), batch)
+        return valid
+
+    @staticmethod
+    def _read_pose(
+        buf: np.ndarray,
+        starts: np.ndarray,
+        stamps: np.ndarray,
+        offsets: np.ndarray,
+        batch: PoseBatch,
+    ) -> None:
+        """Read the stamps at `stamps` and the poses at `starts + offsets` in `batch`"""
+        sec = _gather(buf, stamps, "<i4")[:, 0].astype(np.int64)
+        nanosec = _gather(buf, stamps + 4, "<u4")[:, 0]
+        batch.stamps[:] = sec * 10**9 + nanosec
+        batch.poses[:] = _gather(buf, starts + offsets, "<f8", 7).T
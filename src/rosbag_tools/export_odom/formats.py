@@ -0,0 +1,401 @@
+"""Trajectory file formats of the odometry exporter
+
+Each format is a `TrajectoryWriter` : the exporter opens it, writes the odometry
+messages batch by batch as they are decoded, then closes it. Nothing is kept
+between batches, so that memory use does not grow with the trajectory length.
+
+Formats are registered by name with `register_format`, which can also be used to
+add a format from outside of rosbag-tools. See
+https://github.com/MichaelGrupp/evo/wiki/Formats for the built-in text formats.
+The `parquet` and `feather` columnar formats require the optional `pyarrow` dependency.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+from rosbags.rosbag1 import Writer as Writer1
+from rosbags.rosbag2 import Writer as Writer2
+
+from rosbag_tools.conversion import session_converter
+from rosbag_tools.export_odom.poses import POSE_COLUMNS, format_rows
+from rosbag_tools.writers import add_writer_connections
+
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional, Sequence, TextIO, Tuple, Type
+
+    from rosbags.interfaces import Connection
+
+    from rosbag_tools.export_odom.poses import PoseBatch
+    from rosbag_tools.session import BagSession
+
+    Message = Tuple[Connection, int, bytes]
+
+# Trajectory writers, by format name
+TRAJECTORY_FORMATS: Dict[str, Type[TrajectoryWriter]] = {}
+
+
+def register_format(writer_class: Type[TrajectoryWriter]) -> Type[TrajectoryWriter]:
+    """Register a trajectory format, under the name `writer_class.NAME`
+
+    Can be used as a class decorator.
+
+    Args:
+        writer_class: TrajectoryWriter subclass
+
+    Returns:
+        Type[TrajectoryWriter]: `writer_class`
+    """
+    TRAJECTORY_FORMATS[writer_class.NAME.lower()] = writer_class
+    return writer_class
+
+
+def get_format(name: str) -> Type[TrajectoryWriter]:
+    """Trajectory writer of format `name`
+
+    Args:
+        name: Format name, case insensitive
+
+    Raises:
+        ValueError: Unknown format
+
+    Returns:
+        Type[TrajectoryWriter]: Writer class of the format
+    """
+    try:
+        return TRAJECTORY_FORMATS[name.lower()]
+    except KeyError:
+        raise ValueError(
+            f"Odom format {name} is unknown. "
+            f"Choose one of {', '.join(TRAJECTORY_FORMATS)}."
+        ) from None
+
+
+def quaternion_to_matrix(qx, qy, qz, qw) -> np.ndarray:
+    """Rotation matrices of quaternions, vectorized
+
+    Quaternions do not need to be normalized.
+
+    Args:
+        qx: x components of the quaternions
+        qy: y components of the quaternions
+        qz: z components of the quaternions
+        qw: w components of the quaternions
+
+    Returns:
+        np.ndarray: Rotation matrices, of shape (3, 3, n)
+    """
+    norm = qx * qx + qy * qy + qz * qz + qw * qw
+    scale = np.divide(2.0, norm, out=np.zeros_like(norm), where=norm > 0)
+    xx, yy, zz = scale * qx * qx, scale * qy * qy, scale * qz * qz
+    xy, xz, yz = scale * qx * qy, scale * qx * qz, scale * qy * qz
+    wx, wy, wz = scale * qw * qx, scale * qw * qy, scale * qw * qz
+    return np.array(
+        [
+            [1.0 - (yy + zz), xy - wz, xz + wy],
+            [xy + wz, 1.0 - (xx + zz), yz - wx],
+            [xz - wy, yz + wx, 1.0 - (xx + yy)],
+        ]
+    )
+
+
+class TrajectoryWriter:
+    """TrajectoryWriter - Base class of the trajectory formats, written batch by batch"""
+
+    # Format name
+    NAME = ""
+    # Extension of the exported files, or "" for a directory
+    EXTENSION = ""
+    # Does the format write the decoded poses ? Otherwise, messages are not decoded
+    NEEDS_POSES = True
+
+    def __init__(self, path: Path | str, session: BagSession) -> None:
+        """Create a TrajectoryWriter instance. The output is created when it is opened.
+
+        Args:
+            path: Export path
+            session: Session of the input rosbag
+        """
+        self.path = Path(path)
+        self.session = session
+
+    def __enter__(self) -> TrajectoryWriter:
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.close()
+        return False
+
+    def open(self) -> None:
+        """Create the output"""
+        raise NotImplementedError
+
+    def write(self, batch: Optional[PoseBatch], messages: Sequence[Message]) -> None:
+        """Write a batch of odometry messages
+
+        Args:
+            batch: Header stamps and poses of the messages, None if `NEEDS_POSES` is False
+            messages: Connection, timestamp and serialized data of the messages
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Close the output"""
+        raise NotImplementedError
+
+
+class TextTrajectoryWriter(TrajectoryWriter):
+    """TextTrajectoryWriter - Trajectory format with one line of text per pose"""
+
+    # First line of the file, without newline. None writes no header.
+    HEADER: Optional[str] = None
+    # Separator between the values of a line
+    SEPARATOR = " "
+
+    def __init__(self, path: Path | str, session: BagSession) -> None:
+        super().__init__(path, session)
+        self._file: Optional[TextIO] = None
+
+    def open(self) -> None:
+        self._file = open(self.path, "w", encoding="utf-8")
+        if self.HEADER is not None:
+            self._file.write(f"{self.HEADER}\n")
+
+    def columns(self, batch: PoseBatch) -> Sequence[np.ndarray]:
+        """Columns of the lines of a batch
+
+        Args:
+            batch: Header stamps and poses of the messages
+
+        Returns:
+            Sequence[np.ndarray]: Values of each column
+        """
+        raise NotImplementedError
+
+    def write(self, batch: PoseBatch, messages: Sequence[Message]) -> None:
+        self._file.write(format_rows(self.columns(batch), self.SEPARATOR))
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+@register_format
+class TumWriter(TextTrajectoryWriter):
+    """TumWriter - TUM format : timestamp (s), position and orientation quaternion (x, y, z, w)"""
+
+    NAME = "tum"
+    EXTENSION = ".txt"
+    HEADER = "# timestamp tx ty tz qx qy qz qw"
+
+    def columns(self, batch: PoseBatch) -> Sequence[np.ndarray]:
+        return (batch.seconds, *batch.poses)
+
+
+@register_format
+class EurocWriter(TextTrajectoryWriter):
+    """EurocWriter - EuRoC ground truth CSV : timestamp (ns), position and orientation quaternion (w, x, y, z)"""
+
+    NAME = "euroc"
+    EXTENSION = ".csv"
+    HEADER = (
+        "#timestamp,p_RS_R_x [m],p_RS_R_y [m],p_RS_R_z [m],"
+        "q_RS_w [],q_RS_x [],q_RS_y [],q_RS_z []"
+    )
+    SEPARATOR = ","
+
+    def columns(self, batch: PoseBatch) -> Sequence[np.ndarray]:
+        tx, ty, tz, qx, qy, qz, qw = batch.poses
+        return (batch.stamps, tx, ty, tz, qw, qx, qy, qz)
+
+
+@register_format
+class KittiWriter(TextTrajectoryWriter):
+    """KittiWriter - KITTI format : 3x4 pose matrix [R | t], row by row, without timestamps"""
+
+    NAME = "kitti"
+    EXTENSION = ".txt"
+
+    def columns(self, batch: PoseBatch) -> Sequence[np.ndarray]:
+        tx, ty, tz, qx, qy, qz, qw = batch.poses
+        rot = quaternion_to_matrix(qx, qy, qz, qw)
+        return (*rot[0], tx, *rot[1], ty, *rot[2], tz)
+
+
+@register_format
+class BagWriter(TrajectoryWriter):
+    """BagWriter - ROS 1 rosbag with the odometry messages of the input rosbag
+
+    Messages are copied as they are, or converted when the input is a ROS 2 rosbag.
+    """
+
+    NAME = "bag"
+    EXTENSION = ".bag"
+    # Serialized messages are written, without their poses
+    NEEDS_POSES = False
+    Writer: Type[Writer1 | Writer2] = Writer1
+
+    def __init__(self, path: Path | str, session: BagSession) -> None:
+        super().__init__(path, session)
+        self._writer: Optional[Writer1 | Writer2] = None
+        self._conn_map: Dict[int, Connection] = {}
+        self._converter = session_converter(session, issubclass(self.Writer, Writer1))
+
+    def open(self) -> None:
+        self._writer = self.Writer(self.path)
+        self._writer.open()
+
+    def write(self, batch: Optional[PoseBatch], messages: Sequence[Message]) -> None:
+        written: List[Message] = list(messages)
+        conns = {conn.id: conn for conn, _, _ in written}
+        new_conns = [conn for conn in conns.values() if conn.id not in self._conn_map]
+        self._conn_map.update(
+            add_writer_connections(
+                self._writer, new_conns, issubclass(self.Writer, Writer1), self._converter
+            )
+        )
+        if self._converter is not None:
+            written = self._converter.convert_messages(written, conns.values())
+        for conn, timestamp, data in written:
+            self._writer.write(self._conn_map[conn.id], timestamp, data)
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+@register_format
+class Bag2Writer(BagWriter):
+    """Bag2Writer - ROS 2 rosbag with the odometry messages of the input rosbag
+
+    Messages are copied as they are, or converted when the input is a ROS 1 rosbag.
+    """
+
+    NAME = "bag2"
+    EXTENSION = ""
+    Writer = Writer2
+
+
+def _import_pyarrow() -> Any:
+    """Optional pyarrow dependency, only imported when exporting to a columnar format"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as err:
+        raise ImportError(
+            "pyarrow is not included in the installed version of rosbag-tools. Install 'rosbag-tools[arrow]'"
+        ) from err
+    return pyarrow
+
+
+class ArrowTrajectoryWriter(TrajectoryWriter):
+    """ArrowTrajectoryWriter - Columnar trajectory format, written with pyarrow
+
+    Columns are `timestamp`, the header stamp in nanoseconds (int64), then the
+    position and orientation quaternion (float64). Batches are gathered until they
+    reach `ROW_GROUP_SIZE` poses, then written as a row group. The schema metadata
+    describes the input rosbag and the exported topic.
+    """
+
+    # Number of poses of each row group
+    ROW_GROUP_SIZE = 65536
+
+    def __init__(self, path: Path | str, session: BagSession) -> None:
+        super().__init__(path, session)
+        self._pa: Any = None
+        self._writer: Any = None
+        self._connection: Optional[Connection] = None
+        self._batches: List[PoseBatch] = []
+        self._rows = 0
+
+    def open(self) -> None:
+        # pyarrow is imported before any message is read. The file is created with
+        # the first row group, once the exported topic is known.
+        self._pa = _import_pyarrow()
+
+    def _schema(self) -> Any:
+        """Columns and metadata of the exported file"""
+        pa = self._pa
+        fields = [pa.field("timestamp", pa.int64(), metadata={"unit": "ns"})]
+        fields += [pa.field(name, pa.float64()) for name in POSE_COLUMNS]
+        metadata = {
+            "rosbag": str(self.session.path.resolve()),
+            "ros_version": "1" if self.session.is_ros1 else "2",
+            "start_time": str(self.session.start_time),
+            "end_time": str(self.session.end_time),
+        }
+        if self._connection is not None:
+            topic = self._connection.topic
+            metadata["topic"] = topic
+            metadata["msgtype"] = self._connection.msgtype
+            metadata["message_count"] = str(
+                sum(
+                    conn.msgcount
+                    for conn in self.session.connections
+                    if conn.topic == topic
+                )
+            )
+        return pa.schema(fields, metadata=metadata)
+
+    def _create_writer(self, schema: Any) -> Any:
+        """pyarrow writer of the format, with a `write_table` and a `close` method"""
+        raise NotImplementedError
+
+    def _flush(self) -> None:
+        """Write the pending batches as a row group"""
+        pa = self._pa
+        schema = self._schema()
+        if self._writer is None:
+            self._writer = self._create_writer(schema)
+        if not self._batches:
+            return
+        stamps = np.concatenate([batch.stamps for batch in self._batches])
+        poses = np.concatenate([batch.poses for batch in self._batches], axis=1)
+        columns = [pa.array(column) for column in (stamps, *poses)]
+        table = pa.Table.from_arrays(columns, schema=schema)
+        self._writer.write_table(table)
+        self._batches = []
+        self._rows = 0
+
+    def write(self, batch: PoseBatch, messages: Sequence[Message]) -> None:
+        if self._connection is None and len(messages):
+            self._connection = messages[0][0]
+        self._batches.append(batch)
+        self._rows += batch.size
+        if self._rows >= self.ROW_GROUP_SIZE:
+            self._flush()
+
+    def close(self) -> None:
+        if self._pa is None:
+            return
+        self._flush()
+        self._writer.close()
+        self._writer = None
+        self._pa = None
+
+
+@register_format
+class ParquetWriter(ArrowTrajectoryWriter):
+    """ParquetWriter - Apache Parquet file, compressed with zstd"""
+
+    NAME = "parquet"
+    EXTENSION = ".parquet"
+
+    def _create_writer(self, schema: Any) -> Any:
+        return self._pa.parquet.ParquetWriter(str(self.path), schema, compression="zstd")
+
+
+@register_format
+class FeatherWriter(ArrowTrajectoryWriter):
+    """FeatherWriter - Feather (Arrow IPC) file, uncompressed so that it can be memory-mapped"""
+
+    NAME = "feather"
+    EXTENSION = ".feather"
+
+    def _create_writer(self, schema: Any) -> Any:
+        return self._pa.ipc.new_file(str(self.path), schema)
@@ -2,13 +2,18 @@ from pathlib import Path
 
 import click
 
-from rosbag_tools.export_odom.odometry_exporter import OdometryExporter
-from rosbag_tools.utils import custom_message_path, slugify_topic
+from rosbag_tools.utils import (
+    custom_message_path,
+    print_dataset_report,
+    profile_option,
+    quiet_option,
+    slugify_topic,
+)
 
 
 @click.command(
     "export-odometry",
-    short_help="export odometry topics from a rosbag to TUM file format",
+    short_help="export odometry topics from a rosbag to trajectory files",
 )
 @click.argument(
     "inbag",
@@ -18,9 +23,12 @@ from rosbag_tools.utils import custom_message_path, slugify_topic
 @click.option(
     "-t",
     "--odom-topic",
-    "odom_topic",
+    "odom_topics",
     required=True,
-    help="Odometry topic to export.",
+    multiple=True,
+    help="Odometry topic to export. Can be repeated, and can be a pattern such as "
+    "'/robot*/odom' : all the topics are exported in a single read of INBAG, "
+    "one file per topic.",
     type=click.STRING,
 )
 @click.option(
@@ -28,7 +36,9 @@ from rosbag_tools.utils import custom_message_path, slugify_topic
     "--traj-form",
     "--trajectory-format",
     "odom_format",
-    help="Trajectory format, as listed in https://github.com/MichaelGrupp/evo/wiki/Formats. Defaults to 'tum'.",
+    help="Trajectory format : tum, euroc, kitti, bag (ROS 1 rosbag) or bag2 (ROS 2 rosbag), "
+    "as listed in https://github.com/MichaelGrupp/evo/wiki/Formats, "
+    "or parquet or feather (requires pyarrow). Defaults to 'tum'.",
     type=click.STRING,
     default="tum",
     show_default=True,
@@ -37,7 +47,16 @@ from rosbag_tools.utils import custom_message_path, slugify_topic
     "-o",
     "--output",
     "out_path",
-    help="Exported odometry file. Defaults to INBAG_topic.txt.",
+    help="Exported odometry file, or output directory for a dataset or several topics. "
+    "Defaults to INBAG_topic with the extension of the format (.txt, .csv, .bag, ...).",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Number of rosbags that are processed in parallel, when INBAG is a dataset directory",
 )
 @click.option(
     "-f",
@@ -46,23 +65,63 @@ from rosbag_tools.utils import custom_message_path, slugify_topic
     help="Force output file overwriting",
     is_flag=True,
 )
+@profile_option
+@quiet_option
 @custom_message_path
-def cli(inbag, odom_topic, out_path, odom_format, force: bool):
+def cli(inbag, odom_topics, out_path, odom_format, jobs: int, force: bool):
     """Export odometry topic from INBAG
 
     INBAG is the path to a rosbag file
     Can be a bag in ROS 1 or in ROS 2
+
+    INBAG can also be a dataset directory : the odometry of every rosbag of the
+    dataset is exported, next to each rosbag or in the --output directory.
+
+    When several topics, or topic patterns, are given, each topic is exported
+    in INBAG_topic, in the --output directory if given.
     """
+    # Tools are imported here, to keep the CLI startup fast
+    from rosbag_tools.base import DatasetTool
+    from rosbag_tools.export_odom.odometry_exporter import (
+        DatasetOdometryExporter,
+        OdometryExporter,
+    )
+
+    # A single topic is exported in the --output file, otherwise --output is a directory
+    single_topic = len(odom_topics) == 1 and not any(c in odom_topics[0] for c in "*?[")
+
+    if DatasetTool.is_dataset(inbag):
+        dataset_exp = DatasetOdometryExporter(inbag)
+        export = (
+            dataset_exp.export_odometry if single_topic else dataset_exp.export_topics
+        )
+        report = export(
+            odom_topics[0] if single_topic else odom_topics,
+            export_format=odom_format,
+            outdir=out_path,
+            force_output_overwrite=force,
+            jobs=jobs,
+        )
+        print_dataset_report(report, "export-odometry")
+        return
 
     # Default path:
     # /path/to/my/rosbag => /path/to/my/rosbag_topic.txt
     # /path/to/my/rosbag.bag => /path/to/my/rosbag_topic.txt
 
     inpath = Path(inbag)
-    odom_exp = OdometryExporter(inbag)
-    odom_exp.export_odometry(
-        odom_topic,
-        export_format=odom_format,
-        export_path=out_path,
-        force_output_overwrite=force,
-    )
+    with OdometryExporter(inbag) as odom_exp:
+        if single_topic:
+            odom_exp.export_odometry(
+                odom_topics[0],
+                export_format=odom_format,
+                export_path=out_path,
+                force_output_overwrite=force,
+            )
+        else:
+            odom_exp.export_topics(
+                odom_topics,
+                export_format=odom_format,
+                outdir=out_path,
+                force_output_overwrite=force,
+            )
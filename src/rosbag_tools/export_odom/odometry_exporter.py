@@ -2,46 +2,117 @@
 
 from __future__ import annotations
 
+import fnmatch
 import warnings
+from contextlib import ExitStack
 from pathlib import Path
 from typing import TYPE_CHECKING
 
-import pandas as pd
-from rosbags.highlevel import AnyReader
-from tqdm import tqdm
-
-from rosbag_tools.base import ROSBagTool
+from rosbag_tools.base import DatasetReport, DatasetTool, ROSBagTool
 from rosbag_tools.exceptions import FileContentError
+from rosbag_tools.export_odom.decoding import OdometryDecoder
+from rosbag_tools.export_odom.formats import TRAJECTORY_FORMATS, TumWriter, get_format
+from rosbag_tools.profiling import profile_messages, profile_stage
+from rosbag_tools.progress import Progress
 from rosbag_tools.utils import slugify_topic
 
 if TYPE_CHECKING:
-    from typing import Sequence, Tuple, Type
+    from typing import Dict, List, Optional, Sequence, Tuple, Type
+
+    from rosbags.interfaces import Connection
+
+    from rosbag_tools.export_odom.formats import TrajectoryWriter
 
 
 class OdometryExporter(ROSBagTool):
     """Topic Remover : Remove topics from a rosbag"""
 
-    ALL_ODOM_FORMATS = ("tum", "bag", "euroc", "kitti", "bag2")
-    ODOM_EXTS = {
-        "tum": ".txt",
-        "bag": ".bag",
-        "euroc": ".csv",
-        "kitti": ".txt",
-        "bag2": "",
-    }
+    # Built-in formats, see `rosbag_tools.export_odom.formats.register_format` to add one
+    ALL_ODOM_FORMATS = tuple(TRAJECTORY_FORMATS)
+    ODOM_EXTS = {name: writer.EXTENSION for name, writer in TRAJECTORY_FORMATS.items()}
     ODOM_MSG_TYPES = ["nav_msgs/msg/Odometry"]
-    TUM_FIRST_ROW = "# timestamp tx ty tz qx qy qz qw"
+    TUM_FIRST_ROW = TumWriter.HEADER
+    # Number of messages decoded and written at once
+    DECODE_BATCH_SIZE = 4096
 
     def __init__(self, path: Path | str) -> None:
         super().__init__(path, "export-odometry")
 
+    @staticmethod
+    def _write_batch(
+        decoder: Optional[OdometryDecoder],
+        writer: TrajectoryWriter,
+        messages: List[Tuple[Connection, int, bytes]],
+        progress: Progress,
+    ) -> None:
+        """Decode a batch of odometry messages and write it in the trajectory file"""
+        if not messages:
+            return
+        nbytes = sum(len(data) for _, _, data in messages)
+        batch = None
+        if writer.NEEDS_POSES:
+            with profile_stage("decode", len(messages), nbytes):
+                batch = decoder.decode([data for _, _, data in messages])
+        with profile_stage("write", len(messages), nbytes):
+            writer.write(batch, messages)
+        progress.update(len(messages), nbytes)
+
+    def _odometry_connections(self, topic: str) -> List[Connection]:
+        """Connections of an odometry topic
+
+        Raises:
+            ValueError: Topic that is not an odometry topic
+        """
+        connections = [x for x in self.session.reader.connections if x.topic == topic]
+        if not all(conn.msgtype in self.ODOM_MSG_TYPES for conn in connections):
+            raise ValueError(
+                f"Topic {topic} is not an odometry topic. "
+                f"Choose a topic that has one of the following msg types : {', '.join(self.ODOM_MSG_TYPES)}."
+            )
+        return connections
+
+    def _export(
+        self,
+        outpaths: Dict[str, Path],
+        Writer: Type[TrajectoryWriter],
+        connections: List[Connection],
+    ) -> None:
+        """Export odometry topics, reading the rosbag once
+
+        Args:
+            outpaths: Export path of each odometry topic
+            Writer: Trajectory writer of the export format
+            connections: Connections of the odometry topics
+        """
+        reader = self.session.reader
+        # Stamps and poses are read straight from batches of serialized messages. Each
+        # topic has its own batch, written before the next messages of the topic are read
+        decoder = (
+            OdometryDecoder.from_session(self.session) if Writer.NEEDS_POSES else None
+        )
+        total = sum(conn.msgcount for conn in connections)
+        with Progress(total=total) as progress, ExitStack() as stack:
+            sinks = {
+                topic: _TopicSink(stack.enter_context(Writer(outpath, self.session)))
+                for topic, outpath in outpaths.items()
+            }
+            messages = reader.messages(connections=connections)
+            for message in profile_messages("read", messages):
+                sink = sinks[message[0].topic]
+                sink.messages.append(message)
+                if len(sink.messages) == self.DECODE_BATCH_SIZE:
+                    self._write_batch(decoder, sink.writer, sink.messages, progress)
+                    sink.messages = []
+            for sink in sinks.values():
+                self._write_batch(decoder, sink.writer, sink.messages, progress)
+
     def export_odometry(
         self,
         odom_topic: str,
         export_format: str | None = "tum",
         export_path: Path | str | None = None,
         force_output_overwrite: bool = False,
-    ) -> None:
+    ) -> Path:
         """Export odometry topic to 'out_path'
 
         Args:
@@ -51,7 +122,10 @@ class OdometryExporter(ROSBagTool):
             force_output_overwrite (bool): Force output overwriting if export_path already exists. Defaults to False.
 
         Raises:
-            NotImplementedError: _description_
+            ValueError: Unknown format, wrong extension or topic that is not an odometry topic
+
+        Returns:
+            Path: Export path
         """
 
         # Check odom_topic
@@ -62,15 +136,10 @@ class OdometryExporter(ROSBagTool):
 
         # Check odom format
         exp_form = export_format.lower()
-        if exp_form not in self.ALL_ODOM_FORMATS:
-            raise ValueError(f"Odom format {export_format} is unknown")
-        if exp_form != "tum":
-            # TODO: Implement other odom formats
-            # Only tum is implemented as of now
-            raise NotImplementedError("As of now, only the 'tum' format is supported.")
+        Writer = get_format(exp_form)
 
         # Check export_path
-        export_ext = self.ODOM_EXTS[exp_form]
+        export_ext = Writer.EXTENSION
         if export_path is not None:
             # Export path was given as a method argument
             outpath = Path(export_path)
@@ -81,56 +150,232 @@ class OdometryExporter(ROSBagTool):
                 )
         else:
             # Default filename : `{inbag}_{odom_topic}.{ext}`
-            outfname = self.inbag.with_stem(
-                f"{self.inbag.stem}_{slug_odom_topic}"
-            ).with_suffix(export_ext)
-            outfname = f"{self.inbag.stem}_{slug_odom_topic}{export_ext}"
-            outpath = self.inbag.parent / outfname
+            outpath = self.topic_export_path(odom_topic, export_ext)
 
         self._check_export_path(export_path=outpath, force_out=force_output_overwrite)
 
-        # Reader
-        with AnyReader([self.inbag]) as reader:
-            # Check that odom_topic is a odom topic
-            connections = [x for x in reader.connections if x.topic == odom_topic]
-            msgtypes = [conn.msgtype for conn in connections]
-            if not all([mtype in self.ODOM_MSG_TYPES for mtype in msgtypes]):
+        # Check that odom_topic is a odom topic
+        connections = self._odometry_connections(odom_topic)
+
+        self._export({odom_topic: outpath}, Writer, connections)
+
+        print(f"[export-odometry] Done ! Exported in {outpath}")
+        return outpath
+
+    def topic_export_path(
+        self, topic: str, export_ext: str, outdir: Path | str | None = None
+    ) -> Path:
+        """Default export path of a topic : `{outdir}/{inbag}_{topic}.{ext}`
+
+        Args:
+            topic: Exported topic
+            export_ext: Extension of the export format
+            outdir: Output directory. Defaults to None, for the directory of the input rosbag.
+
+        Returns:
+            Path: Export path
+        """
+        outdir = self.inbag.parent if outdir is None else Path(outdir)
+        return outdir / f"{self.inbag.stem}_{slugify_topic(topic)}{export_ext}"
+
+    def export_topics(
+        self,
+        patterns: Sequence[str] | str,
+        export_format: str | None = "tum",
+        outdir: Path | str | None = None,
+        force_output_overwrite: bool = False,
+    ) -> Dict[str, Path]:
+        """Export several odometry topics, reading the rosbag only once
+
+        Each topic is exported in its own file, `{outdir}/{inbag}_{topic}.{ext}`.
+
+        Examples:
+        >>> odom_exp.export_topics(["/odom", "/robot*/odom"], outdir="trajectories")
+
+        Args:
+            patterns: Odometry topics or topic patterns (as in `topic-remove`) to export
+            export_format (str): Odometry format. Defaults to "tum".
+            outdir (Path | str): Output directory. Defaults to None, for the directory of the input rosbag.
+            force_output_overwrite (bool): Force output overwriting if an export path already exists. Defaults to False.
+
+        Raises:
+            FileContentError: Pattern that matches no topic of the rosbag
+            ValueError: Unknown format, or pattern that matches no odometry topic
+
+        Returns:
+            Dict[str, Path]: Export path of each exported topic
+        """
+        if isinstance(patterns, str):
+            patterns = (patterns,)
+
+        Writer = get_format(export_format.lower())
+
+        # Odometry topics that match the patterns. Other topics that match a pattern
+        # are skipped, as long as the pattern matches at least one odometry topic.
+        topics: List[str] = []
+        for pattern in patterns:
+            pattern_topics = fnmatch.filter(self.topics, pattern)
+            if not pattern_topics:
+                raise FileContentError(f"Topic {pattern} not found in bag {self._inbag}")
+            odom_topics = [
+                topic
+                for topic in pattern_topics
+                if all(
+                    conn.msgtype in self.ODOM_MSG_TYPES
+                    for conn in self.session.reader.connections
+                    if conn.topic == topic
+                )
+            ]
+            if not odom_topics:
                 raise ValueError(
-                    f"Topic {odom_topic} is not an odometry topic. s"
-                    f"Choose a topic that has one of the following msg types : {', '.join(self.ODOM_MSG_TYPES)}."
+                    f"Pattern {pattern} matches no odometry topic. "
+                    f"Choose topics that have one of the following msg types : {', '.join(self.ODOM_MSG_TYPES)}."
                 )
+            topics.extend(topic for topic in odom_topics if topic not in topics)
 
-            msgcount = [conn.msgcount for conn in connections]
-            odom_data = []
-            with tqdm(total=sum(msgcount)) as pbar:
-                for conn, timestamp, data in reader.messages(connections=connections):
-                    msg = reader.deserialize(data, conn.msgtype)
-
-                    tstamp = msg.header.stamp
-                    tstamp_s = tstamp.nanosec / 1e9 + tstamp.sec
-                    pose = msg.pose.pose
-                    position = pose.position
-                    orient = pose.orientation
-                    time_dat = {
-                        "timestamp": tstamp_s,
-                        "tx": position.x,
-                        "ty": position.y,
-                        "tz": position.z,
-                        "qx": orient.x,
-                        "qy": orient.y,
-                        "qz": orient.z,
-                        "qw": orient.w,
-                    }
-                    odom_data.append(time_dat)
-
-                    # Update progress bar
-                    pbar.update(1)
-
-        # Export to TUM
-        df = pd.DataFrame(odom_data)
-        df = df[self.TUM_FIRST_ROW[2:].split()]
-        with open(outpath, "w", encoding="utf-8") as f:
-            f.write(f"{self.TUM_FIRST_ROW}\n")
-        df.to_csv(outpath, index=False, header=False, mode="a", sep=" ")
+        if outdir is not None:
+            Path(outdir).mkdir(parents=True, exist_ok=True)
+        outpaths = {}
+        for topic in topics:
+            outpath = self.topic_export_path(topic, Writer.EXTENSION, outdir)
+            self._check_export_path(export_path=outpath, force_out=force_output_overwrite)
+            outpaths[topic] = outpath
 
-        print(f"[export-odometry] Done ! Exported in {outpath}")
+        connections = [
+            conn for topic in topics for conn in self._odometry_connections(topic)
+        ]
+        self._export(outpaths, Writer, connections)
+
+        exported = ", ".join(str(outpath) for outpath in outpaths.values())
+        print(f"[export-odometry] Done ! Exported in {exported}")
+        return outpaths
+
+
+class _TopicSink:
+    """Trajectory writer of an exported topic, and its messages that are not written yet"""
+
+    def __init__(self, writer: TrajectoryWriter) -> None:
+        self.writer = writer
+        self.messages: List[Tuple[Connection, int, bytes]] = []
+
+
+def _export_odometry(
+    inbag: Path,
+    odom_topic: str,
+    export_format: str,
+    export_path: Optional[Path],
+    force_output_overwrite: bool,
+) -> Path:
+    """Export the odometry of a rosbag, as a dataset task"""
+    with OdometryExporter(inbag) as odom_exp:
+        return odom_exp.export_odometry(
+            odom_topic,
+            export_format=export_format,
+            export_path=export_path,
+            force_output_overwrite=force_output_overwrite,
+        )
+
+
+def _export_topics(
+    inbag: Path,
+    patterns: Sequence[str],
+    export_format: str,
+    outdir: Optional[Path],
+    force_output_overwrite: bool,
+) -> Dict[str, Path]:
+    """Export several odometry topics of a rosbag, as a dataset task"""
+    with OdometryExporter(inbag) as odom_exp:
+        return odom_exp.export_topics(
+            patterns,
+            export_format=export_format,
+            outdir=outdir,
+            force_output_overwrite=force_output_overwrite,
+        )
+
+
+class DatasetOdometryExporter(DatasetTool):
+    """Dataset Odometry Exporter : Export an odometry topic from every rosbag of a dataset"""
+
+    def __init__(self, path: Path | str) -> None:
+        """Create a DatasetOdometryExporter instance
+
+        Args:
+            path: Path to a dataset directory that contains rosbags
+        """
+        super().__init__(path, "export-odometry")
+
+    def export_odometry(
+        self,
+        odom_topic: str,
+        export_format: str | None = "tum",
+        outdir: Path | str | None = None,
+        force_output_overwrite: bool = False,
+        jobs: int = 1,
+    ) -> DatasetReport:
+        """Export an odometry topic from every rosbag of the dataset
+
+        Args:
+            odom_topic (str): odometry topic to export.
+            export_format (str): Odometry format. Defaults to "tum".
+            outdir (Path | str): Output directory. Defaults to None. If None, each odometry file is exported next to its rosbag.
+            force_output_overwrite (bool): Force output overwriting if an export path already exists. Defaults to False.
+            jobs (int): Number of rosbags that are processed in parallel. Defaults to 1.
+
+        Returns:
+            DatasetReport: Export path or error of each rosbag
+        """
+        exclude = [] if outdir is None else [Path(outdir)]
+        export_ext = get_format(export_format).EXTENSION
+        tasks = {}
+        for bag in self.find_rosbags(self.folder, exclude=exclude):
+            export_path = None
+            if outdir is not None:
+                outfname = f"{bag.stem}_{slugify_topic(odom_topic)}{export_ext}"
+                export_path = self.output_path(bag, outdir).with_name(outfname)
+            tasks[bag] = (
+                bag,
+                odom_topic,
+                export_format,
+                export_path,
+                force_output_overwrite,
+            )
+        return self.run(_export_odometry, tasks, jobs=jobs)
+
+    def export_topics(
+        self,
+        patterns: Sequence[str] | str,
+        export_format: str | None = "tum",
+        outdir: Path | str | None = None,
+        force_output_overwrite: bool = False,
+        jobs: int = 1,
+    ) -> DatasetReport:
+        """Export several odometry topics from every rosbag of the dataset, reading each rosbag once
+
+        Args:
+            patterns: Odometry topics or topic patterns to export
+            export_format (str): Odometry format. Defaults to "tum".
+            outdir (Path | str): Output directory. Defaults to None. If None, the odometry files are exported next to their rosbag.
+            force_output_overwrite (bool): Force output overwriting if an export path already exists. Defaults to False.
+            jobs (int): Number of rosbags that are processed in parallel. Defaults to 1.
+
+        Returns:
+            DatasetReport: Export paths or error of each rosbag
+        """
+        if isinstance(patterns, str):
+            patterns = (patterns,)
+        exclude = [] if outdir is None else [Path(outdir)]
+        # Fail on an unknown format before reading any rosbag
+        get_format(export_format)
+        tasks = {}
+        for bag in self.find_rosbags(self.folder, exclude=exclude):
+            bag_outdir = None
+            if outdir is not None:
+                bag_outdir = self.output_path(bag, outdir).parent
+            tasks[bag] = (
+                bag,
+                tuple(patterns),
+                export_format,
+                bag_outdir,
+                force_output_overwrite,
+            )
+        return self.run(_export_topics, tasks, jobs=jobs)
@@ -0,0 +1,79 @@
+"""Columnar batches of timestamped poses
+
+Odometry topics can hold millions of messages. Poses are handled in batches of
+NumPy columns : an int64 column of header stamps (ns) and float64 columns for the
+position and orientation, 64 bytes per pose and no Python object per message.
+Batches are formatted as text with vectorized NumPy conversions.
+"""
+
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from typing import Sequence
+
+# Columns of a pose : position and orientation quaternion
+POSE_COLUMNS = ("tx", "ty", "tz", "qx", "qy", "qz", "qw")
+
+
+class PoseBatch(NamedTuple):
+    """Header stamps and poses of a batch of odometry messages"""
+
+    # Header stamps, in nanoseconds (int64)
+    stamps: np.ndarray
+    # Poses, of shape (7, n), with the columns of `POSE_COLUMNS` (float64)
+    poses: np.ndarray
+
+    @classmethod
+    def empty(cls, size: int) -> PoseBatch:
+        """Uninitialized batch of `size` poses"""
+        return cls(
+            np.empty(size, dtype=np.int64),
+            np.empty((len(POSE_COLUMNS), size), dtype=np.float64),
+        )
+
+    @property
+    def size(self) -> int:
+        """Number of poses"""
+        return len(self.stamps)
+
+    @property
+    def seconds(self) -> np.ndarray:
+        """Header stamps, in seconds (float64), computed as `nanosec / 1e9 + sec`"""
+        sec, nanosec = np.divmod(self.stamps, 10**9)
+        return nanosec / 1e9 + sec
+
+    def column(self, name: str) -> np.ndarray:
+        """Column `name` of the poses
+
+        Args:
+            name: Column name, one of `POSE_COLUMNS`
+
+        Returns:
+            np.ndarray: Values of the column
+        """
+        return self.poses[POSE_COLUMNS.index(name)]
+
+
+def format_rows(columns: Sequence[np.ndarray], sep: str = " ") -> str:
+    """Format columns of numbers as lines of text, one row per line
+
+    Floats are formatted with their shortest representation, as `repr` does.
+    Conversions are vectorized : there is no Python object per value.
+
+    Args:
+        columns: Columns of the same length
+        sep: Separator between the values of a row. Defaults to " ".
+
+    Returns:
+        str: Lines of text, each ending with a newline
+    """
+    if not len(columns) or not len(columns[0]):
+        return ""
+    lines = np.asarray(columns[0]).astype(str)
+    for column in columns[1:]:
+        lines = np.char.add(np.char.add(lines, sep), np.asarray(column).astype(str))
+    return "\n".join(lines.tolist()) + "\n"
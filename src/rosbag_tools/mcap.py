@@ -0,0 +1,623 @@
+"""Standalone MCAP rosbags (.mcap files with the ros2 profile)
+
+MCAP files end with a summary section : schemas, channels, message statistics and
+the index of every chunk (time range, file offset and message count per channel).
+`McapReader` only reads the footer and the summary when it is opened, and seeks
+straight to the chunks that overlap a time window and hold a requested channel.
+`McapWriter` writes chunked MCAP files, with message indexes and a summary
+section, through the same interface as the rosbags ROS 2 `Writer`.
+"""
+
+from __future__ import annotations
+
+import heapq
+import zlib
+from collections import defaultdict
+from enum import IntEnum
+from io import BytesIO
+from itertools import chain
+from pathlib import Path
+from struct import Struct, iter_unpack, pack, unpack_from
+from typing import TYPE_CHECKING
+
+import zstandard
+from lz4.frame import compress as lz4_compress
+from rosbags.interfaces import Connection, ConnectionExtRosbag2, TopicInfo
+from rosbags.rosbag2 import ReaderError, WriterError
+from rosbags.rosbag2.storage_mcap import MCAPFile, msgsrc, read_string
+from rosbags.typesys.msg import generate_msgdef
+
+from rosbag_tools import __version__
+
+if TYPE_CHECKING:
+    from typing import (
+        BinaryIO,
+        Callable,
+        DefaultDict,
+        Dict,
+        Generator,
+        Iterable,
+        List,
+        Optional,
+        Tuple,
+    )
+
+MAGIC = b"\x89MCAP0\r\n"
+# Chunk compressions of the output files
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {
+    "": bytes,
+    "lz4": lz4_compress,
+    "zstd": zstandard.ZstdCompressor().compress,
+}
+# Opcode, record length, channel id, sequence, log time and publish time
+MESSAGE_HEADER = Struct("<BQHIQQ")
+
+
+class Opcode(IntEnum):
+    """Opcodes of the MCAP records"""
+
+    HEADER = 0x01
+    FOOTER = 0x02
+    SCHEMA = 0x03
+    CHANNEL = 0x04
+    MESSAGE = 0x05
+    CHUNK = 0x06
+    MESSAGE_INDEX = 0x07
+    CHUNK_INDEX = 0x08
+    STATISTICS = 0x0B
+    SUMMARY_OFFSET = 0x0E
+    DATA_END = 0x0F
+
+
+def is_mcap(path: Path | str) -> bool:
+    """Is `path` a standalone MCAP file ?"""
+    path = Path(path)
+    return path.suffix == ".mcap" and path.is_file()
+
+
+def _read_map(data: bytes) -> Dict[str, str]:
+    """Read a MCAP string map, without its length prefix"""
+    bio = BytesIO(data)
+    items = {}
+    while bio.tell() < len(data):
+        key = read_string(bio)
+        items[key] = read_string(bio)
+    return items
+
+
+class McapReader:
+    """McapReader - Reader of a standalone ROS 2 MCAP file, with the interface of the rosbags readers"""
+
+    def __init__(self, path: Path | str) -> None:
+        """Create a McapReader instance. The file is read when it is opened.
+
+        Args:
+            path: Path of the MCAP file
+        """
+        self.path = Path(path)
+        if not self.path.is_file():
+            raise ReaderError(f"File {str(self.path)!r} does not exist.")
+        self.connections: List[Connection] = []
+        self._file: Optional[MCAPFile] = None
+        self._start_time = 2**63 - 1
+        self._end_time = 0
+
+    def __enter__(self) -> McapReader:
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.close()
+        return False
+
+    def open(self) -> None:
+        """Open the file and read its summary section"""
+        mcap = MCAPFile(self.path)
+        mcap.open()
+        if not mcap.channels:
+            # No summary section : schemas and channels are in the data section
+            mcap.meta_scan()
+        self._file = mcap
+
+        schemas = {schema.name: schema for schema in mcap.schemas.values()}
+        self.connections = [
+            Connection(
+                id=cid,
+                topic=channel.topic,
+                msgtype=channel.schema,
+                msgdef=schemas[channel.schema].data,
+                digest=schemas[channel.schema].encoding[4:],
+                msgcount=0,
+                ext=ConnectionExtRosbag2(
+                    serialization_format=channel.message_encoding,
+                    offered_qos_profiles=_read_map(channel.metadata).get(
+                        "offered_qos_profiles", ""
+                    ),
+                ),
+                owner=self,
+            )
+            for cid, channel in sorted(mcap.channels.items())
+        ]
+        counts, self._start_time, self._end_time = self._read_statistics()
+        self.connections = [
+            conn._replace(msgcount=counts.get(conn.id, 0)) for conn in self.connections
+        ]
+
+    def _read_statistics(self) -> Tuple[Dict[int, int], int, int]:
+        """Message count of each channel, start time and end time of the file"""
+        mcap = self._file
+        if mcap.statistics is not None:
+            stats = mcap.statistics
+            counts = dict(iter_unpack("<HQ", stats.channel_message_counts))
+            if not stats.message_count:
+                return counts, 2**63 - 1, 0
+            return counts, stats.start_time, stats.end_time + 1
+        if mcap.chunks:
+            counts: Dict[int, int] = defaultdict(int)
+            for chunk in mcap.chunks:
+                for cid, count in chunk.channel_count.items():
+                    counts[cid] += count
+            if not sum(counts.values()):
+                return counts, 2**63 - 1, 0
+            return (
+                counts,
+                min(chunk.message_start_time for chunk in mcap.chunks),
+                max(chunk.message_end_time for chunk in mcap.chunks) + 1,
+            )
+        # Unindexed file : the statistics come from a scan of the messages
+        counts = defaultdict(int)
+        start, end = 2**63 - 1, 0
+        for conn, timestamp, _ in mcap.messages_scan(self.connections):
+            counts[conn.id] += 1
+            start, end = min(start, timestamp), max(end, timestamp + 1)
+        return counts, start, end
+
+    def close(self) -> None:
+        """Close the file"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def message_count(self) -> int:
+        """Total message count"""
+        return sum(conn.msgcount for conn in self.connections)
+
+    @property
+    def start_time(self) -> int:
+        """Timestamp in nanoseconds of the earliest message"""
+        return self._start_time
+
+    @property
+    def end_time(self) -> int:
+        """Timestamp in nanoseconds after the latest message"""
+        return self._end_time
+
+    @property
+    def duration(self) -> int:
+        """Duration in nanoseconds between earliest and latest messages"""
+        return max(self._end_time - self._start_time, 0)
+
+    @property
+    def topics(self) -> Dict[str, TopicInfo]:
+        """Topic information"""
+        topics: Dict[str, List[Connection]] = defaultdict(list)
+        for conn in self.connections:
+            topics[conn.topic].append(conn)
+        return {
+            topic: TopicInfo(
+                (
+                    conns[0].msgtype
+                    if all(conn.msgtype == conns[0].msgtype for conn in conns)
+                    else None
+                ),
+                conns[0].msgdef,
+                sum(conn.msgcount for conn in conns),
+                conns,
+            )
+            for topic, conns in topics.items()
+        }
+
+    def _chunks(
+        self, channels: Iterable[int], start: int, stop: int
+    ) -> List[Tuple[int, ...]]:
+        """Chunk indexes that overlap [start, stop[ and hold a message of `channels`"""
+        channels = set(channels)
+        return [
+            chunk
+            for chunk in self._file.chunks
+            if chunk.message_start_time < stop
+            and start <= chunk.message_end_time
+            and (
+                # Without message indexes, the channels of a chunk are unknown
+                not chunk.message_index_offsets
+                or any(chunk.channel_count.get(cid) for cid in channels)
+            )
+        ]
+
+    def messages(
+        self,
+        connections: Iterable[Connection] = (),
+        start: Optional[int] = None,
+        stop: Optional[int] = None,
+    ) -> Generator[Tuple[Connection, int, bytes], None, None]:
+        """Read messages from the file, in time order
+
+        Only the chunks that overlap [start, stop[ and hold a message of `connections`
+        are read and decompressed.
+
+        Args:
+            connections: Connections to read. An empty iterable reads all connections.
+            start: Yield only messages at or after this timestamp (ns). Defaults to None.
+            stop: Yield only messages before this timestamp (ns). Defaults to None.
+
+        Yields:
+            Tuple[Connection, int, bytes]: connection, timestamp (ns) and raw data of each message
+        """
+        if self._file is None:
+            raise ReaderError("Rosbag is not open.")
+        connections = list(connections) or self.connections
+        if not self._file.chunks:
+            yield from self._file.messages_scan(connections, start, stop)
+            return
+
+        start = 0 if start is None else start
+        stop = 2**63 - 1 if stop is None else stop
+        # Connection ids are the channel ids of the file
+        channel_map = {conn.id: conn for conn in connections}
+        sources = [
+            msgsrc(chunk, channel_map, start, stop, self._file.bio)
+            for chunk in self._chunks(channel_map, start, stop)
+        ]
+        for timestamp, _, conn, data in heapq.merge(*sources):
+            if conn is not None:
+                yield conn, timestamp, data
+
+    def count_messages(
+        self,
+        connections: Iterable[Connection] = (),
+        start: Optional[int] = None,
+        stop: Optional[int] = None,
+    ) -> int:
+        """Count the messages between two timestamps, from the chunk and message indexes
+
+        Chunks inside [start, stop[ are counted from the summary. Only the message
+        indexes of the chunks that cross `start` or `stop` are read.
+
+        Args:
+            connections: Connections to count. An empty iterable counts all connections.
+            start: Count only messages at or after this timestamp (ns). Defaults to None.
+            stop: Count only messages before this timestamp (ns). Defaults to None.
+
+        Returns:
+            int: Number of messages
+        """
+        if self._file is None:
+            raise ReaderError("Rosbag is not open.")
+        connections = list(connections) or self.connections
+        if start is None and stop is None:
+            return sum(conn.msgcount for conn in connections)
+        start = 0 if start is None else start
+        stop = 2**63 - 1 if stop is None else stop
+        channels = {conn.id for conn in connections}
+        if not all(chunk.message_index_offsets for chunk in self._file.chunks):
+            return sum(1 for _ in self.messages(connections, start, stop))
+
+        count = 0
+        bio = self._file.bio
+        for chunk in self._chunks(channels, start, stop):
+            if start <= chunk.message_start_time and chunk.message_end_time < stop:
+                count += sum(chunk.channel_count.get(cid, 0) for cid in channels)
+                continue
+            for cid, offset in chunk.message_index_offsets.items():
+                if cid not in channels:
+                    continue
+                # Opcode, record length, channel id and array length
+                bio.seek(offset + 11)
+                (size,) = unpack_from("<I", bio.read(4))
+                entries = bio.read(size)
+                count += sum(
+                    start <= timestamp < stop
+                    for timestamp, _ in iter_unpack("<QQ", entries)
+                )
+        return count
+
+
+def _string(value: str) -> bytes:
+    """Serialize a MCAP string"""
+    data = value.encode()
+    return pack("<I", len(data)) + data
+
+
+def _prefixed(data: bytes) -> bytes:
+    """Serialize MCAP bytes, a map or an array, with its uint32 length prefix"""
+    return pack("<I", len(data)) + data
+
+
+def _record(opcode: Opcode, content: bytes) -> bytes:
+    """Serialize a MCAP record"""
+    return pack("<BQ", opcode, len(content)) + content
+
+
+class McapWriter:
+    """McapWriter - Writer of standalone ROS 2 MCAP files, with the interface of the rosbags ROS 2 writer
+
+    Messages are grouped in chunks of `chunk_threshold` uncompressed bytes. Each
+    chunk is followed by the message indexes of its channels, and the file ends with
+    a summary section : schemas, channels, statistics and chunk indexes.
+    """
+
+    def __init__(self, path: Path | str) -> None:
+        """Create a McapWriter instance. The file is created when it is opened.
+
+        Args:
+            path: Path of the MCAP file
+        """
+        self.path = Path(path)
+        if self.path.exists():
+            raise WriterError(f"{path} exists already, not overwriting.")
+        self.connections: List[Connection] = []
+        self.compression = ""
+        # Size of the uncompressed chunks, in bytes
+        self.chunk_threshold = 1 * 2**20
+        self._bio: Optional[BinaryIO] = None
+        self._schemas: Dict[str, int] = {}
+        self._summary_schemas: List[bytes] = []
+        self._summary_channels: List[bytes] = []
+        self._chunk_indexes: List[bytes] = []
+        self._counts: DefaultDict[int, int] = defaultdict(int)
+        self._start_time = 2**64 - 1
+        self._end_time = 0
+        self._chunk = BytesIO()
+        self._chunk_start = 2**64 - 1
+        self._chunk_end = 0
+        self._index: DefaultDict[int, List[Tuple[int, int]]] = defaultdict(list)
+
+    def __enter__(self) -> McapWriter:
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.close()
+        return False
+
+    def set_compression(self, compression: str) -> None:
+        """Enable the compression of the chunks
+
+        Args:
+            compression: 'zstd', 'lz4', or '' for uncompressed chunks
+        """
+        if self._bio is not None:
+            raise WriterError(f"Cannot set compression, bag {self.path} is already open.")
+        if compression not in COMPRESSORS:
+            raise WriterError(f"Unknown MCAP compression {compression!r}.")
+        self.compression = compression
+
+    def open(self) -> None:
+        """Create the file and write its header"""
+        try:
+            self._bio = self.path.open("xb")
+        except FileExistsError:
+            raise WriterError(f"{self.path} exists already, not overwriting.") from None
+        self._bio.write(MAGIC)
+        self._bio.write(
+            _record(
+                Opcode.HEADER, _string("ros2") + _string(f"rosbag-tools {__version__}")
+            )
+        )
+
+    def add_connection(
+        self,
+        topic: str,
+        msgtype: str,
+        *,
+        msgdef: Optional[str] = None,
+        serialization_format: str = "cdr",
+        offered_qos_profiles: str = "",
+    ) -> Connection:
+        """Add a connection, written as a MCAP channel
+
+        Args:
+            topic: Topic name
+            msgtype: Message type
+            msgdef: ROS 2 message definition. Defaults to None, generated from the registered types.
+            serialization_format: Serialization format. Defaults to 'cdr'.
+            offered_qos_profiles: QoS profiles. Defaults to ''.
+
+        Raises:
+            WriterError: File not open, or connection added twice
+
+        Returns:
+            Connection: Connection object
+        """
+        if self._bio is None:
+            raise WriterError("Bag was not opened.")
+        ext = ConnectionExtRosbag2(
+            serialization_format=serialization_format,
+            offered_qos_profiles=offered_qos_profiles,
+        )
+        for conn in self.connections:
+            if conn.topic == topic and conn.msgtype == msgtype and conn.ext == ext:
+                raise WriterError(f"Connection can only be added once: {conn!r}.")
+
+        if msgdef is None:
+            msgdef, _ = generate_msgdef(msgtype, ros_version=2)
+        if msgtype not in self._schemas:
+            schema_id = len(self._schemas) + 1
+            record = _record(
+                Opcode.SCHEMA,
+                pack("<H", schema_id)
+                + _string(msgtype)
+                + _string("ros2msg")
+                + _prefixed(msgdef.encode()),
+            )
+            self._bio.write(record)
+            self._summary_schemas.append(record)
+            self._schemas[msgtype] = schema_id
+
+        conn = Connection(
+            id=len(self.connections) + 1,
+            topic=topic,
+            msgtype=msgtype,
+            msgdef=msgdef,
+            digest="msg",
+            msgcount=0,
+            ext=ext,
+            owner=self,
+        )
+        metadata = _string("offered_qos_profiles") + _string(offered_qos_profiles)
+        record = _record(
+            Opcode.CHANNEL,
+            pack("<HH", conn.id, self._schemas[msgtype])
+            + _string(topic)
+            + _string(serialization_format)
+            + _prefixed(metadata),
+        )
+        self._bio.write(record)
+        self._summary_channels.append(record)
+        self.connections.append(conn)
+        return conn
+
+    def write(self, connection: Connection, timestamp: int, data: bytes) -> None:
+        """Write a message
+
+        Args:
+            connection: Connection of the message, added with `add_connection`
+            timestamp: Message timestamp (ns)
+            data: Serialized message data
+        """
+        if self._bio is None:
+            raise WriterError("Bag was not opened.")
+        if connection.owner is not self:
+            raise WriterError(f"Tried to write to unknown connection {connection!r}.")
+        cid = connection.id
+        self._index[cid].append((timestamp, self._chunk.tell()))
+        self._chunk.write(
+            MESSAGE_HEADER.pack(
+                Opcode.MESSAGE,
+                22 + len(data),
+                cid,
+                self._counts[cid],
+                timestamp,
+                timestamp,
+            )
+        )
+        self._chunk.write(data)
+        self._counts[cid] += 1
+        self._chunk_start = min(self._chunk_start, timestamp)
+        self._chunk_end = max(self._chunk_end, timestamp)
+        if self._chunk.tell() >= self.chunk_threshold:
+            self._write_chunk()
+
+    def _write_chunk(self) -> None:
+        """Write the chunk in progress, followed by its message indexes"""
+        records = self._chunk.getvalue()
+        if not records:
+            return
+        bio = self._bio
+        compressed = COMPRESSORS[self.compression](records)
+        chunk_offset = bio.tell()
+        content = (
+            pack(
+                "<QQQI",
+                self._chunk_start,
+                self._chunk_end,
+                len(records),
+                zlib.crc32(records),
+            )
+            + _string(self.compression)
+            + pack("<Q", len(compressed))
+        )
+        bio.write(pack("<BQ", Opcode.CHUNK, len(content) + len(compressed)))
+        bio.write(content)
+        bio.write(compressed)
+        chunk_length = bio.tell() - chunk_offset
+
+        index_offsets = []
+        for cid, entries in sorted(self._index.items()):
+            index_offsets.append(pack("<HQ", cid, bio.tell()))
+            entries.sort()
+            array = pack(f"<{2 * len(entries)}Q", *chain.from_iterable(entries))
+            bio.write(_record(Opcode.MESSAGE_INDEX, pack("<H", cid) + _prefixed(array)))
+        index_length = bio.tell() - chunk_offset - chunk_length
+
+        self._chunk_indexes.append(
+            _record(
+                Opcode.CHUNK_INDEX,
+                pack(
+                    "<QQQQ",
+                    self._chunk_start,
+                    self._chunk_end,
+                    chunk_offset,
+                    chunk_length,
+                )
+                + _prefixed(b"".join(index_offsets))
+                + pack("<Q", index_length)
+                + _string(self.compression)
+                + pack("<QQ", len(compressed), len(records)),
+            )
+        )
+        self._start_time = min(self._start_time, self._chunk_start)
+        self._end_time = max(self._end_time, self._chunk_end)
+        self._chunk = BytesIO()
+        self._chunk_start, self._chunk_end = 2**64 - 1, 0
+        self._index = defaultdict(list)
+
+    def close(self) -> None:
+        """Write the last chunk, the summary section and the footer, then close the file"""
+        if self._bio is None:
+            return
+        self._write_chunk()
+        bio = self._bio
+        bio.write(_record(Opcode.DATA_END, pack("<I", 0)))
+
+        # Summary section, in groups of records of the same opcode
+        summary_start = bio.tell()
+        message_count = sum(self._counts.values())
+        channel_counts = b"".join(
+            pack("<HQ", cid, count) for cid, count in sorted(self._counts.items())
+        )
+        statistics = _record(
+            Opcode.STATISTICS,
+            pack(
+                "<QHIIIIQQ",
+                message_count,
+                len(self._schemas),
+                len(self.connections),
+                0,
+                0,
+                len(self._chunk_indexes),
+                self._start_time if message_count else 0,
+                self._end_time if message_count else 0,
+            )
+            + _prefixed(channel_counts),
+        )
+        groups = [
+            (Opcode.SCHEMA, self._summary_schemas),
+            (Opcode.CHANNEL, self._summary_channels),
+            (Opcode.STATISTICS, [statistics]),
+            (Opcode.CHUNK_INDEX, self._chunk_indexes),
+        ]
+        summary = BytesIO()
+        offsets = []
+        for opcode, records in groups:
+            if not records:
+                continue
+            group_start = summary_start + summary.tell()
+            summary.write(b"".join(records))
+            group_length = summary_start + summary.tell() - group_start
+            offsets.append(
+                _record(
+                    Opcode.SUMMARY_OFFSET, pack("<BQQ", opcode, group_start, group_length)
+                )
+            )
+        summary_offset_start = summary_start + summary.tell()
+        summary.write(b"".join(offsets))
+
+        footer = pack("<BQQQ", Opcode.FOOTER, 20, summary_start, summary_offset_start)
+        crc = zlib.crc32(footer, zlib.crc32(summary.getvalue()))
+        bio.write(summary.getvalue())
+        bio.write(footer + pack("<I", crc))
+        bio.write(MAGIC)
+        bio.close()
+        self._bio = None
@@ -0,0 +1,190 @@
+"""Lightweight rosbag summaries
+
+Start time, end time and topics of a rosbag are stored in a few kilobytes of
+metadata : `metadata.yaml` for ROS 2 rosbags, the bag header followed by the
+connection and chunk info records at the end of the file for ROS 1 rosbags, the
+summary section at the end of the file for MCAP files.
+Reading them directly avoids building a full rosbags `Reader`, which parses the
+index of every chunk of a ROS 1 bag.
+"""
+
+from __future__ import annotations
+
+import re
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple
+
+import yaml
+from rosbags.rosbag1 import ReaderError as ReaderError1
+from rosbags.rosbag1.reader import (
+    Header,
+    RecordType,
+    normalize,
+    normalize_msgtype,
+    read_uint32,
+)
+from rosbags.rosbag2 import ReaderError as ReaderError2
+
+from rosbag_tools.mcap import McapReader, is_mcap
+
+if TYPE_CHECKING:
+    from typing import BinaryIO, Dict, List, Optional, Tuple
+
+
+class BagSummary(NamedTuple):
+    """Summary of a rosbag, with the same time conventions as rosbags readers"""
+
+    path: Path
+    start_time: int
+    end_time: int
+    message_count: int
+    msgtypes: Dict[str, Optional[str]]
+    topic_counts: Dict[str, int]
+
+    @property
+    def duration(self) -> int:
+        """Duration in nanoseconds between earliest and latest messages"""
+        return max(self.end_time - self.start_time, 0)
+
+    @property
+    def topics(self) -> List[str]:
+        """Topics of the rosbag"""
+        return list(self.msgtypes)
+
+
+def read_summary(path: Path | str) -> BagSummary:
+    """Read the summary of a rosbag without reading its messages or its chunk index
+
+    Args:
+        path: Path of a ROS 1 rosbag file, of a ROS 2 rosbag directory or of a MCAP file
+
+    Returns:
+        BagSummary: Summary of the rosbag
+    """
+    path = Path(path)
+    if path.is_dir():
+        return _read_rosbag2_summary(path)
+    if is_mcap(path):
+        return _read_mcap_summary(path)
+    return _read_rosbag1_summary(path)
+
+
+def _read_connection_topic(bio: BinaryIO) -> Tuple[int, str, str]:
+    """Read the id, topic and message type of a ROS 1 connection record"""
+    header = Header.read(bio, RecordType.CONNECTION)
+    conn = header.get_uint32("conn")
+    topic = normalize(header.get_string("topic"))
+    data = Header.read(bio)
+    return conn, topic, normalize_msgtype(data.get_string("type"))
+
+
+def _read_chunk_info(bio: BinaryIO) -> Tuple[int, int, Dict[int, int]]:
+    """Read the start time, end time and connection counts of a ROS 1 chunk info record"""
+    header = Header.read(bio, RecordType.CHUNK_INFO)
+    ver = header.get_uint32("ver")
+    if ver != 1:
+        raise ReaderError1(f"CHUNK_INFO version {ver} is not supported.")
+    count = header.get_uint32("count")
+    start_time = header.get_time("start_time") if count else 2**63 - 1
+    end_time = header.get_time("end_time") + 1 if count else 0
+    read_uint32(bio)  # Data length
+    counts = {read_uint32(bio): read_uint32(bio) for _ in range(count)}
+    return start_time, end_time, counts
+
+
+def _read_rosbag1_summary(path: Path) -> BagSummary:
+    """Read the summary of a ROS 1 rosbag from its header and index records"""
+    try:
+        bio = path.open("rb")
+    except OSError as err:
+        raise ReaderError1(f"Could not open file {str(path)!r}: {err.strerror}.") from err
+
+    with bio:
+        magic = bio.readline().decode()
+        if not magic:
+            raise ReaderError1(f"File {str(path)!r} seems to be empty.")
+        if not re.match(r"#ROSBAG V2.0\n", magic):
+            raise ReaderError1("File magic is invalid or bag version is not supported.")
+
+        header = Header.read(bio, RecordType.BAGHEADER)
+        index_pos = header.get_uint64("index_pos")
+        conn_count = header.get_uint32("conn_count")
+        chunk_count = header.get_uint32("chunk_count")
+        if index_pos == 0:
+            raise ReaderError1("Bag is not indexed, reindex before reading.")
+
+        connections = []
+        chunk_infos = []
+        if chunk_count:
+            bio.seek(index_pos)
+            try:
+                connections = [_read_connection_topic(bio) for _ in range(conn_count)]
+                chunk_infos = [_read_chunk_info(bio) for _ in range(chunk_count)]
+            except ReaderError1 as err:
+                raise ReaderError1(f"Bag index looks damaged: {err.args}") from None
+
+    conn_counts: Dict[int, int] = {}
+    for _, _, counts in chunk_infos:
+        for cid, count in counts.items():
+            conn_counts[cid] = conn_counts.get(cid, 0) + count
+
+    msgtypes: Dict[str, Optional[str]] = {}
+    topic_counts: Dict[str, int] = {}
+    for cid, topic, msgtype in sorted(connections, key=lambda x: x[1]):
+        # Topics recorded with several message types have no single type
+        msgtypes[topic] = msgtype if msgtypes.get(topic, msgtype) == msgtype else None
+        topic_counts[topic] = topic_counts.get(topic, 0) + conn_counts.get(cid, 0)
+
+    return BagSummary(
+        path,
+        min((x[0] for x in chunk_infos), default=2**63 - 1),
+        max((x[1] for x in chunk_infos), default=0),
+        sum(topic_counts.values()),
+        msgtypes,
+        topic_counts,
+    )
+
+
+def _read_rosbag2_summary(path: Path) -> BagSummary:
+    """Read the summary of a ROS 2 rosbag from its metadata file"""
+    yamlpath = path / "metadata.yaml"
+    try:
+        with open(yamlpath, "r", encoding="utf-8") as file:
+            dct = yaml.safe_load(file)
+    except OSError as err:
+        raise ReaderError2(f"Could not read metadata at {yamlpath}: {err}.") from None
+    except yaml.YAMLError as exc:
+        raise ReaderError2(f"Could not load YAML from {yamlpath}: {exc}") from None
+
+    try:
+        metadata = dct["rosbag2_bagfile_information"]
+        message_count = metadata["message_count"]
+        start_time = metadata["starting_time"]["nanoseconds_since_epoch"]
+        duration = metadata["duration"]["nanoseconds"] + 1
+        msgtypes = {}
+        topic_counts = {}
+        for topic in metadata["topics_with_message_count"]:
+            name = topic["topic_metadata"]["name"]
+            msgtypes[name] = topic["topic_metadata"]["type"]
+            topic_counts[name] = topic["message_count"]
+    except (KeyError, TypeError) as exc:
+        raise ReaderError2(f"A metadata key is missing {exc!r}.") from None
+
+    end_time = start_time + duration
+    if not message_count:
+        start_time, end_time = 2**63 - 1, 0
+    return BagSummary(path, start_time, end_time, message_count, msgtypes, topic_counts)
+
+
+def _read_mcap_summary(path: Path) -> BagSummary:
+    """Read the summary of a MCAP file from its summary section"""
+    with McapReader(path) as reader:
+        topics = reader.topics
+        return BagSummary(
+            path,
+            reader.start_time,
+            reader.end_time,
+            reader.message_count,
+            {topic: info.msgtype for topic, info in topics.items()},
+            {topic: info.msgcount for topic, info in topics.items()},
+        )
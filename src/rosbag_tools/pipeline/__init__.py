@@ -0,0 +1,27 @@
+"""Chain clip, topic removal, decimation and split over a single read of a rosbag"""
+
+from rosbag_tools.utils import lazy_getattr
+
+from .main import cli as pipeline
+
+__all__ = (
+    "BagPipeline",
+    "Decimate",
+    "SplitRouter",
+    "Stage",
+    "TimeWindow",
+    "TopicFilter",
+    "pipeline",
+)
+
+__getattr__ = lazy_getattr(
+    __name__,
+    {
+        "BagPipeline": ".pipeline",
+        "Decimate": ".pipeline",
+        "SplitRouter": ".pipeline",
+        "Stage": ".pipeline",
+        "TimeWindow": ".pipeline",
+        "TopicFilter": ".pipeline",
+    },
+)
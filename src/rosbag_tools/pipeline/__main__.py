@@ -0,0 +1,9 @@
+"""ROSbag streaming pipeline
+
+Clip, filter topics, decimate and split a rosbag in a single pass
+"""
+
+from rosbag_tools.pipeline import pipeline
+
+if __name__ == "__main__":
+    pipeline()
@@ -0,0 +1,162 @@
+import json
+from pathlib import Path
+
+import click
+
+from rosbag_tools.utils import (
+    check_writer_options,
+    compression_options,
+    custom_message_path,
+    profile_option,
+    quiet_option,
+)
+
+
+@click.command(
+    "pipeline",
+    short_help="clip, filter topics, decimate and split a rosbag in a single pass",
+)
+@click.argument(
+    "inbag",
+    required=True,
+    type=click.Path(exists=True),
+)
+@click.option(
+    "-o",
+    "--output",
+    "--outbag",
+    "outbag",
+    help="Output bag, or basename of the output bags when splitting. Defaults to INBAG_pipeline",
+)
+@click.option(
+    "-s",
+    "--start",
+    "start_time",
+    default=None,
+    type=click.FLOAT,
+    help="Start of the time window, in elapsed seconds since the start of the rosbag",
+)
+@click.option(
+    "-e",
+    "--end",
+    "end_time",
+    default=None,
+    type=click.FLOAT,
+    help="End of the time window, in elapsed seconds since the start of the rosbag",
+)
+@click.option(
+    "-r",
+    "--remove-topic",
+    "removed_topics",
+    type=click.STRING,
+    multiple=True,
+    help="Topic or topic pattern to remove. Can be repeated.",
+)
+@click.option(
+    "-k",
+    "--keep-topic",
+    "kept_topics",
+    type=click.STRING,
+    multiple=True,
+    help="Topic or topic pattern to keep, every other topic is removed. Can be repeated.",
+)
+@click.option(
+    "--decimate",
+    "decimation",
+    default=None,
+    type=click.IntRange(min=1),
+    help="Keep one message out of N on the decimated topics",
+)
+@click.option(
+    "--decimate-topic",
+    "decimated_topics",
+    type=click.STRING,
+    multiple=True,
+    help="Topic or topic pattern to decimate. Can be repeated. Defaults to every topic.",
+)
+@click.option(
+    "-t",
+    "--split-timestamps",
+    "timestamps",
+    default=None,
+    type=str,
+    help="List of split timestamps in the format '[S., S.]', in elapsed seconds since the start of the rosbag",
+)
+@click.option(
+    "--max-open-writers",
+    "max_open_writers",
+    default=2,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Maximum number of output bag files that are open at once",
+)
+@click.option(
+    "-f",
+    "--force-overwriting",
+    "force",
+    help="Force output file overwriting",
+    is_flag=True,
+)
+@compression_options
+@profile_option
+@quiet_option
+@custom_message_path
+def cli(
+    inbag,
+    outbag,
+    start_time,
+    end_time,
+    removed_topics,
+    kept_topics,
+    decimation,
+    decimated_topics,
+    timestamps,
+    max_open_writers,
+    force,
+    writer_options,
+):
+    """Clip, filter topics, decimate and split INBAG in a single pass
+
+    INBAG is the path to a rosbag file
+    Can be a bag in ROS 1 or in ROS 2
+
+    Stages are applied in this order : time window, topic filters, decimation, split.
+    """
+    # Tools are imported here, to keep the CLI startup fast
+    from rosbag_tools.pipeline.pipeline import (
+        BagPipeline,
+        Decimate,
+        SplitRouter,
+        TimeWindow,
+        TopicFilter,
+    )
+
+    if decimated_topics and decimation is None:
+        raise click.UsageError("--decimate-topic can only be used with --decimate.")
+
+    stages = []
+    if start_time is not None or end_time is not None:
+        stages.append(TimeWindow(start_time, end_time))
+    if kept_topics:
+        stages.append(TopicFilter(kept_topics, keep=True))
+    if removed_topics:
+        stages.append(TopicFilter(removed_topics))
+    if decimation is not None:
+        stages.append(Decimate(decimation, decimated_topics or ("*",)))
+    if timestamps is not None:
+        stages.append(SplitRouter([float(t) for t in json.loads(timestamps)]))
+
+    if outbag:
+        outpath = Path(outbag)
+    else:
+        inpath = Path(inbag)
+        outpath = inpath.with_name(f"{inpath.stem}_pipeline{inpath.suffix}")
+    check_writer_options(writer_options, [outpath])
+
+    with BagPipeline(inbag, stages) as pipeline:
+        pipeline.run(
+            outpath,
+            force_out=force,
+            max_open_writers=max_open_writers,
+            writer_options=writer_options,
+        )
@@ -0,0 +1,331 @@
+"""Streaming pipeline of rosbag operations
+
+A pipeline reads the input rosbag once and sends every message through a chain
+of stages : time window, topic filter, decimation, split router. Only the final
+outputs are written, without intermediate rosbags.
+"""
+
+from __future__ import annotations
+
+import fnmatch
+from pathlib import Path
+from typing import TYPE_CHECKING, List
+
+from rosbags.interfaces import Connection
+
+from rosbag_tools import exceptions
+from rosbag_tools.base import ROSBagTool
+from rosbag_tools.clip.clipper import clip_window
+from rosbag_tools.conversion import session_converter
+from rosbag_tools.profiling import profile_messages, profile_write
+from rosbag_tools.progress import Progress
+from rosbag_tools.reading import count_messages, read_messages
+from rosbag_tools.split.splitter import section_indices
+from rosbag_tools.topic_remove.topic_remover import BagTopicRemover
+from rosbag_tools.writers import WriterOptions, WriterPool, writer_factory
+
+if TYPE_CHECKING:
+    from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+    from rosbag_tools.session import BagSession
+
+    # Connection, timestamp (ns), raw data and output indices of a message
+    Message = Tuple[Connection, int, bytes, Tuple[int, ...]]
+
+
+class Stage:
+    """Stage - Base class of a pipeline stage
+
+    A stage can narrow what is read from the input rosbag (connections and time
+    window) and transforms the stream of messages. Each message carries the
+    indices of the outputs it is written to.
+    """
+
+    def bind(self, session: BagSession) -> None:
+        """Resolve the stage parameters against the input rosbag
+
+        Args:
+            session: Session of the input rosbag
+        """
+
+    def select(self, connections: List[Connection]) -> List[Connection]:
+        """Connections that can go through the stage
+
+        Args:
+            connections: Connections of the input rosbag
+
+        Returns:
+            List[Connection]: Connections to read
+        """
+        return connections
+
+    def window(self) -> Tuple[Optional[int], Optional[int]]:
+        """Time window (ns) of the messages that can go through the stage
+
+        Returns:
+            Tuple[Optional[int], Optional[int]]: First timestamp and timestamp after the last one. None is unbounded.
+        """
+        return None, None
+
+    def process(self, messages: Iterator[Message]) -> Iterator[Message]:
+        """Transform the stream of messages
+
+        Args:
+            messages: Incoming messages
+
+        Yields:
+            Message: Outgoing messages
+        """
+        yield from messages
+
+
+class TimeWindow(Stage):
+    """TimeWindow - Keep the messages between two elapsed times, as `clip` does"""
+
+    def __init__(self, start: float | None = None, end: float | None = None) -> None:
+        """Create a TimeWindow stage
+
+        Args:
+            start: Start of the window, in seconds relative to the beginning of the bag. If None, the window starts at the beginning of the rosbag.
+            end: End of the window, in seconds relative to the beginning of the bag. If None, the window stops at the end of the rosbag.
+        """
+        if start is not None and end is not None and end < start:
+            raise exceptions.InvalidTimestampError(
+                f"Start time (s: {start}) should come " f"before ending time (e: {end})."
+            )
+        self.start = start
+        self.end = end
+        self._window: Tuple[int, int] = None
+
+    def bind(self, session: BagSession) -> None:
+        self._window = clip_window(
+            session.start_time, session.end_time, self.start, self.end
+        )
+
+    def window(self) -> Tuple[Optional[int], Optional[int]]:
+        return self._window
+
+    def process(self, messages: Iterator[Message]) -> Iterator[Message]:
+        w_start, w_stop = self._window
+        for message in messages:
+            if w_start <= message[1] < w_stop:
+                yield message
+
+
+class TopicFilter(Stage):
+    """TopicFilter - Remove topics from the stream, as `topic-remove` does"""
+
+    def __init__(self, patterns: Sequence[str] | str, keep: bool = False) -> None:
+        """Create a TopicFilter stage
+
+        Args:
+            patterns: Topic names or glob patterns
+            keep: If True, keep only the topics that match `patterns` instead of removing them. Defaults to False.
+        """
+        self.patterns = (patterns,) if isinstance(patterns, str) else tuple(patterns)
+        self.keep = keep
+        self._topics: Tuple[str] = None
+
+    def bind(self, session: BagSession) -> None:
+        remaining = BagTopicRemover.filter_out_topics(session.topics, self.patterns)
+        if self.keep:
+            remaining = tuple(t for t in session.topics if t not in remaining)
+        self._topics = remaining
+
+    @property
+    def topics(self) -> Tuple[str]:
+        """Topics that go through the stage"""
+        return self._topics
+
+    def select(self, connections: List[Connection]) -> List[Connection]:
+        topics = set(self._topics)
+        return [conn for conn in connections if conn.topic in topics]
+
+    def process(self, messages: Iterator[Message]) -> Iterator[Message]:
+        topics = set(self._topics)
+        for message in messages:
+            if message[0].topic in topics:
+                yield message
+
+
+class Decimate(Stage):
+    """Decimate - Keep one message out of `factor` on some topics"""
+
+    def __init__(self, factor: int, patterns: Sequence[str] | str = ("*",)) -> None:
+        """Create a Decimate stage
+
+        Args:
+            factor: Keep one message out of `factor`, on each decimated topic
+            patterns: Topic names or glob patterns of the decimated topics. Defaults to every topic.
+        """
+        if factor < 1:
+            raise ValueError(f"Decimation factor should be at least 1 [got {factor}]")
+        self.factor = factor
+        self.patterns = (patterns,) if isinstance(patterns, str) else tuple(patterns)
+
+    def process(self, messages: Iterator[Message]) -> Iterator[Message]:
+        counters: Dict[str, int] = {}
+        decimated: Dict[str, bool] = {}
+        for message in messages:
+            topic = message[0].topic
+            if topic not in decimated:
+                decimated[topic] = any(fnmatch.fnmatch(topic, p) for p in self.patterns)
+            if not decimated[topic]:
+                yield message
+                continue
+            count = counters.get(topic, 0)
+            counters[topic] = count + 1
+            if count % self.factor == 0:
+                yield message
+
+
+class SplitRouter(Stage):
+    """SplitRouter - Send the messages to one output per section, as `split` does"""
+
+    def __init__(self, timestamps: Sequence[float]) -> None:
+        """Create a SplitRouter stage
+
+        Args:
+            timestamps: Split times, in seconds relative to the beginning of the bag
+        """
+        self.timestamps = sorted(timestamps)
+        self._inner_bounds: List[float] = None
+
+    @property
+    def n_outputs(self) -> int:
+        """Number of sections"""
+        return len(self.timestamps) + 1
+
+    def bind(self, session: BagSession) -> None:
+        duration = session.duration / 1e9
+        for ts in self.timestamps:
+            if not 0 <= ts <= duration:
+                raise exceptions.InvalidTimestampError(
+                    f"Split time (s: {ts}) should be between "
+                    f"start time (s: 0) and ending time (s: {duration})."
+                )
+        self._inner_bounds = [ts * 1e9 + session.start_time for ts in self.timestamps]
+
+    def process(self, messages: Iterator[Message]) -> Iterator[Message]:
+        for conn, timestamp, data, _ in messages:
+            yield conn, timestamp, data, section_indices(self._inner_bounds, timestamp)
+
+
+class BagPipeline(ROSBagTool):
+    """BagPipeline - Chain rosbag operations over a single read of the input rosbag"""
+
+    def __init__(self, path: Path | str, stages: Sequence[Stage] = ()) -> None:
+        """Create a BagPipeline instance
+
+        Args:
+            path: Path to the input rosbag
+            stages: Stages of the pipeline, applied in order. Defaults to no stage.
+        """
+        super().__init__(path, "pipeline")
+        self.stages: List[Stage] = list(stages)
+
+    def add(self, stage: Stage) -> BagPipeline:
+        """Append a stage to the pipeline
+
+        Args:
+            stage: Stage to append
+
+        Returns:
+            BagPipeline: The pipeline, to chain calls
+        """
+        self.stages.append(stage)
+        return self
+
+    def export_paths(self, outbag_path: Path | str) -> List[Path]:
+        """Paths of the outputs of the pipeline
+
+        Args:
+            outbag_path: Path of output bag. With a split router, sections are exported in `outbag_path_[1-N]`.
+
+        Returns:
+            List[Path]: Output paths
+        """
+        base_path = Path(outbag_path)
+        routers = [stage for stage in self.stages if isinstance(stage, SplitRouter)]
+        if len(routers) > 1:
+            raise ValueError("A pipeline can only have one split router")
+        if not routers:
+            return [base_path]
+        return [
+            base_path.with_name(f"{base_path.stem}_{idx:02d}{base_path.suffix}")
+            for idx in range(1, routers[0].n_outputs + 1)
+        ]
+
+    def run(
+        self,
+        outbag_path: Path | str,
+        force_out: bool = False,
+        max_open_writers: int = 2,
+        writer_options: Optional[WriterOptions] = None,
+    ) -> List[Path]:
+        """Read the input rosbag once, send its messages through the stages and write the outputs
+
+        Args:
+            outbag_path (Path | str): Path of output bag. With a split router, sections are exported in `outbag_path_[1-N]`.
+            force_out (bool): Force output bag overwriting, if outbag already exists. Defaults to False.
+            max_open_writers (int): Maximum number of output bags that are open at once. Defaults to 2.
+            writer_options (WriterOptions, optional): Settings of the output rosbags : compression, chunk size and compression threads. Defaults to None, the writer defaults.
+
+        Returns:
+            List[Path]: Output paths
+        """
+        export_paths = self.export_paths(outbag_path)
+        Writer = self.get_writer_class(export_paths[0])
+        self._converter = session_converter(self.session, self._is_ros1_writer)
+        Writer = writer_factory(Writer, writer_options)
+        for export_path in export_paths:
+            self._check_export_path(export_path, force_out)
+
+        # Narrow what is read : connections and time window allowed by every stage
+        connections = self.session.connections
+        start, stop = None, None
+        for stage in self.stages:
+            stage.bind(self.session)
+            connections = stage.select(connections)
+            w_start, w_stop = stage.window()
+            if w_start is not None:
+                start = w_start if start is None else max(start, w_start)
+            if w_stop is not None:
+                stop = w_stop if stop is None else min(stop, w_stop)
+        if start is not None and stop is not None:
+            stop = max(start, stop)
+
+        reader = self.session.reader
+        written = [conn for conn in connections if conn.topic != "/events/write_split"]
+        with WriterPool(
+            export_paths,
+            Writer,
+            written,
+            self._add_writer_connections,
+            max_open=max_open_writers,
+        ) as pool:
+            if connections:
+                msgcount = count_messages(reader, connections, start, stop)
+                with Progress(total=msgcount) as progress:
+
+                    def stream() -> Iterator[Message]:
+                        messages = read_messages(reader, connections, start, stop)
+                        for conn, timestamp, data in profile_messages("read", messages):
+                            progress.update(1, len(data))
+                            yield conn, timestamp, data, (0,)
+
+                    messages = stream()
+                    for stage in self.stages:
+                        messages = profile_messages(
+                            f"stage:{type(stage).__name__}", stage.process(messages)
+                        )
+                    if self._converter is not None:
+                        # Only the messages that went through every stage are converted
+                        messages = self._converter.convert_messages(messages, written)
+                    write = profile_write("write", pool.write)
+                    for conn, timestamp, data, outputs in messages:
+                        for out in outputs:
+                            write(out, conn, timestamp, data)
+
+        print(f"[pipeline] Done ! Exported in {', '.join(str(p) for p in export_paths)}")
+        return export_paths
@@ -0,0 +1,293 @@
+"""Read messages ahead of the writes, in a background thread
+
+Without prefetching, the tools read (and decompress) a message, then write (and
+compress) it, then read the next one : reading and writing never overlap. With
+prefetching, a reader thread fills a bounded buffer of messages (or of ROS 1
+chunks, see `ChunkCopier.read_chunks`) while the main thread writes them.
+Decompression (lz4, bz2, zstd) and file reads release the GIL, so that they run
+while the main thread writes the output rosbags.
+
+The buffer is bounded both in number of messages and in bytes : a slow writer
+blocks the reader thread instead of filling the memory.
+"""
+
+from __future__ import annotations
+
+import copy
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import TYPE_CHECKING
+
+from rosbags.rosbag1 import Reader as Reader1
+
+from rosbag_tools.mcap import McapReader
+from rosbag_tools.profiling import profile_messages, profile_stage
+from rosbag_tools.reading import read_messages
+
+if TYPE_CHECKING:
+    from typing import Any, Callable, Deque, Generator, Iterable, List, Optional, Tuple
+
+    from rosbags.interfaces import Connection
+    from rosbags.rosbag2 import Reader as Reader2
+
+    Message = Tuple[Connection, int, bytes]
+    # Number of messages and size in bytes of an item
+    Weigh = Callable[[Any], Tuple[int, int]]
+
+# Default maximum number of messages read ahead
+DEFAULT_DEPTH = 1024
+# Default maximum size of the messages read ahead, in bytes
+DEFAULT_MAX_BYTES = 64 * 2**20
+# Maximum number of messages handed over to the main thread at once
+BATCH_SIZE = 64
+
+
+def weigh_message(message: Message) -> Tuple[int, int]:
+    """Number of messages and size in bytes of a message"""
+    return 1, len(message[2])
+
+
+class MessageBuffer:
+    """MessageBuffer - Bounded buffer of message batches, shared by two threads"""
+
+    def __init__(self, depth: int, max_bytes: int) -> None:
+        """Create a MessageBuffer instance
+
+        Args:
+            depth: Maximum number of buffered messages
+            max_bytes: Maximum size of the buffered messages, in bytes
+        """
+        self.depth = depth
+        self.max_bytes = max_bytes
+        self._cond = threading.Condition()
+        self._batches: Deque[Tuple[List[Any], int, int]] = deque()
+        self._messages = 0
+        self._bytes = 0
+        self._done = False
+        self._cancelled = False
+        self._error: Optional[BaseException] = None
+
+    def put(self, batch: List[Any], messages: int, nbytes: int) -> bool:
+        """Add a batch of items, waiting for room in the buffer
+
+        A batch is always accepted by an empty buffer, even if it is larger than the limits.
+
+        Args:
+            batch: Items, e.g. messages
+            messages: Number of messages in the items
+            nbytes: Size of the items, in bytes
+
+        Returns:
+            bool: False if the buffer was cancelled by the consumer
+        """
+        with self._cond:
+            while (
+                not self._cancelled
+                and self._messages
+                and (
+                    self._messages + messages > self.depth
+                    or self._bytes + nbytes > self.max_bytes
+                )
+            ):
+                self._cond.wait()
+            if self._cancelled:
+                return False
+            self._batches.append((batch, messages, nbytes))
+            self._messages += messages
+            self._bytes += nbytes
+            self._cond.notify_all()
+            return True
+
+    def get(self) -> Optional[List[Any]]:
+        """Remove the oldest batch of items, waiting for the producer if needed
+
+        Raises:
+            BaseException: Error raised by the producer, once its items are consumed
+
+        Returns:
+            Optional[List[Any]]: Items. None when the producer is done.
+        """
+        with self._cond:
+            if not self._batches and not self._done:
+                # The writes wait for the reads
+                with profile_stage("prefetch-wait"):
+                    while not self._batches and not self._done:
+                        self._cond.wait()
+            if self._batches:
+                batch, messages, nbytes = self._batches.popleft()
+                self._messages -= messages
+                self._bytes -= nbytes
+                self._cond.notify_all()
+                return batch
+            if self._error is not None:
+                raise self._error
+            return None
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        """Mark the end of the items, with the error that stopped the producer"""
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+
+    def cancel(self) -> None:
+        """Stop the producer, the remaining items will not be consumed"""
+        with self._cond:
+            self._cancelled = True
+            self._batches.clear()
+            self._cond.notify_all()
+
+    @property
+    def cancelled(self) -> bool:
+        """Has the consumer stopped ?"""
+        return self._cancelled
+
+
+def _fill(
+    buffer: MessageBuffer, source: Callable[[], Iterable[Any]], weigh: Weigh
+) -> None:
+    """Read the items of `source` in `buffer`, by batches"""
+    items = None
+    try:
+        batch: List[Any] = []
+        messages, nbytes = 0, 0
+        batch_size = max(1, min(BATCH_SIZE, buffer.depth // 4))
+        batch_bytes = max(1, buffer.max_bytes // 4)
+        items = source()
+        for item in items:
+            batch.append(item)
+            count, size = weigh(item)
+            messages += count
+            nbytes += size
+            if messages >= batch_size or nbytes >= batch_bytes:
+                if not buffer.put(batch, messages, nbytes):
+                    return
+                batch, messages, nbytes = [], 0, 0
+            elif buffer.cancelled:
+                return
+        if batch:
+            buffer.put(batch, messages, nbytes)
+    except BaseException as exc:  # Raised again in the main thread
+        buffer.finish(exc)
+    else:
+        buffer.finish()
+    finally:
+        # Release the resources of a generator that is stopped early
+        if hasattr(items, "close"):
+            items.close()
+
+
+def read_ahead(
+    source: Callable[[], Iterable[Any]],
+    depth: int = DEFAULT_DEPTH,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+    weigh: Weigh = weigh_message,
+) -> Generator[Any, None, None]:
+    """Iterate over items that are read ahead in a background thread
+
+    `source` is called in the reader thread : objects that belong to a thread, such as
+    sqlite3 connections, can be created there. Errors of the reader thread are raised
+    by the iterator, after the items read before the error.
+
+    Args:
+        source: Function that returns the items to read, e.g. messages
+        depth: Maximum number of messages read ahead. Defaults to DEFAULT_DEPTH.
+        max_bytes: Maximum size of the items read ahead, in bytes. Defaults to DEFAULT_MAX_BYTES.
+        weigh: Function that returns the number of messages and the size of an item. Defaults to `weigh_message`.
+
+    Yields:
+        Any: Items of `source`, in the same order
+    """
+    if depth < 1:
+        raise ValueError(f"Prefetch depth should be at least 1 [got {depth}]")
+    buffer = MessageBuffer(depth, max_bytes)
+    thread = threading.Thread(
+        target=_fill,
+        args=(buffer, source, weigh),
+        name="rosbag-tools-prefetch",
+        daemon=True,
+    )
+    thread.start()
+    try:
+        while True:
+            batch = buffer.get()
+            if batch is None:
+                return
+            yield from batch
+    finally:
+        # Also stops the reader thread when the consumer stops early
+        buffer.cancel()
+        thread.join()
+
+
+@contextmanager
+def thread_reader(reader: Reader1 | Reader2) -> Generator[Reader1 | Reader2, None, None]:
+    """Reader that can be used in the current thread, while `reader` is not used
+
+    ROS 1 readers are shared, since they only hold a file. ROS 2 readers get their
+    own storage, opened in the current thread : sqlite3 connections can only be used
+    in the thread that opened them. MCAP readers get their own file, since chunks are
+    read with seeks on the file of the reader.
+
+    Args:
+        reader: Open rosbag reader
+
+    Yields:
+        Reader1 | Reader2: Open rosbag reader
+    """
+    if isinstance(reader, Reader1):
+        yield reader
+        return
+    if isinstance(reader, McapReader):
+        with McapReader(reader.path) as clone:
+            clone.connections = reader.connections
+            yield clone
+        return
+    storage = type(reader.storage)(reader.storage.paths, reader.connections)
+    storage.open()
+    try:
+        clone = copy.copy(reader)
+        clone.storage = storage
+        yield clone
+    finally:
+        storage.close()
+
+
+def prefetch_messages(
+    reader: Reader1 | Reader2,
+    connections: Iterable[Connection] = (),
+    windows: Iterable[Tuple[Optional[int], Optional[int]]] = ((None, None),),
+    depth: int = 0,
+    max_bytes: int = DEFAULT_MAX_BYTES,
+) -> Iterable[Message]:
+    """Read the messages of an open rosbag in time windows, optionally ahead in a thread
+
+    While the messages are iterated, `reader` should not be used by the caller.
+
+    Args:
+        reader: Open rosbag reader
+        connections: Connections to read. An empty iterable reads all connections.
+        windows: Start and stop timestamps (ns) of the windows, as in `read_messages`. Defaults to the whole rosbag.
+        depth: Maximum number of messages read ahead. If 0, messages are read in the current thread. Defaults to 0.
+        max_bytes: Maximum size of the messages read ahead, in bytes. Defaults to DEFAULT_MAX_BYTES.
+
+    Returns:
+        Iterable[Message]: connection, timestamp (ns) and raw data of each message
+    """
+    connections = list(connections)
+    windows = list(windows)
+
+    def source(reader=reader):
+        for start, stop in windows:
+            messages = read_messages(reader, connections, start, stop)
+            yield from profile_messages("read", messages)
+
+    if not depth:
+        return source()
+
+    def thread_source():
+        with thread_reader(reader) as treader:
+            yield from source(treader)
+
+    return read_ahead(thread_source, depth, max_bytes)
@@ -0,0 +1,433 @@
+"""Per-stage timing and throughput instrumentation of the rosbag tools
+
+The tools report what they do in named stages : opening the input rosbag,
+reading messages, decompressing ROS 1 chunks, copying chunks, mapping
+connections, writing and closing output rosbags. When a `Profiler` is active,
+each stage collects its wall time, message count and bytes, per topic, and how
+much the peak memory of the process grew during the stage. When no profiler is
+active, instrumentation is a no-op : message iterators and write functions are
+returned unchanged.
+
+Example:
+    >>> with Profiler() as profiler:
+    ...     BagSplitter("rosbag.bag").split_rosbag([10.0], "section.bag")
+    >>> print(profiler.summary())
+
+Stage times are exclusive : the time of a nested stage (e.g. `decompress` inside
+`read`) is not counted in its parent stage.
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import TYPE_CHECKING
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+if TYPE_CHECKING:
+    from typing import (
+        Any,
+        Callable,
+        Dict,
+        Iterable,
+        Iterator,
+        List,
+        Optional,
+        Tuple,
+        TypeVar,
+    )
+
+    from rosbags.interfaces import Connection
+
+    Message = TypeVar("Message", bound=tuple)
+    StageHook = Callable[[str, "StageStats"], None]
+    FinishHook = Callable[["Profiler"], None]
+
+_ACTIVE: Optional[Profiler] = None
+
+
+def get_profiler() -> Optional[Profiler]:
+    """Active profiler, or None if profiling is off"""
+    return _ACTIVE
+
+
+def peak_rss() -> Optional[int]:
+    """Peak resident memory of the process, in bytes. None if it is not available."""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class TopicStats:
+    """TopicStats - Messages, bytes and time of a topic in a stage"""
+
+    def __init__(self) -> None:
+        self.messages = 0
+        self.bytes = 0
+        self.time = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-compatible statistics"""
+        return {"messages": self.messages, "bytes": self.bytes, "time": self.time}
+
+
+class StageStats:
+    """StageStats - Wall time, messages, bytes and peak memory growth of a stage"""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.calls = 0
+        self.wall = 0.0
+        self.child = 0.0
+        self.messages = 0
+        self.bytes = 0
+        # Growth of the process peak RSS from the start to the end of each block of
+        # the stage, nested stages included (bytes). None for stages timed per call.
+        self.rss_growth: Optional[int] = None
+        self.topics: Dict[str, TopicStats] = {}
+
+    @property
+    def time(self) -> float:
+        """Time spent in the stage, without its nested stages (s)"""
+        return self.wall - self.child
+
+    @property
+    def msgs_per_s(self) -> float:
+        """Messages per second of stage time"""
+        return self.messages / self.time if self.time > 0 else 0.0
+
+    @property
+    def mb_per_s(self) -> float:
+        """Megabytes per second of stage time"""
+        return self.bytes / 1e6 / self.time if self.time > 0 else 0.0
+
+    def add_message(self, topic: str, nbytes: int, elapsed: float) -> None:
+        """Count a message of `topic` processed in `elapsed` seconds"""
+        self.messages += 1
+        self.bytes += nbytes
+        stats = self.topics.get(topic)
+        if stats is None:
+            stats = self.topics[topic] = TopicStats()
+        stats.messages += 1
+        stats.bytes += nbytes
+        stats.time += elapsed
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-compatible statistics"""
+        return {
+            "calls": self.calls,
+            "time": self.time,
+            "wall": self.wall,
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "msgs_per_s": self.msgs_per_s,
+            "mb_per_s": self.mb_per_s,
+            "rss_growth": self.rss_growth,
+            "topics": {topic: s.to_dict() for topic, s in self.topics.items()},
+        }
+
+
+class Profiler:
+    """Profiler - Collect the statistics of the stages of the tools while it is active"""
+
+    def __init__(self) -> None:
+        self.stages: Dict[str, StageStats] = {}
+        # Stack of the running stages of each thread : stats, start time, time of nested stages
+        self._local = threading.local()
+        self._stage_hooks: List[StageHook] = []
+        self._finish_hooks: List[FinishHook] = []
+        self._start: Optional[float] = None
+        self.total = 0.0
+        self._previous: Optional[Profiler] = None
+
+    def add_hook(self, event: str, callback: Callable) -> None:
+        """Register a callback on a profiling event
+
+        Args:
+            event: "stage" : `callback(name, stats)` is called at the end of each stage block
+                (not after each message of per-message stages, but after their loop).
+                "finish" : `callback(profiler)` is called when the profiler stops.
+            callback: Callback function
+        """
+        if event == "stage":
+            self._stage_hooks.append(callback)
+        elif event == "finish":
+            self._finish_hooks.append(callback)
+        else:
+            raise ValueError(
+                f"Unknown profiling event {event!r}. Use 'stage' or 'finish'."
+            )
+
+    def start(self) -> Profiler:
+        """Make the profiler active"""
+        global _ACTIVE
+        self._previous = _ACTIVE
+        _ACTIVE = self
+        self._start = time.perf_counter()
+        return self
+
+    def stop(self) -> None:
+        """Make the profiler inactive and call the finish hooks"""
+        global _ACTIVE
+        self.total += time.perf_counter() - self._start
+        _ACTIVE = self._previous
+        for callback in self._finish_hooks:
+            callback(self)
+
+    def __enter__(self) -> Profiler:
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.stop()
+        return False
+
+    def get_stage(self, name: str) -> StageStats:
+        """Statistics of stage `name`, created if needed"""
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats(name)
+        return stats
+
+    @property
+    def _stack(self) -> List[List]:
+        """Stack of the running stages of the current thread"""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self, name: str) -> List:
+        frame = [self.get_stage(name), time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        return frame
+
+    def _exit(self) -> float:
+        stack = self._stack
+        stats, start, child = stack.pop()
+        elapsed = time.perf_counter() - start
+        stats.wall += elapsed
+        stats.child += child
+        if stack:
+            stack[-1][2] += elapsed
+        return elapsed
+
+    def _end_block(self, stats: StageStats, start_rss: Optional[int]) -> None:
+        """Record the peak memory growth of a stage block and call the stage hooks
+
+        Args:
+            stats: Statistics of the stage
+            start_rss: Peak RSS of the process at the start of the block
+        """
+        stats.calls += 1
+        rss = peak_rss()
+        if rss is not None:
+            stats.rss_growth = (stats.rss_growth or 0) + rss - start_rss
+        for callback in self._stage_hooks:
+            callback(stats.name, stats)
+
+    @contextmanager
+    def stage(
+        self, name: str, messages: int = 0, nbytes: int = 0
+    ) -> Iterator[StageStats]:
+        """Time a block of code as stage `name`
+
+        Args:
+            name: Stage name
+            messages: Number of messages processed by the block. Defaults to 0.
+            nbytes: Number of bytes processed by the block. Defaults to 0.
+
+        Yields:
+            StageStats: Statistics of the stage
+        """
+        start_rss = peak_rss()
+        frame = self._enter(name)
+        try:
+            yield frame[0]
+        finally:
+            self._exit()
+            frame[0].messages += messages
+            frame[0].bytes += nbytes
+            self._end_block(frame[0], start_rss)
+
+    def track(
+        self, name: str, messages: Iterable[Tuple[Connection, int, bytes]]
+    ) -> Iterator[Tuple[Connection, int, bytes]]:
+        """Time the production of each message of an iterator as stage `name`
+
+        Args:
+            name: Stage name
+            messages: Messages, as (connection, timestamp, data, ...) tuples
+
+        Yields:
+            Tuple[Connection, int, bytes]: Messages of `messages`
+        """
+        stats = self.get_stage(name)
+        start_rss = peak_rss()
+        iterator = iter(messages)
+        while True:
+            self._enter(name)
+            try:
+                message = next(iterator)
+            except StopIteration:
+                self._exit()
+                break
+            except BaseException:
+                self._exit()
+                raise
+            elapsed = self._exit()
+            stats.add_message(message[0].topic, len(message[2]), elapsed)
+            yield message
+        self._end_block(stats, start_rss)
+
+    def timed(
+        self, name: str, func: Callable[..., Any], write: bool = True
+    ) -> Callable[..., Any]:
+        """Time each call of a function as stage `name`
+
+        Each call counts as a message. For write functions, the last three arguments
+        of `func` are the connection, the timestamp and the data of the message, as in
+        `Writer.write` and `WriterPool.write` : bytes and topics are counted too.
+
+        Args:
+            name: Stage name
+            func: Function to time
+            write: Is `func` a write function ? Defaults to True.
+
+        Returns:
+            Callable[..., Any]: Timed function
+        """
+        stats = self.get_stage(name)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            self._enter(name)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = self._exit()
+                if write:
+                    stats.add_message(args[-3].topic, len(args[-1]), elapsed)
+                else:
+                    stats.messages += 1
+
+        return wrapper
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-compatible statistics of every stage"""
+        return {
+            "total": self.total,
+            "peak_rss": peak_rss(),
+            "stages": {name: stats.to_dict() for name, stats in self.stages.items()},
+        }
+
+    def summary(self, topics: bool = True) -> str:
+        """Human-readable table of the stage statistics
+
+        Args:
+            topics: Add a line for each topic of the per-message stages. Defaults to True.
+
+        Returns:
+            str: Summary table
+        """
+        lines = [
+            f"{'stage':<24} {'time (s)':>9} {'share':>6} {'messages':>10} "
+            f"{'MB':>9} {'msgs/s':>10} {'MB/s':>8}"
+        ]
+        total = self.total or sum(s.time for s in self.stages.values())
+
+        def line(name, time_s, messages, nbytes):
+            share = 100 * time_s / total if total else 0.0
+            rate = messages / time_s if time_s > 0 else 0.0
+            mbps = nbytes / 1e6 / time_s if time_s > 0 else 0.0
+            return (
+                f"{name:<24} {time_s:>9.3f} {share:>5.1f}% {messages:>10} "
+                f"{nbytes / 1e6:>9.2f} {rate:>10.0f} {mbps:>8.1f}"
+            )
+
+        for stats in self.stages.values():
+            lines.append(line(stats.name, stats.time, stats.messages, stats.bytes))
+            if topics and len(stats.topics) > 1:
+                for topic, tstats in sorted(stats.topics.items()):
+                    lines.append(
+                        line(f"  {topic}", tstats.time, tstats.messages, tstats.bytes)
+                    )
+        other = self.total - sum(s.time for s in self.stages.values())
+        if self.total:
+            lines.append(line("(other)", max(other, 0.0), 0, 0))
+            lines.append(line("total", self.total, 0, 0))
+        rss = peak_rss()
+        if rss is not None:
+            lines.append(f"Process peak RSS: {rss / 1e6:.1f} MB")
+        return "\n".join(lines)
+
+
+@contextmanager
+def profile_stage(name: str, messages: int = 0, nbytes: int = 0) -> Iterator[None]:
+    """Time a block of code as stage `name`, if a profiler is active
+
+    Args:
+        name: Stage name
+        messages: Number of messages processed by the block. Defaults to 0.
+        nbytes: Number of bytes processed by the block. Defaults to 0.
+    """
+    if _ACTIVE is None:
+        yield
+        return
+    with _ACTIVE.stage(name, messages, nbytes):
+        yield
+
+
+def profile_messages(name: str, messages: Iterable[Message]) -> Iterable[Message]:
+    """Time the production of each message of an iterator as stage `name`, if a profiler is active
+
+    Args:
+        name: Stage name
+        messages: Messages, as (connection, timestamp, data, ...) tuples
+
+    Returns:
+        Iterable[Message]: `messages`, unchanged if no profiler is active
+    """
+    if _ACTIVE is None:
+        return messages
+    return _ACTIVE.track(name, messages)
+
+
+def profile_write(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    """Time each call of a write function as stage `name`, if a profiler is active
+
+    Args:
+        name: Stage name
+        func: Write function, whose last arguments are a connection, a timestamp and data
+
+    Returns:
+        Callable[..., Any]: `func`, unchanged if no profiler is active
+    """
+    if _ACTIVE is None:
+        return func
+    return _ACTIVE.timed(name, func)
+
+
+def profile_call(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+    """Time each call of a function as stage `name`, if a profiler is active
+
+    Each call counts as a message, e.g. for message deserialization.
+
+    Args:
+        name: Stage name
+        func: Function to time
+
+    Returns:
+        Callable[..., Any]: `func`, unchanged if no profiler is active
+    """
+    if _ACTIVE is None:
+        return func
+    return _ACTIVE.timed(name, func, write=False)
@@ -0,0 +1,134 @@
+"""Low-overhead progress reporting for message loops
+
+Updating a tqdm progress bar for every message costs more than writing a small
+message (IMU, odometry) in an output rosbag. A `Progress` counts messages and bytes
+in plain integers and only refreshes its progress bar every `batch_size` messages,
+with the message and byte throughputs.
+"""
+
+from __future__ import annotations
+
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from typing import Optional
+
+_QUIET = False
+
+
+def set_quiet(quiet: bool = True) -> None:
+    """Turn off (or back on) the progress bars of every tool
+
+    Args:
+        quiet (bool): If True, progress bars are not displayed. Defaults to True.
+    """
+    global _QUIET
+    _QUIET = quiet
+
+
+def is_quiet() -> bool:
+    """Are progress bars turned off ?"""
+    return _QUIET
+
+
+class Progress:
+    """Progress - Progress bar of a loop over messages, updated in batches"""
+
+    def __init__(
+        self,
+        total: Optional[int] = None,
+        desc: Optional[str] = None,
+        unit: str = "msg",
+        batch_size: int = 1000,
+        disable: Optional[bool] = None,
+    ) -> None:
+        """Create a Progress instance. The progress bar is displayed once it is open.
+
+        Args:
+            total: Expected number of units. Defaults to None, unknown.
+            desc: Description of the progress bar. Defaults to None.
+            unit: Unit of the counted items. Defaults to "msg".
+            batch_size: Number of units between two refreshes of the progress bar. Defaults to 1000.
+            disable: If True, nothing is displayed. Defaults to None, which follows `set_quiet`.
+        """
+        self.total = total
+        self.desc = desc
+        self.unit = unit
+        self.batch_size = max(batch_size, 1)
+        self.disable = is_quiet() if disable is None else disable
+        self.count = 0
+        self.nbytes = 0
+        self._displayed = 0
+        self._next_flush = self.batch_size
+        self._start: Optional[float] = None
+        self._bar = None
+
+    def open(self) -> Progress:
+        """Start timing and display the progress bar"""
+        self._start = time.perf_counter()
+        if not self.disable:
+            from tqdm import tqdm
+
+            self._bar = tqdm(total=self.total, desc=self.desc, unit=self.unit)
+        return self
+
+    def update(self, count: int = 1, nbytes: int = 0) -> None:
+        """Count processed units. The progress bar is refreshed every `batch_size` units.
+
+        Args:
+            count: Number of processed units. Defaults to 1.
+            nbytes: Number of processed bytes. Defaults to 0.
+        """
+        self.count += count
+        self.nbytes += nbytes
+        if self.count >= self._next_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        """Refresh the progress bar with the units counted since the last refresh"""
+        if self._bar is not None and self.count > self._displayed:
+            if self.nbytes:
+                self._bar.set_postfix_str(f"{self.mb_per_s:.1f} MB/s", refresh=False)
+            self._bar.update(self.count - self._displayed)
+        self._displayed = self.count
+        self._next_flush = self.count + self.batch_size
+
+    def set_description(self, desc: str) -> None:
+        """Change the description of the progress bar"""
+        self.desc = desc
+        if self._bar is not None:
+            self._bar.set_description(desc, refresh=False)
+
+    def close(self) -> None:
+        """Refresh the progress bar a last time and close it"""
+        self.flush()
+        if self._bar is not None:
+            self._bar.close()
+            self._bar = None
+
+    def __enter__(self) -> Progress:
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.close()
+        return False
+
+    @property
+    def elapsed(self) -> float:
+        """Time in seconds since the progress was opened"""
+        if self._start is None:
+            return 0.0
+        return time.perf_counter() - self._start
+
+    @property
+    def rate(self) -> float:
+        """Processed units per second"""
+        elapsed = self.elapsed
+        return self.count / elapsed if elapsed else 0.0
+
+    @property
+    def mb_per_s(self) -> float:
+        """Processed megabytes per second"""
+        elapsed = self.elapsed
+        return self.nbytes / 1e6 / elapsed if elapsed else 0.0
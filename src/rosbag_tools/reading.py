@@ -0,0 +1,199 @@
+"""Message reading helpers shared by the rosbag tools"""
+
+from __future__ import annotations
+
+import heapq
+import os
+from bisect import bisect_left
+from io import BytesIO
+from typing import TYPE_CHECKING
+
+from rosbags.rosbag1 import Reader as Reader1
+from rosbags.rosbag1.reader import (
+    Header,
+    ReaderError,
+    RecordType,
+    read_bytes,
+    read_uint32,
+)
+from rosbags.rosbag2.storage_sqlite3 import ReaderSqlite3
+
+from rosbag_tools.mcap import McapReader
+from rosbag_tools.profiling import profile_stage
+from rosbag_tools.utils import rosbags_internals_supported
+
+if TYPE_CHECKING:
+    from typing import BinaryIO, Dict, Generator, Iterable, List, Optional, Tuple
+
+    from rosbags.interfaces import Connection
+    from rosbags.rosbag1.reader import IndexData
+    from rosbags.rosbag2 import Reader as Reader2
+
+
+def slice_index(
+    index: List[IndexData], start: Optional[int], stop: Optional[int]
+) -> List[IndexData]:
+    """Keep the index entries whose timestamp is in [start, stop[
+
+    Args:
+        index: Index of a connection, sorted by timestamp
+        start: First timestamp (ns) to keep. If None, keep from the first entry.
+        stop: Timestamp (ns) after the last timestamp to keep. If None, keep until the last entry.
+
+    Returns:
+        List[IndexData]: Slice of the index
+    """
+    lo = 0 if start is None else bisect_left(index, (start,))
+    hi = len(index) if stop is None else bisect_left(index, (stop,))
+    return index[lo:hi]
+
+
+def read_chunk_entry(
+    chunk: BinaryIO, entry: IndexData, connmap: Dict[int, Connection]
+) -> Tuple[Connection, int, bytes]:
+    """Read the message pointed by an index entry in the decompressed data of its chunk
+
+    Args:
+        chunk: Decompressed data of a ROS 1 chunk
+        entry: Index entry of the message
+        connmap: Connections of the rosbag, by id
+
+    Returns:
+        Tuple[Connection, int, bytes]: connection, timestamp (ns) and raw data of the message
+    """
+    chunk.seek(entry.offset)
+
+    while True:
+        header = Header.read(chunk)
+        have = header.get_uint8("op")
+        if have != RecordType.CONNECTION:
+            break
+        chunk.seek(read_uint32(chunk), os.SEEK_CUR)
+
+    if have != RecordType.MSGDATA:
+        raise ReaderError("Expected to find message data.")
+
+    data = read_bytes(chunk, read_uint32(chunk))
+    return connmap[header.get_uint32("conn")], entry.time, data
+
+
+def read_rosbag1_entries(
+    reader: Reader1,
+    indexes: Iterable[List[IndexData]],
+) -> Generator[Tuple[Connection, int, bytes], None, None]:
+    """Read the messages of a ROS 1 bag that are pointed by index entries
+
+    Only the chunks that contain one of the entries are read and decompressed.
+
+    Args:
+        reader: Open ROS 1 rosbag reader
+        indexes: Lists of index entries, each sorted by timestamp
+
+    Yields:
+        Tuple[Connection, int, bytes]: connection, timestamp (ns) and raw data of each message
+    """
+    if not reader.bio:
+        raise ReaderError("Rosbag is not open.")
+
+    connmap = {x.id: x for x in reader.connections}
+    for entry in heapq.merge(*indexes):
+        if reader.current_chunk[0] != entry.chunk_pos:
+            reader.current_chunk[1].close()
+
+            chunk_header = reader.chunks[entry.chunk_pos]
+            reader.bio.seek(chunk_header.datapos)
+            compressed = read_bytes(reader.bio, chunk_header.datasize)
+            with profile_stage("decompress", nbytes=len(compressed)):
+                rawbytes = chunk_header.decompressor(compressed)
+            reader.current_chunk = (entry.chunk_pos, BytesIO(rawbytes))
+
+        yield read_chunk_entry(reader.current_chunk[1], entry, connmap)
+
+
+def _read_rosbag1_messages(
+    reader: Reader1,
+    connections: Iterable[Connection],
+    start: Optional[int],
+    stop: Optional[int],
+) -> Generator[Tuple[Connection, int, bytes], None, None]:
+    """Read messages from a ROS 1 bag, seeking with the chunk index
+
+    Only the chunks that contain a message in [start, stop[ are read and decompressed.
+    """
+    if not rosbags_internals_supported():
+        yield from reader.messages(connections=connections, start=start, stop=stop)
+        return
+    indexes = [slice_index(reader.indexes[x.id], start, stop) for x in connections]
+    yield from read_rosbag1_entries(reader, indexes)
+
+
+def read_messages(
+    reader: Reader1 | Reader2 | McapReader,
+    connections: Iterable[Connection] = (),
+    start: Optional[int] = None,
+    stop: Optional[int] = None,
+) -> Generator[Tuple[Connection, int, bytes], None, None]:
+    """Read the messages of an open rosbag between two timestamps
+
+    The reader seeks straight to the first message at or after `start`:
+    ROS 1 bags are read through their chunk index, ROS 2 bags through the timestamp
+    index of their database, MCAP files through the chunk indexes of their summary.
+    Reading cost scales with the number of messages in the time window, not with
+    the size of the rosbag.
+
+    Args:
+        reader: Open rosbag reader
+        connections: Connections to read. An empty iterable reads all connections.
+        start: Yield only messages at or after this timestamp (ns). Defaults to None.
+        stop: Yield only messages before this timestamp (ns). Defaults to None.
+
+    Yields:
+        Tuple[Connection, int, bytes]: connection, timestamp (ns) and raw data of each message
+    """
+    connections = list(connections) or reader.connections
+    if isinstance(reader, Reader1):
+        yield from _read_rosbag1_messages(reader, connections, start, stop)
+    else:
+        yield from reader.messages(connections=connections, start=start, stop=stop)
+
+
+def count_messages(
+    reader: Reader1 | Reader2 | McapReader,
+    connections: Iterable[Connection] = (),
+    start: Optional[int] = None,
+    stop: Optional[int] = None,
+) -> Optional[int]:
+    """Count the messages of an open rosbag between two timestamps
+
+    Args:
+        reader: Open rosbag reader
+        connections: Connections to count. An empty iterable counts all connections.
+        start: Count only messages at or after this timestamp (ns). Defaults to None.
+        stop: Count only messages before this timestamp (ns). Defaults to None.
+
+    Returns:
+        Optional[int]: Number of messages, or None if it cannot be known without reading them
+    """
+    connections = list(connections) or reader.connections
+    if isinstance(reader, Reader1):
+        return sum(
+            len(slice_index(reader.indexes[x.id], start, stop)) for x in connections
+        )
+    if isinstance(reader, McapReader):
+        return reader.count_messages(connections, start, stop)
+    if start is None and stop is None:
+        return sum(x.msgcount for x in connections)
+    if not isinstance(reader.storage, ReaderSqlite3):
+        # No timestamp index to query : the count of the time window is unknown
+        return None
+
+    topics = {x.topic for x in connections}
+    query = (
+        "SELECT count(*) FROM messages JOIN topics ON messages.topic_id=topics.id "
+        f"WHERE topics.name IN ({','.join('?' for _ in topics)}) "
+        "AND messages.timestamp >= ? AND messages.timestamp < ?"
+    )
+    args = [*topics, 0 if start is None else start, 2**63 - 1 if stop is None else stop]
+    return sum(
+        dbconn.execute(query, args).fetchone()[0] for dbconn in reader.storage.dbconns
+    )
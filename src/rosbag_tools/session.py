@@ -0,0 +1,194 @@
+"""Rosbag session shared by the rosbag tools
+
+Opening a rosbag parses its index, which takes seconds on large ROS 1 rosbags.
+A `BagSession` opens the rosbag once, lazily, and caches what the tools ask for
+(connections, topics, message counts and time bounds) until it is closed.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from rosbags.highlevel.anyreader import SimpleTypeStore
+from rosbags.rosbag1 import Reader as Reader1
+from rosbags.rosbag2 import Reader as Reader2
+from rosbags.serde import deserialize_cdr, deserialize_ros1
+from rosbags.typesys import get_types_from_msg, register_types, types
+from rosbags.typesys.idl import get_types_from_idl
+
+from rosbag_tools.mcap import McapReader
+from rosbag_tools.profiling import profile_stage
+
+if TYPE_CHECKING:
+    from typing import Any, List, Optional, Tuple, Type
+
+    from rosbags.interfaces import Connection
+
+
+class BagSession:
+    """BagSession - Single open reader of a rosbag, with cached metadata"""
+
+    def __init__(self, path: Path | str) -> None:
+        """Create a BagSession instance. The rosbag is opened on first use.
+
+        Args:
+            path: Path to a ROS 1 rosbag file, to a ROS 2 rosbag directory or to a MCAP file
+        """
+        self._path = Path(path)
+        self._reader: Optional[Reader1 | Reader2 | McapReader] = None
+        self._connections: Optional[Tuple[Connection]] = None
+        self._topics: Optional[Tuple[str]] = None
+        self._bounds: Optional[Tuple[int, int]] = None
+        self._typestore = None
+
+    @property
+    def path(self) -> Path:
+        """Path to the rosbag"""
+        return self._path
+
+    @property
+    def is_ros1(self) -> bool:
+        """Is the rosbag a ROS 1 rosbag ?"""
+        return self._path.suffix == ".bag"
+
+    @property
+    def is_mcap(self) -> bool:
+        """Is the rosbag a standalone MCAP file ?"""
+        return self._path.suffix == ".mcap" and not self._path.is_dir()
+
+    @property
+    def Reader(self) -> Type[Reader1 | Reader2 | McapReader]:
+        """Reader class of the rosbag"""
+        if self.is_mcap:
+            return McapReader
+        return Reader1 if self.is_ros1 else Reader2
+
+    @property
+    def is_open(self) -> bool:
+        """Is the reader of the rosbag open ?"""
+        return self._reader is not None
+
+    @property
+    def reader(self) -> Reader1 | Reader2 | McapReader:
+        """Open reader of the rosbag, opened on first access"""
+        if self._reader is None:
+            self.open()
+        return self._reader
+
+    def open(self) -> None:
+        """Open the rosbag and parse its index, if not already done"""
+        if self._reader is not None:
+            return
+        with profile_stage("open"):
+            reader = self.Reader(self._path)
+            reader.open()
+        self._reader = reader
+        self._connections = tuple(reader.connections)
+        self._topics = tuple(reader.topics.keys())
+        self._bounds = (reader.start_time, reader.end_time)
+
+    def close(self) -> None:
+        """Close the reader of the rosbag. Cached metadata stays available."""
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def refresh(self) -> None:
+        """Close the reader and forget cached metadata, after the rosbag was modified"""
+        self.close()
+        self._connections = None
+        self._topics = None
+        self._bounds = None
+        self._typestore = None
+
+    def __enter__(self) -> BagSession:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.close()
+        return False
+
+    def _ensure_metadata(self) -> None:
+        """Read the rosbag metadata, if not cached yet"""
+        if self._connections is None:
+            self.open()
+
+    @property
+    def connections(self) -> List[Connection]:
+        """Connections of the rosbag"""
+        self._ensure_metadata()
+        return list(self._connections)
+
+    @property
+    def topics(self) -> Tuple[str]:
+        """Topics of the rosbag"""
+        self._ensure_metadata()
+        return self._topics
+
+    @property
+    def message_count(self) -> int:
+        """Total message count"""
+        return sum(conn.msgcount for conn in self.connections)
+
+    @property
+    def start_time(self) -> int:
+        """Timestamp in nanoseconds of the earliest message"""
+        self._ensure_metadata()
+        return self._bounds[0]
+
+    @property
+    def end_time(self) -> int:
+        """Timestamp in nanoseconds after the latest message"""
+        self._ensure_metadata()
+        return self._bounds[1]
+
+    @property
+    def duration(self) -> int:
+        """Duration in nanoseconds between earliest and latest messages"""
+        return max(self.end_time - self.start_time, 0)
+
+    def _build_typestore(self) -> Any:
+        """Type store of the message definitions of the rosbag, as in rosbags AnyReader"""
+        msgdefs = [conn for conn in self.connections if conn.msgdef]
+        if not msgdefs:
+            # No message definitions in the rosbag : use the global type store
+            return types
+        typestore = SimpleTypeStore({})
+        for key in (
+            "builtin_interfaces/msg/Time",
+            "builtin_interfaces/msg/Duration",
+            "std_msgs/msg/Header",
+        ):
+            typestore.FIELDDEFS[key] = types.FIELDDEFS[key]
+            attr = key.replace("/", "__")
+            setattr(typestore, attr, getattr(types, attr))
+        typs = {}
+        for conn in msgdefs:
+            if conn.digest == "idl":
+                typs.update(get_types_from_idl(conn.msgdef))
+            else:
+                typs.update(get_types_from_msg(conn.msgdef, conn.msgtype))
+        register_types(typs, typestore)
+        return typestore
+
+    @property
+    def typestore(self) -> Any:
+        """Type store of the message types of the rosbag, built on first access"""
+        if self._typestore is None:
+            self._typestore = self._build_typestore()
+        return self._typestore
+
+    def deserialize(self, rawdata: bytes, msgtype: str) -> Any:
+        """Deserialize a message of the rosbag
+
+        Args:
+            rawdata: Serialized message data
+            msgtype: Message type name
+
+        Returns:
+            Any: Deserialized message
+        """
+        if self.is_ros1:
+            return deserialize_ros1(rawdata, msgtype, self.typestore)
+        return deserialize_cdr(rawdata, msgtype, self.typestore)
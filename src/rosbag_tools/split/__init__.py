@@ -1,9 +1,17 @@
 """Split a long rosbag into smaller rosbag sections"""
 
+from rosbag_tools.utils import lazy_getattr
+
 from .main import cli as split
-from .splitter import BagSplitter
 
 __all__ = (
     "BagSplitter",
     "split",
 )
+
+__getattr__ = lazy_getattr(
+    __name__,
+    {
+        "BagSplitter": ".splitter",
+    },
+)
@@ -4,8 +4,13 @@ import click
 import json
 
 from rosbag_tools import exceptions
-from rosbag_tools.split.splitter import BagSplitter
-from rosbag_tools.utils import custom_message_path
+from rosbag_tools.utils import (
+    check_writer_options,
+    compression_options,
+    custom_message_path,
+    profile_option,
+    quiet_option,
+)
 
 
 @click.command(
@@ -38,6 +43,21 @@ from rosbag_tools.utils import custom_message_path
     help="Path to a file containing timestamps representing elapsed seconds since the start of the rosbag. "
     "Each timestamp is on an individual line.",
 )
+@click.option(
+    "--max-open-writers",
+    "max_open_writers",
+    default=2,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Maximum number of split bag files that are open at once",
+)
+@click.option(
+    "--prefetch",
+    default=0,
+    type=click.IntRange(min=0),
+    show_default=True,
+    help="Number of messages read ahead in a background thread, while the output is written. 0 disables prefetching.",
+)
 @click.option(
     "-f",
     "--force-overwriting",
@@ -45,14 +65,28 @@ from rosbag_tools.utils import custom_message_path
     help="Force output file overwriting",
     is_flag=True,
 )
+@compression_options
+@profile_option
+@quiet_option
 @custom_message_path
-def cli(inbag, outbag, force, timestamps=None, timestamps_file=None):
+def cli(
+    inbag,
+    outbag,
+    force,
+    max_open_writers,
+    prefetch,
+    writer_options,
+    timestamps=None,
+    timestamps_file=None,
+):
     """Split out an INBAG
 
     INBAG is the path to a rosbag file
     Can be a bag in ROS 1 or in ROS 2
     """
-    splitter = BagSplitter(inbag)
+    # Tools are imported here, to keep the CLI startup fast
+    from rosbag_tools.split.splitter import BagSplitter
+
     if timestamps_file is not None:
         # Received path to timestamps file
         tstamp_path = Path(timestamps_file)
@@ -74,16 +108,18 @@ def cli(inbag, outbag, force, timestamps=None, timestamps_file=None):
         tstamps_values = []
     tstamps = [float(v) for v in tstamps_values]
     if outbag:
-        splitter.split_rosbag(
-            timestamps=tstamps,
-            outbag_path=outbag,
-            force_out=force,
-        )
+        outpath = outbag
     else:
         inpath = Path(inbag)
         outpath = inpath.with_name(inpath.stem + "_split" + inpath.suffix)
+    check_writer_options(writer_options, [outpath])
+
+    with BagSplitter(inbag) as splitter:
         splitter.split_rosbag(
             timestamps=tstamps,
             outbag_path=outpath,
             force_out=force,
+            max_open_writers=max_open_writers,
+            prefetch=prefetch,
+            writer_options=writer_options,
         )
@@ -1,9 +1,17 @@
 """Compare topics between rosbags in a folder"""
 
+from rosbag_tools.utils import lazy_getattr
+
 from .main import cli as topic_compare
-from .topic_comparator import BagTopicComparator
 
 __all__ = (
     "BagTopicComparator",
     "topic_compare",
 )
+
+__getattr__ = lazy_getattr(
+    __name__,
+    {
+        "BagTopicComparator": ".topic_comparator",
+    },
+)
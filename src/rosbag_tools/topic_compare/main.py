@@ -2,8 +2,7 @@ from pathlib import Path
 
 import click
 
-from rosbag_tools.topic_compare.topic_comparator import BagTopicComparator
-from rosbag_tools.utils import custom_message_path
+from rosbag_tools.utils import custom_message_path, quiet_option
 
 
 @click.command(
@@ -32,16 +31,33 @@ from rosbag_tools.utils import custom_message_path
     "--summary-figure-path",
     help="Topic consistency figure export path",
 )
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Number of rosbags that are opened concurrently",
+)
+@click.option(
+    "--no-cache",
+    help="Read every rosbag, ignoring the scan cache of the dataset",
+    is_flag=True,
+)
+@quiet_option
 @custom_message_path
-def cli(bagfolder, metadata, plot, fig, *args):
+def cli(bagfolder, metadata, jobs, no_cache, plot, fig, *args):
     """Compare rosbag files that are stored in BAGFOLDER
 
     BAGFOLDER is the path to a dataset directory
     """
+    # Tools are imported here, to keep the CLI startup fast
+    from rosbag_tools.topic_compare.topic_comparator import BagTopicComparator
+
     data_path = Path(bagfolder)
     is_plot = plot
     rosbag_comp = BagTopicComparator(data_path)
-    rosbag_comp.extract_data()
+    rosbag_comp.extract_data(jobs=jobs, use_cache=not no_cache)
     if metadata is not None:
         rosbag_comp.export_metadata(metadata)
     if is_plot:
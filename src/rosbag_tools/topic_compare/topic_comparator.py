@@ -8,18 +8,11 @@ from itertools import chain
 from pathlib import Path
 from typing import TYPE_CHECKING
 
-# Condition based on optional plt dependency
-try:
-    mtp = None
-    import matplotlib as mtp
-    import matplotlib.pyplot as plt
-except ImportError:
-    pass
-
 import yaml
-from rosbags.rosbag1 import Reader as Reader1
-from rosbags.rosbag2 import Reader as Reader2
-from tqdm import tqdm
+
+from rosbag_tools.base import DatasetTool
+from rosbag_tools.cache import scan_rosbags
+from rosbag_tools.metadata import read_summary
 
 if TYPE_CHECKING:
     from typing import List, Optional
@@ -36,6 +29,7 @@ class BagTopicComparator:
             path: Path to a dataset directory that contains rosbag files
         """
         self._folder = Path(path)
+        self.errors = {}
         self.topics = {}
 
     @property
@@ -92,11 +86,14 @@ class BagTopicComparator:
         with open(yaml_path, "r", encoding="utf-8") as file:
             return cls.from_dict(yaml.safe_load(file))
 
-    def extract_data(self) -> None:
-        """Extract all the topics contained in the rosbags in the path self.folder"""
-        paths_ros1 = self.folder.glob("*.bag")
-        paths_ros2 = (p.parent for p in self.folder.glob("**/*.db3"))
-        paths = list(paths_ros1) + list(paths_ros2)
+    def extract_data(self, jobs: int = 1, use_cache: bool = True) -> None:
+        """Extract all the topics contained in the rosbags in the path self.folder
+
+        Args:
+            jobs: Number of rosbags that are opened concurrently. Defaults to 1.
+            use_cache: Reuse the summaries of unchanged rosbags from the dataset scan cache. Defaults to True.
+        """
+        paths = DatasetTool.find_rosbags(self.folder)
 
         if len(paths) == 0:
             # Empty list of paths
@@ -111,15 +108,14 @@ class BagTopicComparator:
 
         # Create a dictionary with the list of topics for each bag file
         # {file1: ["/topic1", ...], ...}
-        topics = {}
         print(
             f"Extracting topics from {len(paths)} rosbags in {self.folder.resolve().name}"
         )
-        with tqdm(total=len(paths)) as pbar:
-            for bagfile in paths:
-                pbar.set_description(bagfile.stem)
-                topics[bagfile.stem] = self.get_topics(bagfile)
-                pbar.update(1)
+        summaries, errors = scan_rosbags(self.folder, paths, jobs, use_cache)
+        topics = {p.stem: summary.topics for p, summary in summaries.items()}
+        self.errors = {bagfile.stem: error for bagfile, error in errors.items()}
+        for stem, error in self.errors.items():
+            warnings.warn(f"Could not read rosbag {stem} : {error}", RuntimeWarning)
 
         # Make a set with all the topics and get the missing topics
         # for each file
@@ -135,7 +131,7 @@ class BagTopicComparator:
 
     @staticmethod
     def get_topics(filename: Path | str) -> List[str]:
-        """Get a list of the topics in a rosbag file
+        """Get a list of the topics in a rosbag file, from its metadata only
 
         Args:
             filename: path of the rosbag file
@@ -143,10 +139,7 @@ class BagTopicComparator:
         Returns:
             List[str]: list of the topics contained in the rosbag file
         """
-        ros1 = filename.suffix == ".bag"
-        Reader = Reader1 if ros1 else Reader2
-        with Reader(filename) as bag:
-            return list(bag.topics.keys())
+        return read_summary(filename).topics
 
     def _check_data_extraction(self, caller_name: str):
         """Assert that extract_data() was called"""
@@ -196,10 +189,14 @@ class BagTopicComparator:
             img_path: Figure export path. Defaults to None. If None, the figure will be only displayed
         """
 
-        if not mtp:
+        # Optional plt dependency, only imported when plotting
+        try:
+            import matplotlib as mtp
+            import matplotlib.pyplot as plt
+        except ImportError as err:
             raise ImportError(
                 "matplotlib is not included in the installed version of rosbag-tools. Install 'rosbag-tools[plot]'"
-            )
+            ) from err
 
         self._check_data_extraction(self.plot.__name__)
 
@@ -1,9 +1,19 @@
 """Remove topics from rosbags"""
 
+from rosbag_tools.utils import lazy_getattr
+
 from .main import cli as topic_remove
-from .topic_remover import BagTopicRemover
 
 __all__ = (
     "BagTopicRemover",
+    "DatasetTopicRemover",
     "topic_remove",
 )
+
+__getattr__ = lazy_getattr(
+    __name__,
+    {
+        "BagTopicRemover": ".topic_remover",
+        "DatasetTopicRemover": ".topic_remover",
+    },
+)
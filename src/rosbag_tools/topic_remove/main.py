@@ -2,8 +2,14 @@ from pathlib import Path
 
 import click
 
-from rosbag_tools.topic_remove.topic_remover import BagTopicRemover
-from rosbag_tools.utils import custom_message_path
+from rosbag_tools.utils import (
+    check_writer_options,
+    compression_options,
+    custom_message_path,
+    print_dataset_report,
+    profile_option,
+    quiet_option,
+)
 
 
 @click.command(
@@ -20,7 +26,7 @@ from rosbag_tools.utils import custom_message_path
     "--output",
     "--outbag",
     "outbag",
-    help="Filtered bag. Defaults to INBAG_filt",
+    help="Filtered bag, or output directory for a dataset. Defaults to INBAG_filt",
 )
 @click.option(
     "-t",
@@ -28,6 +34,33 @@ from rosbag_tools.utils import custom_message_path
     type=click.STRING,
     multiple=True,
 )
+@click.option(
+    "--in-place",
+    "in_place",
+    help="Delete the topics directly from INBAG, without exporting a new rosbag. "
+    "Only for ROS 2 rosbags stored in sqlite3 databases.",
+    is_flag=True,
+)
+@click.option(
+    "--vacuum",
+    help="With --in-place, rebuild the databases to give the freed disk space back",
+    is_flag=True,
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    show_default=True,
+    help="Number of rosbags that are processed in parallel, when INBAG is a dataset directory",
+)
+@click.option(
+    "--prefetch",
+    default=0,
+    type=click.IntRange(min=0),
+    show_default=True,
+    help="Number of messages read ahead in a background thread, while the output is written. 0 disables prefetching.",
+)
 @click.option(
     "-f",
     "--force-overwriting",
@@ -35,25 +68,77 @@ from rosbag_tools.utils import custom_message_path
     help="Force output file overwriting",
     is_flag=True,
 )
+@compression_options
+@profile_option
+@quiet_option
 @custom_message_path
-def cli(inbag, outbag, topics, force):
+def cli(inbag, outbag, topics, in_place, vacuum, jobs, prefetch, force, writer_options):
     """Remove topics from INBAG
 
     INBAG is the path to a rosbag file
     Can be a bag in ROS 1 or in ROS 2
+
+    INBAG can also be a dataset directory : topics are removed from every rosbag
+    of the dataset, and filtered rosbags are exported in the --output directory.
     """
+    # Tools are imported here, to keep the CLI startup fast
+    from rosbag_tools.base import DatasetTool
+    from rosbag_tools.topic_remove.topic_remover import (
+        BagTopicRemover,
+        DatasetTopicRemover,
+    )
+
     inpath = Path(inbag)
+    if in_place and outbag:
+        raise click.UsageError("Use either --in-place or --output, not both.")
+    if vacuum and not in_place:
+        raise click.UsageError("--vacuum can only be used with --in-place.")
+
+    if DatasetTool.is_dataset(inpath):
+        dataset_rem = DatasetTopicRemover(inpath)
+        if in_place:
+            report = dataset_rem.remove_in_place(topics, vacuum=vacuum, jobs=jobs)
+        else:
+            # Default output directory : /path/to/dataset => /path/to/dataset_filt
+            outdir = Path(outbag) if outbag else inpath.with_name(f"{inpath.name}_filt")
+            # Filtered rosbags have the format of their rosbag
+            check_writer_options(writer_options, DatasetTool.find_rosbags(inpath))
+            report = dataset_rem.export(
+                topics,
+                outdir,
+                force_output_overwrite=force,
+                jobs=jobs,
+                prefetch=prefetch,
+                writer_options=writer_options,
+            )
+        print_dataset_report(report, "topic-remove")
+        return
 
-    rosbag_rem = BagTopicRemover(inbag)
-    rosbag_rem.remove(topics)
     if outbag:
         outpath = Path(outbag)
-        rosbag_rem.export(outpath, force_output_overwrite=force)
     else:
         # Default path:
         # /path/to/my/rosbag => /path/to/my/rosbag_filt
         # /path/to/my/rosbag.bag => /path/to/my/rosbag_filt.bag
-        inpath = Path(inpath)
-        def_outfname = f"{inpath.stem}_filt{inpath.suffix}"
-        default_outpath = inpath.parent / def_outfname
-        rosbag_rem.export(default_outpath, force_output_overwrite=force)
+        outpath = inpath.parent / f"{inpath.stem}_filt{inpath.suffix}"
+    if not in_place:
+        check_writer_options(writer_options, [outpath])
+
+    with BagTopicRemover(inbag) as rosbag_rem:
+        if in_place:
+            try:
+                rosbag_rem.check_in_place()
+            except NotImplementedError as err:
+                raise click.UsageError(
+                    f"--in-place cannot be used with {inbag}. {err}"
+                ) from err
+        rosbag_rem.remove(topics)
+        if in_place:
+            rosbag_rem.remove_in_place(vacuum=vacuum)
+        else:
+            rosbag_rem.export(
+                outpath,
+                force_output_overwrite=force,
+                prefetch=prefetch,
+                writer_options=writer_options,
+            )
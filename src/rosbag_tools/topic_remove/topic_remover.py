@@ -3,23 +3,26 @@
 from __future__ import annotations
 
 import fnmatch
-import shutil
+import sqlite3
 import warnings
 from pathlib import Path
-from typing import TYPE_CHECKING, cast
+from typing import TYPE_CHECKING
 
-from rosbags.interfaces import ConnectionExtRosbag1, ConnectionExtRosbag2
-from rosbags.rosbag1 import Reader as Reader1
-from rosbags.rosbag1 import Writer as Writer1
-from rosbags.rosbag2 import Reader as Reader2
-from rosbags.rosbag2 import Writer as Writer2
-from tqdm import tqdm
+import yaml
+
+from rosbag_tools.base import DatasetReport, DatasetTool, ROSBagTool
+from rosbag_tools.chunks import ChunkCopier
+from rosbag_tools.conversion import session_converter
+from rosbag_tools.prefetch import prefetch_messages
+from rosbag_tools.profiling import profile_stage, profile_write
+from rosbag_tools.progress import Progress
+from rosbag_tools.writers import WriterOptions, writer_factory
 
 if TYPE_CHECKING:
-    from typing import Sequence, Tuple, Type
+    from typing import Optional, Sequence, Tuple
 
 
-class BagTopicRemover:
+class BagTopicRemover(ROSBagTool):
     """Topic Remover : Remove topics from a rosbag"""
 
     def __init__(self, path: Path | str) -> None:
@@ -28,48 +31,7 @@ class BagTopicRemover:
         Args:
             path: Path to the input rosbag
         """
-        self._intopics: Tuple[str] = None
-        self._is_ros1_reader: bool = None
-        self._is_ros1_writer: bool = None
-        self.inbag = Path(path)
-
-    @property
-    def inbag(self) -> Path:
-        """The inbag property."""
-        return self._inbag
-
-    @inbag.setter
-    def inbag(self, value: Path | str):
-        """Setter for `inbag`"""
-        vpath = Path(value)
-        if vpath.is_file() or vpath.is_dir():
-            self._inbag = vpath
-            Reader = self.get_reader_class(self._inbag)
-            with Reader(self._inbag) as inbag:
-                self._intopics = tuple(inbag.topics.keys())
-        else:
-            raise ValueError(f"{value} is not an existing file")
-
-    @property
-    def topics(self):
-        """The topics property."""
-        return self._intopics
-
-    def get_reader_class(self, filename: Path | str) -> Type[Reader1 | Reader2]:
-        """Return the reader class that corresponds to the filename
-        Needs the filename of the rosbag to read from
-        """
-        is_ros1 = Path(filename).suffix == ".bag"
-        self._is_ros1_reader = is_ros1
-        return Reader1 if is_ros1 else Reader2
-
-    def get_writer_class(self, filename: Path | str) -> Type[Writer1 | Writer2]:
-        """Return the writer class that corresponds to the filename
-        Needs the filename of the rosbag to write in
-        """
-        is_ros1 = Path(filename).suffix == ".bag"
-        self._is_ros1_writer = is_ros1
-        return Writer1 if is_ros1 else Writer2
+        super().__init__(path, "topic-remove")
 
     @staticmethod
     def filter_out_topics(
@@ -125,31 +87,29 @@ class BagTopicRemover:
             patterns = (patterns,)
         self._intopics = self.filter_out_topics(self._intopics, patterns)
 
-    def _delete_rosbag(self, path: Path | str):
-        """Function to delete a rosbag at path `path`, to use with caution
-
-        Args:
-            path: Path to rosbag to delete.
-        """
-        is_ros1 = path.is_file() and path.suffix == ".bag"
-        is_ros2 = path.is_dir() and len(tuple(path.glob("*.db3"))) > 0
-        if is_ros1:
-            path.unlink()
-        elif is_ros2:
-            shutil.rmtree(path)
-        else:
-            raise ValueError(f"Path {path} is not a valid rosbag")
-
-    def export(self, path: Path | str, force_output_overwrite: bool = False) -> None:
+    def export(
+        self,
+        path: Path | str,
+        force_output_overwrite: bool = False,
+        chunk_copy: bool = True,
+        prefetch: int = 0,
+        writer_options: Optional[WriterOptions] = None,
+    ) -> None:
         """Export filtered rosbag to 'path'
 
+        Only the messages of the kept topics are read. For ROS 1 rosbags, chunks that
+        only contain kept topics are copied without being decompressed.
+
         Args:
             path: Path to export the rosbag.
             force_output_overwrite: Force output overwriting if path already exists. Defaults to False.
+            chunk_copy: Copy ROS 1 chunks verbatim when possible. Defaults to True.
+            prefetch: Number of messages read ahead in a background thread, while the outputs are written. 0 reads in the main thread. Defaults to 0.
+            writer_options: Settings of the output rosbags : compression, chunk size and compression threads. Defaults to None, the writer defaults.
 
         Raises:
-            FileExistsError: _description_
-            FileExistsError: _description_
+            FileExistsError: Export path is the same as the input path
+            FileExistsError: Export path already exists and output overwriting flag was not set to True
         """
         outpath = Path(path)
         if outpath == self._inbag:
@@ -166,44 +126,262 @@ class BagTopicRemover:
             )
             self._delete_rosbag(outpath)
 
-        # Reader / Writer classes
-        Reader = self.get_reader_class(self.inbag)
+        # Writer class, the input rosbag is read from the session
         Writer = self.get_writer_class(path)
-        if self._is_ros1_reader != self._is_ros1_writer:
+        self._converter = session_converter(self._session, self._is_ros1_writer)
+        Writer = writer_factory(Writer, writer_options)
+        reader = self._session.reader
+        with Writer(outpath) as writer:
+            # Connections of the kept topics : the other ones are never read
+            kept_topics = set(self._intopics)
+            kept_connections = [
+                conn for conn in reader.connections if conn.topic in kept_topics
+            ]
+            kept_ids = {conn.id for conn in kept_connections}
+
+            with profile_stage("connections"):
+                conn_map = self._add_writer_connections(writer, kept_connections)
+
+            # Nothing to read when every topic is removed
+            if kept_connections:
+                if self._copies_chunks(chunk_copy):
+                    copier = ChunkCopier(
+                        reader,
+                        kept_connections,
+                        compression=writer_options and writer_options.compression,
+                    )
+                    chunks = copier.read_chunks(
+                        lambda chunk: not copier.can_copy(chunk, conn_map), depth=prefetch
+                    )
+                    with Progress(total=copier.message_count) as progress:
+                        for read in chunks:
+                            chunk = read.chunk
+                            copier.write(chunk, writer, conn_map, read)
+                            progress.update(chunk.message_count, copier.chunk_size(chunk))
+                else:
+                    msgcount = sum(conn.msgcount for conn in kept_connections)
+                    messages = prefetch_messages(reader, kept_connections, depth=prefetch)
+                    if self._converter is not None:
+                        messages = self._converter.convert_messages(
+                            messages, kept_connections
+                        )
+                    write = profile_write("write", writer.write)
+                    with Progress(total=msgcount) as progress:
+                        for conn, timestamp, data in messages:
+                            if conn.id in kept_ids:
+                                write(conn_map[conn.id], timestamp, data)
+                            progress.update(1, len(data))
+
+        print(f"[topic-remove] Done ! Exported in {path}")
+
+    def check_in_place(self) -> None:
+        """Check that topics can be removed in place from the input rosbag
+
+        Raises:
+            NotImplementedError: The input rosbag is not a ROS 2 sqlite3 rosbag, or is compressed by file
+        """
+        metapath = self.inbag / "metadata.yaml"
+        if not metapath.is_file():
             raise NotImplementedError(
-                "Rosbag conversion (ROS 1->ROS 2 / ROS 2->ROS 1) is not supported. "
-                "Use `rosbags` to convert your rosbag before using `rosbag-tools topic-remove`."
+                "In-place topic removal is only supported for ROS 2 rosbags. "
+                "Export a filtered rosbag instead."
             )
-        with Reader(self.inbag) as reader, Writer(outpath) as writer:
-            conn_map = {}
-            ConnectionExt = (
-                ConnectionExtRosbag1 if self._is_ros1_writer else ConnectionExtRosbag2
+        with open(metapath, "r", encoding="utf-8") as file:
+            metadata = yaml.safe_load(file)
+        bag_info = metadata["rosbag2_bagfile_information"]
+        if bag_info["storage_identifier"] != "sqlite3":
+            raise NotImplementedError(
+                f"In-place topic removal is not supported for storage "
+                f"'{bag_info['storage_identifier']}'. Export a filtered rosbag instead."
             )
-            for conn in reader.connections:
-                if conn.topic in self._intopics:
-                    ext = cast(ConnectionExt, conn.ext)
-                    if self._is_ros1_writer:
-                        conn_map[conn.id] = writer.add_connection(
-                            conn.topic,
-                            conn.msgtype,
-                            conn.msgdef,
-                            conn.digest,
-                            ext.callerid,
-                            ext.latching,
-                        )
-                    else:
-                        # ROS 2
-                        conn_map[conn.id] = writer.add_connection(
-                            conn.topic,
-                            conn.msgtype,
-                            serialization_format=ext.serialization_format,
-                            offered_qos_profiles=ext.offered_qos_profiles,
+        if (bag_info.get("compression_mode") or "").lower() == "file":
+            raise NotImplementedError(
+                "In-place topic removal is not supported for rosbags compressed by file. "
+                "Export a filtered rosbag instead."
+            )
+
+    def remove_in_place(self, vacuum: bool = False) -> None:
+        """Delete the filtered out topics directly from the input rosbag
+
+        Only supported for ROS 2 rosbags stored in sqlite3 databases. The messages and
+        the topic entries of the removed topics are deleted from the databases and
+        the message counts of `metadata.yaml` are updated. The kept messages are not
+        rewritten.
+
+        Args:
+            vacuum: Rebuild the databases after the deletion, to give the freed disk space back to the file system. Defaults to False.
+
+        Raises:
+            NotImplementedError: The input rosbag is not a ROS 2 sqlite3 rosbag, or is compressed by file
+        """
+        self.check_in_place()
+        metapath = self.inbag / "metadata.yaml"
+        with open(metapath, "r", encoding="utf-8") as file:
+            metadata = yaml.safe_load(file)
+        bag_info = metadata["rosbag2_bagfile_information"]
+
+        kept_topics = set(self._intopics)
+        topics_info = bag_info["topics_with_message_count"]
+        removed = [
+            t["topic_metadata"]["name"]
+            for t in topics_info
+            if t["topic_metadata"]["name"] not in kept_topics
+        ]
+        if not removed:
+            print(f"[topic-remove] No topic to remove from {self.inbag}")
+            return
+
+        # The databases are modified : the session has to read them again afterwards
+        self._session.refresh()
+
+        files_info = {Path(f["path"]).name: f for f in bag_info.get("files", [])}
+        placeholders = ",".join("?" for _ in removed)
+        bag_start, bag_end = None, None
+        for relpath in bag_info["relative_file_paths"]:
+            dbpath = self.inbag / Path(relpath).name
+            dbconn = sqlite3.connect(dbpath)
+            try:
+                with dbconn:
+                    topic_ids = [
+                        row[0]
+                        for row in dbconn.execute(
+                            f"SELECT id FROM topics WHERE name IN ({placeholders})",
+                            removed,
                         )
+                    ]
+                    id_placeholders = ",".join("?" for _ in topic_ids)
+                    dbconn.execute(
+                        f"DELETE FROM messages WHERE topic_id IN ({id_placeholders})",
+                        topic_ids,
+                    )
+                    dbconn.execute(
+                        f"DELETE FROM topics WHERE id IN ({id_placeholders})", topic_ids
+                    )
+                count, start, end = dbconn.execute(
+                    "SELECT count(*), min(timestamp), max(timestamp) FROM messages"
+                ).fetchone()
+                if vacuum:
+                    dbconn.execute("VACUUM")
+            finally:
+                dbconn.close()
 
-            with tqdm(total=reader.message_count) as pbar:
-                for conn, timestamp, data in reader.messages():
-                    if conn.topic in self._intopics:
-                        writer.write(conn_map[conn.id], timestamp, data)
-                    pbar.update(1)
+            if start is not None:
+                bag_start = start if bag_start is None else min(bag_start, start)
+                bag_end = end if bag_end is None else max(bag_end, end)
+            if dbpath.name in files_info:
+                files_info[dbpath.name].update(
+                    {
+                        "message_count": count,
+                        "starting_time": {"nanoseconds_since_epoch": start or 0},
+                        "duration": {"nanoseconds": (end or 0) - (start or 0)},
+                    }
+                )
 
-        print(f"[topic-remove] Done ! Exported in {path}")
+        bag_info["topics_with_message_count"] = [
+            t for t in topics_info if t["topic_metadata"]["name"] in kept_topics
+        ]
+        bag_info["message_count"] = sum(
+            t["message_count"] for t in bag_info["topics_with_message_count"]
+        )
+        bag_info["starting_time"] = {"nanoseconds_since_epoch": bag_start or 0}
+        bag_info["duration"] = {"nanoseconds": (bag_end or 0) - (bag_start or 0)}
+        with open(metapath, "w", encoding="utf-8") as file:
+            yaml.safe_dump(metadata, file, sort_keys=False)
+
+        print(f"[topic-remove] Done ! Removed {len(removed)} topics from {self.inbag}")
+
+
+def _remove_topics(
+    inbag: Path,
+    outbag: Path,
+    patterns: Sequence[str],
+    force_output_overwrite: bool,
+    prefetch: int = 0,
+    writer_options: Optional[WriterOptions] = None,
+) -> Path:
+    """Export a rosbag without some topics, as a dataset task"""
+    with BagTopicRemover(inbag) as remover:
+        remover.remove(patterns)
+        remover.export(
+            outbag,
+            force_output_overwrite=force_output_overwrite,
+            prefetch=prefetch,
+            writer_options=writer_options,
+        )
+    return outbag
+
+
+def _remove_topics_in_place(inbag: Path, patterns: Sequence[str], vacuum: bool) -> Path:
+    """Remove topics from a rosbag in place, as a dataset task"""
+    with BagTopicRemover(inbag) as remover:
+        remover.remove(patterns)
+        remover.remove_in_place(vacuum=vacuum)
+    return inbag
+
+
+class DatasetTopicRemover(DatasetTool):
+    """Dataset Topic Remover : Remove topics from every rosbag of a dataset"""
+
+    def __init__(self, path: Path | str) -> None:
+        """Create a DatasetTopicRemover instance
+
+        Args:
+            path: Path to a dataset directory that contains rosbags
+        """
+        super().__init__(path, "topic-remove")
+
+    def export(
+        self,
+        patterns: Sequence[str] | str,
+        outdir: Path | str,
+        force_output_overwrite: bool = False,
+        jobs: int = 1,
+        prefetch: int = 0,
+        writer_options: Optional[WriterOptions] = None,
+    ) -> DatasetReport:
+        """Export every rosbag of the dataset without some topics
+
+        Args:
+            patterns: Topic names or patterns to remove
+            outdir: Output directory. Filtered rosbags keep their location relative to the dataset directory.
+            force_output_overwrite: Force output overwriting if a path already exists. Defaults to False.
+            jobs: Number of rosbags that are processed in parallel. Defaults to 1.
+            prefetch: Number of messages read ahead in a background thread, while the outputs are written. 0 reads in the main thread. Defaults to 0.
+            writer_options: Settings of the output rosbags : compression, chunk size and compression threads. Defaults to None, the writer defaults.
+
+        Returns:
+            DatasetReport: Output path or error of each rosbag
+        """
+        if isinstance(patterns, str):
+            patterns = (patterns,)
+        rosbags = self.find_rosbags(self.folder, exclude=[Path(outdir)])
+        tasks = {
+            bag: (
+                bag,
+                self.output_path(bag, outdir),
+                patterns,
+                force_output_overwrite,
+                prefetch,
+                writer_options,
+            )
+            for bag in rosbags
+        }
+        return self.run(_remove_topics, tasks, jobs=jobs)
+
+    def remove_in_place(
+        self, patterns: Sequence[str] | str, vacuum: bool = False, jobs: int = 1
+    ) -> DatasetReport:
+        """Delete topics directly from every ROS 2 sqlite3 rosbag of the dataset
+
+        Args:
+            patterns: Topic names or patterns to remove
+            vacuum: Give the freed disk space back to the file system. Defaults to False.
+            jobs: Number of rosbags that are processed in parallel. Defaults to 1.
+
+        Returns:
+            DatasetReport: Path or error of each rosbag
+        """
+        if isinstance(patterns, str):
+            patterns = (patterns,)
+        tasks = {bag: (bag, patterns, vacuum) for bag in self.find_rosbags(self.folder)}
+        return self.run(_remove_topics_in_place, tasks, jobs=jobs)
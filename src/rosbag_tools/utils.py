@@ -1,12 +1,14 @@
 from __future__ import annotations
 
-from functools import wraps
+import sys
+import warnings
+from functools import lru_cache, wraps
+from importlib import import_module
 from itertools import chain
 from pathlib import Path
-from typing import Sequence
+from typing import Any, Callable, Dict, Sequence, Tuple
 
 import click
-from rosbags.typesys import get_types_from_msg, register_types
 
 
 def slugify_topic(topic: str) -> str:
@@ -53,6 +55,269 @@ def retrieve_msg_paths(parent_path: Path) -> Sequence[str | Path]:
     return msg_paths
 
 
+# Paths given to `register_custom_messages`, to register the same types in worker processes
+_CUSTOM_MSG_PATHS: Tuple[Path, ...] = ()
+
+
+def register_custom_messages(msg_paths: Sequence[str | Path]) -> None:
+    """Register the custom message types found in `msg_paths`
+
+    Args:
+        msg_paths (Sequence[str | Path]): Paths that contain message definitions. Can be paths to ROS workspaces.
+    """
+    global _CUSTOM_MSG_PATHS
+    from rosbags.typesys import get_types_from_msg, register_types
+
+    add_types = {}
+    custom_paths = [retrieve_msg_paths(msg_path) for msg_path in msg_paths]
+    custom_msg_paths = tuple(chain.from_iterable(custom_paths))
+    for msgpath in custom_msg_paths:
+        msgdef = msgpath.read_text(encoding="utf-8")
+        add_types.update(get_types_from_msg(msgdef, guess_msgtype(msgpath)))
+    register_types(add_types)
+    _CUSTOM_MSG_PATHS += tuple(Path(msg_path) for msg_path in msg_paths)
+
+
+def custom_message_paths() -> Tuple[Path, ...]:
+    """Paths of the custom message types registered in this process
+
+    Returns:
+        Tuple[Path, ...]: Paths given to `register_custom_messages`
+    """
+    return _CUSTOM_MSG_PATHS
+
+
+# Version of rosbags whose private ROS 1 internals are used to copy chunks verbatim,
+# to compress chunks in parallel and to read chunks by index entries : reader
+# `chunks`, `chunk_infos` and `current_chunk`, writer `chunks`, `WriteChunk` and `Header`
+ROSBAGS_INTERNALS_VERSION = "0.9.16"
+
+
+@lru_cache(maxsize=None)
+def rosbags_internals_supported() -> bool:
+    """Are the private rosbags internals used by the ROS 1 fast paths known to this version ?
+
+    Other versions of rosbags are used through their public API only : ROS 1 chunks
+    are rewritten message by message, and a warning is issued once.
+
+    Returns:
+        bool: If True, the installed rosbags is the version whose internals are used
+    """
+    from importlib.metadata import version
+
+    installed = version("rosbags")
+    if installed == ROSBAGS_INTERNALS_VERSION:
+        return True
+    warnings.warn(
+        f"rosbags {installed} is installed, rosbag-tools was built for rosbags "
+        f"{ROSBAGS_INTERNALS_VERSION} : ROS 1 chunks are not copied verbatim.",
+        RuntimeWarning,
+    )
+    return False
+
+
+def lazy_getattr(package: str, exports: Dict[str, str]) -> Callable[[str], Any]:
+    """Build a module `__getattr__` that imports exported names on first access
+
+    Keeps `import rosbag_tools` and the CLI startup free of heavy dependencies
+    (rosbags, numpy), which are only imported by the tools that use them.
+
+    Args:
+        package (str): Name of the package that exports the names
+        exports (Dict[str, str]): Exported name => "module" or "module:attribute" that defines it, relative to `package`
+
+    Returns:
+        Callable[[str], Any]: Module `__getattr__` function
+    """
+
+    def __getattr__(name: str) -> Any:
+        if name not in exports:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        module, _, attr = exports[name].partition(":")
+        value = getattr(import_module(module, package), attr or name)
+        # Cache the value, which also takes precedence over a submodule with the same name
+        setattr(sys.modules[package], name, value)
+        return value
+
+    return __getattr__
+
+
+def map_rosbags(
+    func: Callable[[Path], Any],
+    paths: Sequence[Path],
+    jobs: int = 1,
+) -> Tuple[Dict[Path, Any], Dict[Path, str]]:
+    """Apply `func` on every rosbag of `paths`, with `jobs` rosbags opened concurrently
+
+    Rosbags are opened in a thread pool, since scanning a dataset mostly waits on I/O.
+    A rosbag that cannot be read does not stop the scan : its error is collected.
+
+    Args:
+        func (Callable[[Path], Any]): Function to apply on a rosbag path
+        paths (Sequence[Path]): Rosbag paths
+        jobs (int): Number of rosbags that are opened concurrently. Defaults to 1.
+
+    Returns:
+        Tuple[Dict[Path, Any], Dict[Path, str]]: Results and errors of each rosbag, in the order of `paths`
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    from rosbag_tools.progress import Progress
+
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor, Progress(
+        total=len(paths), unit="bag", batch_size=1
+    ) as pbar:
+        futures = {executor.submit(func, path): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            pbar.set_description(path.stem)
+            try:
+                results[path] = future.result()
+            except Exception as err:  # pylint: disable=broad-except
+                errors[path] = f"{type(err).__name__}: {err}"
+            pbar.update(1)
+    ordered_results = {p: results[p] for p in paths if p in results}
+    ordered_errors = {p: errors[p] for p in paths if p in errors}
+    return ordered_results, ordered_errors
+
+
+def print_dataset_report(report, tool_name: str) -> None:
+    """Print the report of a dataset operation, and fail if a rosbag could not be processed
+
+    Args:
+        report (DatasetReport): Report of the dataset operation
+        tool_name (str): Tool name
+
+    Raises:
+        click.ClickException: At least one rosbag could not be processed
+    """
+    print(f"[{tool_name}] Done ! {report.summary()}")
+    if report.errors:
+        raise click.ClickException(f"{len(report.errors)} rosbags could not be processed")
+
+
+def quiet_option(f):
+    # Option added after wraps, to keep the click options of `f`
+    @click.option(
+        "-q",
+        "--quiet",
+        help="Do not display progress bars",
+        is_flag=True,
+    )
+    @wraps(f)
+    def wrapper(quiet, *args, **kwargs):
+        from rosbag_tools.progress import set_quiet
+
+        set_quiet(quiet)
+        return f(*args, **kwargs)
+
+    return wrapper
+
+
+def compression_options(f):
+    # Options added after wraps, to keep the click options of `f`
+    @click.option(
+        "--compression",
+        type=click.Choice(["none", "lz4", "bz2", "zstd"]),
+        help="Compression of the output rosbags : lz4 or bz2 for ROS 1, zstd for ROS 2, "
+        "zstd or lz4 for MCAP files. "
+        "Defaults to uncompressed, but ROS 1 chunks that are copied keep their compression.",
+    )
+    @click.option(
+        "--chunk-size",
+        type=click.IntRange(min=1),
+        help="Size of the uncompressed chunks of ROS 1 and MCAP output rosbags, in KiB. "
+        "Defaults to 1024.",
+    )
+    @click.option(
+        "--compression-threads",
+        default=0,
+        type=click.IntRange(min=0),
+        show_default=True,
+        help="Number of threads that compress ROS 1 chunks in parallel. 0 compresses while writing. "
+        "Not used for ROS 2 and MCAP outputs.",
+    )
+    @wraps(f)
+    def wrapper(compression, chunk_size, compression_threads, *args, **kwargs):
+        from rosbag_tools.writers import WriterOptions
+
+        kwargs["writer_options"] = WriterOptions(
+            compression=compression,
+            chunk_size=None if chunk_size is None else chunk_size * 1024,
+            threads=compression_threads,
+        )
+        return f(*args, **kwargs)
+
+    return wrapper
+
+
+def check_writer_options(writer_options, outbags) -> None:
+    """Check the settings of `compression_options` against the format of the output rosbags
+
+    Args:
+        writer_options (WriterOptions): Settings of the output rosbags
+        outbags (Iterable[Path | str]): Output rosbags, whose format is given by their extension
+
+    Raises:
+        click.BadParameter: Compression that is not available for the format of an output rosbag
+    """
+    from rosbag_tools.writers import Writer1, output_writer_class
+
+    warn_threads = False
+    for outbag in outbags:
+        Writer = output_writer_class(outbag)
+        try:
+            writer_options.check(Writer)
+        except ValueError as err:
+            raise click.BadParameter(
+                f"{err} [output {Path(outbag).name}]", param_hint="'--compression'"
+            ) from err
+        warn_threads = warn_threads or not issubclass(Writer, Writer1)
+    if writer_options.threads and warn_threads:
+        click.echo(
+            "Warning: --compression-threads only applies to ROS 1 output rosbags, "
+            "ROS 2 and MCAP outputs are compressed while writing.",
+            err=True,
+        )
+
+
+def profile_option(f):
+    # Options added after wraps, to keep the click options of `f`
+    @click.option(
+        "--profile",
+        help="Print the time and throughput of each stage (read, write, ...) on stderr",
+        is_flag=True,
+    )
+    @click.option(
+        "--profile-json",
+        type=click.Path(dir_okay=False, writable=True),
+        help="Save the time and throughput of each stage in a JSON file",
+    )
+    @wraps(f)
+    def wrapper(profile, profile_json, *args, **kwargs):
+        if not profile and profile_json is None:
+            return f(*args, **kwargs)
+
+        import json
+
+        from rosbag_tools.profiling import Profiler
+
+        profiler = Profiler()
+        try:
+            with profiler:
+                return f(*args, **kwargs)
+        finally:
+            # Statistics are reported even if the tool fails
+            if profile:
+                click.echo(profiler.summary(), err=True)
+            if profile_json is not None:
+                with open(profile_json, "w", encoding="utf-8") as file:
+                    json.dump(profiler.to_dict(), file, indent=2)
+
+    return wrapper
+
+
 def custom_message_path(f):
     @wraps(f)
     @click.option(
@@ -65,13 +330,7 @@ def custom_message_path(f):
     )
     def wrapper(msg_paths, *args, **kwargs):
         if msg_paths:
-            add_types = {}
-            custom_paths = [retrieve_msg_paths(msg_path) for msg_path in msg_paths]
-            custom_msg_paths = tuple(chain.from_iterable(custom_paths))
-            for msgpath in custom_msg_paths:
-                msgdef = msgpath.read_text(encoding="utf-8")
-                add_types.update(get_types_from_msg(msgdef, guess_msgtype(msgpath)))
-            register_types(add_types)
+            register_custom_messages(msg_paths)
         return f(*args, **kwargs)
 
     return wrapper
@@ -0,0 +1,428 @@
+"""Output writer helpers shared by the rosbag tools"""
+
+from __future__ import annotations
+
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+from pathlib import Path
+from typing import TYPE_CHECKING, NamedTuple, cast
+
+from rosbags.interfaces import ConnectionExtRosbag1, ConnectionExtRosbag2
+from rosbags.rosbag1 import Writer as Writer1
+from rosbags.rosbag1.reader import RecordType
+from rosbags.rosbag1.writer import Header, WriteChunk, serialize_time, serialize_uint32
+from rosbags.rosbag2 import Writer as Writer2
+
+from rosbag_tools.mcap import McapWriter
+from rosbag_tools.profiling import profile_stage
+from rosbag_tools.utils import rosbags_internals_supported
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+    from typing import Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple, Type
+
+    from rosbags.interfaces import Connection
+
+    from rosbag_tools.conversion import MessageConverter
+
+    ConnectionSetter = Callable[[Writer1 | Writer2, List[Connection]], dict]
+    WriterFactory = Callable[[Path], Writer1 | Writer2]
+
+# Compression formats of the output rosbags
+ROS1_COMPRESSIONS = ("lz4", "bz2")
+ROS2_COMPRESSIONS = ("zstd",)
+MCAP_COMPRESSIONS = ("zstd", "lz4")
+COMPRESSIONS = ("none", *ROS1_COMPRESSIONS, *ROS2_COMPRESSIONS)
+
+
+class WriterOptions(NamedTuple):
+    """Settings of the output rosbags"""
+
+    # Compression format : 'none', 'lz4' or 'bz2' for ROS 1, 'none' or 'zstd' for ROS 2,
+    # 'none', 'zstd' or 'lz4' for MCAP files.
+    # None writes uncompressed chunks, and copies ROS 1 chunks whatever their compression.
+    compression: Optional[str] = None
+    # Size of the uncompressed ROS 1 or MCAP chunks, in bytes. None keeps the writer default (1 MiB).
+    chunk_size: Optional[int] = None
+    # Number of threads that compress ROS 1 chunks in parallel.
+    # 0 compresses in the writing thread. Other writers always compress while writing.
+    threads: int = 0
+
+    @property
+    def is_compressed(self) -> bool:
+        """Are new chunks or messages compressed ?"""
+        return self.compression not in (None, "none")
+
+    def check(self, Writer: Type[Writer1 | Writer2 | McapWriter]) -> None:
+        """Check that the settings can be used with a writer class
+
+        Args:
+            Writer: Writer1, Writer2 or McapWriter
+
+        Raises:
+            ValueError: Unknown compression, or compression that does not exist for this rosbag version
+        """
+        if self.compression is not None and self.compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unknown compression {self.compression!r}. "
+                f"Choose one of {', '.join(COMPRESSIONS)}."
+            )
+        if issubclass(Writer, Writer1):
+            supported, kind = ROS1_COMPRESSIONS, "ROS 1 rosbags"
+        elif issubclass(Writer, McapWriter):
+            supported, kind = MCAP_COMPRESSIONS, "MCAP files"
+        else:
+            supported, kind = ROS2_COMPRESSIONS, "ROS 2 rosbags"
+        if self.is_compressed and self.compression not in supported:
+            raise ValueError(
+                f"Compression {self.compression!r} is not available for "
+                f"{kind}. Choose one of none, {', '.join(supported)}."
+            )
+        if self.chunk_size is not None and self.chunk_size < 1:
+            raise ValueError(f"Chunk size should be positive [got {self.chunk_size}]")
+        if self.threads < 0:
+            raise ValueError(f"Number of threads should be positive [got {self.threads}]")
+
+    def create(
+        self, Writer: Type[Writer1 | Writer2 | McapWriter], path: Path | str
+    ) -> Writer1 | Writer2 | McapWriter:
+        """Create a writer with these settings. The writer is not opened.
+
+        Args:
+            Writer: Writer1, Writer2 or McapWriter
+            path: Path of the output rosbag
+
+        Returns:
+            Writer1 | Writer2 | McapWriter: Writer instance
+        """
+        if issubclass(Writer, Writer1):
+            if self.threads and self.is_compressed and rosbags_internals_supported():
+                writer = ParallelChunkWriter(path, self.threads)
+            else:
+                writer = Writer(path)
+            if self.is_compressed:
+                writer.set_compression(
+                    Writer1.CompressionFormat[self.compression.upper()]
+                )
+            if self.chunk_size is not None:
+                writer.chunk_threshold = self.chunk_size
+            return writer
+
+        if issubclass(Writer, McapWriter):
+            writer = Writer(path)
+            if self.is_compressed:
+                writer.set_compression(self.compression)
+            if self.chunk_size is not None:
+                writer.chunk_threshold = self.chunk_size
+            return writer
+
+        writer = Writer(path)
+        if self.is_compressed:
+            # Each message is compressed, as with 'ros2 bag record --compression-mode message'
+            writer.set_compression(
+                Writer2.CompressionMode.MESSAGE,
+                Writer2.CompressionFormat[self.compression.upper()],
+            )
+        return writer
+
+
+def output_writer_class(path: Path | str) -> Type[Writer1 | Writer2 | McapWriter]:
+    """Writer class of an output rosbag, from the extension of its path
+
+    Args:
+        path: Path of the output rosbag
+
+    Returns:
+        Type[Writer1 | Writer2 | McapWriter]: McapWriter for a .mcap file, Writer1 for a .bag file, Writer2 otherwise
+    """
+    suffix = Path(path).suffix
+    if suffix == ".mcap":
+        return McapWriter
+    return Writer1 if suffix == ".bag" else Writer2
+
+
+def writer_factory(
+    Writer: Type[Writer1 | Writer2], options: Optional[WriterOptions] = None
+) -> Callable[[Path | str], Writer1 | Writer2]:
+    """Function that creates writers of class `Writer` with settings `options`
+
+    The settings are checked before any writer is created.
+
+    Args:
+        Writer: Writer1 or Writer2
+        options: Settings of the output rosbags. Defaults to None, the writer defaults.
+
+    Returns:
+        Callable[[Path | str], Writer1 | Writer2]: Function that creates a writer (not opened) from a path
+    """
+    if options is None:
+        return Writer
+    options.check(Writer)
+    return partial(options.create, Writer)
+
+
+def flush_chunks(writer: Writer1) -> None:
+    """Write the chunk in progress of a ROS 1 writer, and every chunk that is being compressed
+
+    Args:
+        writer: Open ROS 1 rosbag writer
+    """
+    writer.write_chunk(writer.chunks[-1])
+    if isinstance(writer, ParallelChunkWriter):
+        writer.flush()
+
+
+class ParallelChunkWriter(Writer1):
+    """ParallelChunkWriter - ROS 1 writer that compresses its chunks in worker threads
+
+    Full chunks are compressed in a thread pool, while the next chunks are filled.
+    Compressed chunks are written in order, so that the output is the same as with
+    `Writer1`. At most two chunks per thread are waiting to be written.
+    """
+
+    def __init__(self, path: Path | str, threads: int) -> None:
+        """Create a ParallelChunkWriter instance
+
+        Args:
+            path: Path of the output rosbag
+            threads: Number of compression threads
+        """
+        super().__init__(path)
+        self.threads = threads
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Deque[Tuple[WriteChunk, Future]] = deque()
+
+    def open(self) -> None:
+        super().open()
+        self._executor = ThreadPoolExecutor(
+            self.threads, thread_name_prefix="rosbag-tools-compress"
+        )
+
+    def write_chunk(self, chunk: WriteChunk) -> None:
+        """Compress a chunk in a worker thread, it is written once compressed"""
+        if chunk.data.tell() == 0:
+            return
+        future = self._executor.submit(self.compressor, chunk.data.getvalue())
+        self._pending.append((chunk, future))
+        if chunk is self.chunks[-1]:
+            self.chunks.append(WriteChunk(BytesIO(), -1, 2**64, 0, defaultdict(list)))
+        while len(self._pending) > 2 * self.threads:
+            self._write_pending()
+
+    def _write_pending(self) -> None:
+        """Write the oldest compressed chunk, waiting for its compression"""
+        chunk, future = self._pending.popleft()
+        data = future.result()
+        chunk.pos = self.bio.tell()
+
+        header = Header()
+        header.set_string("compression", self.compression_format)
+        header.set_uint32("size", chunk.data.tell())
+        header.write(self.bio, RecordType.CHUNK)
+        self.bio.write(serialize_uint32(len(data)))
+        self.bio.write(data)
+
+        for cid, items in chunk.connections.items():
+            header = Header()
+            header.set_uint32("ver", 1)
+            header.set_uint32("conn", cid)
+            header.set_uint32("count", len(items))
+            header.write(self.bio, RecordType.IDXDATA)
+            self.bio.write(serialize_uint32(len(items) * 12))
+            for time, offset in items:
+                self.bio.write(serialize_time(time) + serialize_uint32(offset))
+        chunk.data.close()
+
+    def flush(self) -> None:
+        """Write every chunk that is being compressed"""
+        while self._pending:
+            self._write_pending()
+
+    def close(self) -> None:
+        self.write_chunk(self.chunks[-1])
+        self.flush()
+        self._executor.shutdown()
+        super().close()
+
+
+def add_writer_connections(
+    writer: Writer1 | Writer2 | McapWriter,
+    connections: Sequence[Connection],
+    is_ros1_writer: bool,
+    converter: Optional[MessageConverter] = None,
+) -> dict:
+    """Add connections of the input rosbag to an open writer
+
+    Args:
+        writer: Open writer of the output rosbag
+        connections: Connections of the input rosbag to add
+        is_ros1_writer: Is the output a ROS 1 rosbag ?
+        converter: Converter of the connections, when the input and the output are of different ROS versions. Defaults to None.
+
+    Returns:
+        dict: Connection map, from the ids of the input connections to the output connections
+    """
+    conn_map = {}
+    for conn in connections:
+        if converter is not None:
+            conn_map[conn.id] = converter.add_connection(writer, conn)
+        elif is_ros1_writer:
+            ext = cast(ConnectionExtRosbag1, conn.ext)
+            conn_map[conn.id] = writer.add_connection(
+                conn.topic,
+                conn.msgtype,
+                conn.msgdef,
+                conn.digest,
+                ext.callerid,
+                ext.latching,
+            )
+        else:
+            # ROS 2
+            ext = cast(ConnectionExtRosbag2, conn.ext)
+            conn_map[conn.id] = writer.add_connection(
+                conn.topic,
+                conn.msgtype,
+                serialization_format=ext.serialization_format,
+                offered_qos_profiles=ext.offered_qos_profiles,
+            )
+    return conn_map
+
+
+class WriterPool:
+    """WriterPool - Set of output rosbags that are opened lazily, with a bounded number of open writers
+
+    Each output is identified by its index in `paths`. A writer is opened when its
+    output receives its first message. When more than `max_open` writers are open,
+    one is closed : an output whose last message timestamp is passed when `stops`
+    are known, otherwise the least recently used one. Outputs that never received a
+    message are created as empty rosbags when the pool is closed.
+    """
+
+    def __init__(
+        self,
+        paths: Sequence[Path | str],
+        Writer: Type[Writer1 | Writer2] | WriterFactory,
+        connections: List[Connection],
+        set_connections: ConnectionSetter,
+        max_open: int = 2,
+        stops: Optional[Sequence[int]] = None,
+    ) -> None:
+        """Create a WriterPool instance
+
+        Args:
+            paths: Paths of the output rosbags
+            Writer: Writer class used for every output, or function that creates a writer from a path (see `writer_factory`)
+            connections: Connections of the input rosbag
+            set_connections: Function that adds `connections` to a writer and returns the connection map
+            max_open: Maximum number of writers that can stay open at once. Defaults to 2.
+            stops: Timestamp (ns) right after the last message of each output. Defaults to None, if unknown.
+        """
+        if max_open < 1:
+            raise ValueError(
+                f"At least one writer should be open at once [got {max_open}]"
+            )
+        self._paths: Tuple[Path] = tuple(Path(p) for p in paths)
+        self._Writer = Writer
+        self._connections = connections
+        self._set_connections = set_connections
+        self._max_open = max_open
+        self._stops = None if stops is None else tuple(stops)
+        self._open: OrderedDict[int, Tuple[Writer1 | Writer2, dict]] = OrderedDict()
+        self._closed: Set[int] = set()
+
+    @property
+    def paths(self) -> Tuple[Path]:
+        """Paths of the output rosbags"""
+        return self._paths
+
+    def get(
+        self, idx: int, timestamp: Optional[int] = None
+    ) -> Tuple[Writer1 | Writer2, dict]:
+        """Get the writer of output `idx` and its connection map, opening it if needed
+
+        Args:
+            idx: Index of the output
+            timestamp: Timestamp (ns) of the message to write. Defaults to None.
+
+        Raises:
+            RuntimeError: Output `idx` was already closed to respect the open writers limit
+
+        Returns:
+            Tuple[Writer1 | Writer2, dict]: Writer instance and its connection map
+        """
+        if idx in self._open:
+            self._open.move_to_end(idx)
+            return self._open[idx]
+        if idx in self._closed:
+            raise RuntimeError(
+                f"Output {self._paths[idx].name} was already closed. "
+                f"Messages are not ordered in time, increase the maximum number of "
+                f"open writers (currently {self._max_open})."
+            )
+        while len(self._open) >= self._max_open:
+            self._close_writer(self._writer_to_close(timestamp))
+        with profile_stage("open-writer"):
+            writer = self._Writer(self._paths[idx])
+            writer.open()
+        with profile_stage("connections"):
+            conn_map = self._set_connections(writer, self._connections)
+        self._open[idx] = (writer, conn_map)
+        return self._open[idx]
+
+    def write(self, idx: int, conn: Connection, timestamp: int, data: bytes) -> None:
+        """Write a message of the input rosbag in output `idx`
+
+        Messages from connections that are not in the connection map are ignored.
+
+        Args:
+            idx: Index of the output
+            conn: Input connection of the message
+            timestamp: Message timestamp (ns)
+            data: Serialized message data
+        """
+        writer, conn_map = self.get(idx, timestamp)
+        if conn.id in conn_map:
+            writer.write(conn_map[conn.id], timestamp, data)
+
+    def _writer_to_close(self, timestamp: Optional[int]) -> int:
+        """Output whose writer is closed to open another one
+
+        An output that has ended at `timestamp` is closed first, the least recently
+        used output otherwise.
+        """
+        if self._stops is not None and timestamp is not None:
+            for idx in self._open:
+                if self._stops[idx] <= timestamp:
+                    return idx
+        return next(iter(self._open))
+
+    def _close_writer(self, idx: int) -> None:
+        """Close the writer of output `idx`"""
+        writer, _ = self._open.pop(idx)
+        with profile_stage("close-writer"):
+            writer.close()
+        self._closed.add(idx)
+
+    def close(self, create_missing: bool = True) -> None:
+        """Close all open writers
+
+        Args:
+            create_missing: Create the outputs that never received a message as empty rosbags. Defaults to True.
+        """
+        for idx in tuple(self._open):
+            self._close_writer(idx)
+        if not create_missing:
+            return
+        for idx in range(len(self._paths)):
+            if idx not in self._closed:
+                self.get(idx)
+                self._close_writer(idx)
+
+    def __enter__(self) -> WriterPool:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> bool:
+        self.close(create_missing=exc_type is None)
+        return False
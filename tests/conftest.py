@@ -0,0 +1,61 @@
+"""Fixtures of the tests : deterministic synthetic rosbags, in ROS 1 and in ROS 2"""
+
+from pathlib import Path
+
+import pytest
+from rosbags.rosbag1 import Reader as Reader1
+from rosbags.rosbag2 import Reader as Reader2
+
+from benchmarks.synthetic import generate_rosbag, make_spec
+
+# 4 s of IMU (50 Hz), odometry (20 Hz) and images (5 Hz). The images are large
+# enough for the ROS 1 rosbag to have several chunks.
+SPEC = make_spec(
+    duration=4.0,
+    imu_rate=50.0,
+    odom_rate=20.0,
+    image_rate=5.0,
+    image_width=320,
+    image_height=240,
+)
+
+
+def read_rosbag(path):
+    """Topic, timestamp and data of the messages of a rosbag, in the order they are read"""
+    path = Path(path)
+    if path.suffix == ".mcap":
+        from rosbag_tools.mcap import McapReader as Reader
+    else:
+        Reader = Reader1 if path.suffix == ".bag" else Reader2
+    with Reader(path) as reader:
+        return [(conn.topic, tstamp, data) for conn, tstamp, data in reader.messages()]
+
+
+@pytest.fixture(scope="session")
+def spec():
+    """Spec of the synthetic rosbags"""
+    return SPEC
+
+
+@pytest.fixture(scope="session")
+def ros1_bag(tmp_path_factory):
+    """Synthetic ROS 1 rosbag"""
+    return generate_rosbag(tmp_path_factory.mktemp("ros1") / "synthetic.bag", SPEC)
+
+
+@pytest.fixture(scope="session")
+def ros2_bag(tmp_path_factory):
+    """Synthetic ROS 2 rosbag"""
+    return generate_rosbag(tmp_path_factory.mktemp("ros2") / "synthetic", SPEC)
+
+
+@pytest.fixture(params=["ros1", "ros2"])
+def rosbag(request):
+    """Synthetic rosbag, in ROS 1 and in ROS 2"""
+    return request.getfixturevalue(f"{request.param}_bag")
+
+
+@pytest.fixture
+def out_path(rosbag, tmp_path):
+    """Function that gives an output path with the same rosbag format as `rosbag`"""
+    return lambda name: tmp_path / (f"{name}.bag" if rosbag.suffix == ".bag" else name)
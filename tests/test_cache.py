@@ -0,0 +1,128 @@
+"""Tests of the cache of rosbag summaries, rosbag_tools.cache"""
+
+import os
+import shutil
+from types import SimpleNamespace
+
+import pytest
+
+from rosbag_tools import cache
+from rosbag_tools.cache import ScanCache, scan_rosbags
+from rosbag_tools.clip.clipper import BagClipper
+from rosbag_tools.metadata import BagSummary, read_summary
+
+
+@pytest.fixture
+def dataset(ros1_bag, ros2_bag, tmp_path):
+    """Dataset directory with a ROS 1 and a ROS 2 rosbag"""
+    folder = tmp_path / "dataset"
+    folder.mkdir()
+    shutil.copy(ros1_bag, folder / "a.bag")
+    shutil.copytree(ros2_bag, folder / "b")
+    return folder
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Paths of the rosbags that are read by scan_rosbags"""
+    paths = []
+
+    def recording_read_summary(path):
+        paths.append(path)
+        return read_summary(path)
+
+    monkeypatch.setattr(cache, "read_summary", recording_read_summary)
+    return paths
+
+
+def scan(folder):
+    paths = [folder / "a.bag", folder / "b"]
+    summaries, errors = scan_rosbags(folder, paths)
+    assert not errors
+    return summaries
+
+
+def test_scan_uses_cache(dataset, reads):
+    summaries = scan(dataset)
+    assert sorted(reads) == [dataset / "a.bag", dataset / "b"]
+    assert (dataset / ScanCache.FILENAME).exists()
+
+    reads.clear()
+    assert scan(dataset) == summaries
+    assert not reads
+
+
+def test_scan_without_cache(dataset, reads):
+    scan_rosbags(dataset, [dataset / "a.bag"], use_cache=False)
+    assert reads == [dataset / "a.bag"]
+    assert not (dataset / ScanCache.FILENAME).exists()
+
+
+def test_rescan_changed_size(dataset, reads, tmp_path):
+    first = scan(dataset)
+    # The rosbag is replaced by a shorter one
+    with BagClipper(dataset / "a.bag") as clipper:
+        clipper.clip_rosbag(0.0, 2.0, tmp_path / "clip.bag")
+    os.replace(tmp_path / "clip.bag", dataset / "a.bag")
+
+    reads.clear()
+    summaries = scan(dataset)
+    assert reads == [dataset / "a.bag"]
+    assert summaries[dataset / "a.bag"] == read_summary(dataset / "a.bag")
+    assert (
+        summaries[dataset / "a.bag"].message_count
+        < first[dataset / "a.bag"].message_count
+    )
+    assert summaries[dataset / "b"] == first[dataset / "b"]
+
+
+def test_rescan_changed_mtime(dataset, reads):
+    scan(dataset)
+    # Only the modification time of a file of the ROS 2 rosbag changes
+    metadata = dataset / "b" / "metadata.yaml"
+    stat = metadata.stat()
+    os.utime(metadata, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    reads.clear()
+    scan(dataset)
+    assert reads == [dataset / "b"]
+    reads.clear()
+    scan(dataset)
+    assert not reads
+
+
+def test_invalidate(dataset, reads):
+    scan(dataset)
+    with ScanCache(dataset) as scan_cache:
+        scan_cache.invalidate(dataset / "a.bag")
+    reads.clear()
+    scan(dataset)
+    assert reads == [dataset / "a.bag"]
+
+
+def summary(path):
+    """Summary of a rosbag with a single message"""
+    return BagSummary(path, 0, 1, 1, {"/t": "std_msgs/msg/Empty"}, {"/t": 1})
+
+
+def test_evicts_least_recently_used(tmp_path, monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(cache, "time", SimpleNamespace(time=lambda: next(clock)))
+    paths = []
+    for name in "abc":
+        path = tmp_path / f"{name}.bag"
+        path.write_bytes(name.encode())
+        paths.append(path)
+
+    with ScanCache(tmp_path, max_entries=2) as scan_cache:
+        for path in paths:
+            scan_cache.put(summary(path))
+        # a is used after b : b is the least recently used entry
+        scan_cache.touch([paths[0]])
+    with ScanCache(tmp_path, max_entries=2) as scan_cache:
+        assert [scan_cache.get(path) is not None for path in paths] == [True, False, True]
+
+
+def test_max_entries(tmp_path):
+    with pytest.raises(ValueError):
+        ScanCache(tmp_path, max_entries=0)
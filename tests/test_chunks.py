@@ -0,0 +1,170 @@
+"""Tests of the verbatim copy of ROS 1 chunks, rosbag_tools.chunks"""
+
+import warnings
+
+import pytest
+from conftest import SPEC, read_rosbag
+from rosbags.rosbag1 import Reader as Reader1
+from rosbags.rosbag1 import Writer as Writer1
+from rosbags.rosbag1.reader import Header, RecordType, read_uint32
+
+from benchmarks.synthetic import START_TIME, generate_messages
+from rosbag_tools import utils
+from rosbag_tools.chunks import ChunkCopier
+from rosbag_tools.clip.clipper import BagClipper
+from rosbag_tools.topic_remove.topic_remover import BagTopicRemover
+from rosbag_tools.writers import ParallelChunkWriter, add_writer_connections
+
+
+def write_rosbag(path, compression=None, Writer=Writer1, **kwargs):
+    """Write the synthetic messages in a ROS 1 rosbag, with small chunks"""
+    writer = Writer(path, **kwargs)
+    if compression is not None:
+        writer.set_compression(Writer1.CompressionFormat[compression.upper()])
+    writer.chunk_threshold = 256 * 1024
+    with writer:
+        conns = {
+            topic.topic: writer.add_connection(topic.topic, topic.msgtype)
+            for topic in SPEC.topics
+        }
+        for topic, timestamp, data in generate_messages(SPEC, ros1=True):
+            writer.write(conns[topic.topic], timestamp, data)
+    return path
+
+
+@pytest.fixture(scope="module", params=[None, "lz4", "bz2"])
+def chunked_bag(request, tmp_path_factory):
+    """ROS 1 rosbag with many chunks, in each chunk compression"""
+    path = tmp_path_factory.mktemp("chunks") / f"{request.param}.bag"
+    return write_rosbag(path, request.param)
+
+
+def index(path):
+    """Index entries (timestamp and offset in the chunk) and chunk infos of a ROS 1 rosbag"""
+    with Reader1(path) as reader:
+        entries = {
+            conn.topic: [(e.time, e.offset) for e in reader.indexes[conn.id]]
+            for conn in reader.connections
+        }
+        # Chunks that only hold connection records are not compared
+        chunk_infos = [
+            (info.start_time, info.end_time, info.connection_counts)
+            for info in reader.chunk_infos
+            if info.connection_counts
+        ]
+    return entries, chunk_infos
+
+
+def chunk_info_times(path):
+    """Start and end times written in the chunk info records of a ROS 1 rosbag"""
+    with path.open("rb") as bio:
+        bio.readline()
+        bag_header = Header.read(bio, RecordType.BAGHEADER)
+        bio.seek(bag_header.get_uint64("index_pos"))
+        for _ in range(bag_header.get_uint32("conn_count")):
+            Header.read(bio, RecordType.CONNECTION)
+            bio.seek(read_uint32(bio), 1)
+        times = []
+        for _ in range(bag_header.get_uint32("chunk_count")):
+            header = Header.read(bio, RecordType.CHUNK_INFO)
+            times.append((header.get_time("start_time"), header.get_time("end_time")))
+            bio.seek(read_uint32(bio), 1)
+    return times
+
+
+def records(path):
+    """Compressed data of the chunks of a ROS 1 rosbag"""
+    with Reader1(path) as reader:
+        copier = ChunkCopier(reader)
+        return [copier.read_record(chunk) for chunk in copier.chunks]
+
+
+def copy_chunks(inbag, outbag, start=None, stop=None, compression=None):
+    """Write the chunks of `inbag` in `outbag` with a ChunkCopier"""
+    copied = []
+    with Reader1(inbag) as reader, Writer1(outbag) as writer:
+        conn_map = add_writer_connections(writer, reader.connections, True)
+        copier = ChunkCopier(reader, start=start, stop=stop, compression=compression)
+        for chunk in copier.chunks:
+            copied.append(copier.write(chunk, writer, conn_map))
+    return copied
+
+
+def test_copy_every_chunk(chunked_bag, tmp_path):
+    outbag = tmp_path / "copy.bag"
+    copied = copy_chunks(chunked_bag, outbag)
+    assert len(copied) > 10 and all(copied)
+    assert read_rosbag(outbag) == read_rosbag(chunked_bag)
+    assert index(outbag) == index(chunked_bag)
+    # Compressed bytes are copied as is
+    assert records(outbag) == records(chunked_bag)
+    # Chunk infos keep valid time ranges, that give the time range of the rosbag
+    end = max(tstamp for _, tstamp, _ in read_rosbag(chunked_bag))
+    assert all(
+        START_TIME <= start <= stop <= end for start, stop in chunk_info_times(outbag)
+    )
+
+
+def test_copy_chunks_in_window(chunked_bag, tmp_path):
+    outbag = tmp_path / "clip.bag"
+    start, stop = START_TIME + 1_100_000_000, START_TIME + 2_900_000_000
+    copied = copy_chunks(chunked_bag, outbag, start, stop)
+    # Chunks on the window limits are rewritten, the other ones are copied
+    assert not copied[0] and not copied[-1] and any(copied)
+
+    expected = [msg for msg in read_rosbag(chunked_bag) if start <= msg[1] < stop]
+    assert read_rosbag(outbag) == expected
+    entries, chunk_infos = index(outbag)
+    assert {topic: [time for time, _ in items] for topic, items in entries.items()} == {
+        topic: [msg[1] for msg in expected if msg[0] == topic] for topic in entries
+    }
+    assert sum(sum(counts.values()) for _, _, counts in chunk_infos) == len(expected)
+    assert all(start <= begin <= end < stop for begin, end in chunk_info_times(outbag))
+
+
+def test_copy_chunks_other_compression(tmp_path):
+    inbag = write_rosbag(tmp_path / "in.bag", "lz4")
+    outbag = tmp_path / "out.bag"
+    writer = Writer1(outbag)
+    writer.set_compression(Writer1.CompressionFormat.BZ2)
+    with Reader1(inbag) as reader, writer:
+        conn_map = add_writer_connections(writer, reader.connections, True)
+        copier = ChunkCopier(reader, compression="bz2")
+        copied = [copier.write(chunk, writer, conn_map) for chunk in copier.chunks]
+    assert not any(copied)
+    assert read_rosbag(outbag) == read_rosbag(inbag)
+    assert {record.compression for record in records(outbag)} == {"bz2"}
+
+
+def test_topic_remove_copies_chunks(chunked_bag, tmp_path):
+    image_topic = SPEC.topics_of("image")[0]
+    with BagTopicRemover(chunked_bag) as remover:
+        remover.remove([image_topic])
+        remover.export(tmp_path / "filt.bag")
+    expected = [msg for msg in read_rosbag(chunked_bag) if msg[0] != image_topic]
+    assert read_rosbag(tmp_path / "filt.bag") == expected
+
+
+def test_parallel_chunk_writer(tmp_path):
+    sequential = write_rosbag(tmp_path / "sequential.bag", "lz4")
+    parallel = write_rosbag(
+        tmp_path / "parallel.bag", "lz4", ParallelChunkWriter, threads=3
+    )
+    assert parallel.read_bytes() == sequential.read_bytes()
+
+
+def test_other_rosbags_version(ros1_bag, tmp_path, monkeypatch):
+    monkeypatch.setattr(utils, "ROSBAGS_INTERNALS_VERSION", "0.0.0")
+    utils.rosbags_internals_supported.cache_clear()
+    try:
+        with pytest.warns(RuntimeWarning):
+            assert not utils.rosbags_internals_supported()
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            with BagClipper(ros1_bag) as clipper:
+                clipper.clip_rosbag(1.0, 3.0, tmp_path / "clip.bag")
+    finally:
+        utils.rosbags_internals_supported.cache_clear()
+    start, stop = START_TIME + 10**9, START_TIME + 3 * 10**9
+    expected = [msg for msg in read_rosbag(ros1_bag) if start <= msg[1] <= stop]
+    assert read_rosbag(tmp_path / "clip.bag") == expected
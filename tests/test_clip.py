@@ -0,0 +1,58 @@
+"""Tests of rosbag_tools.clip"""
+
+from collections import Counter
+
+import pytest
+from conftest import read_rosbag
+
+from benchmarks.synthetic import START_TIME
+from rosbag_tools import exceptions
+from rosbag_tools.clip.clipper import BagClipper, clip_window
+
+
+def in_window(messages, start, end):
+    """Messages between two elapsed times, both included"""
+    start_ns, end_ns = START_TIME + int(start * 1e9), START_TIME + int(end * 1e9)
+    return [msg for msg in messages if start_ns <= msg[1] <= end_ns]
+
+
+def test_clip_window():
+    assert clip_window(100, 200) == (100, 201)
+    assert clip_window(10**9, 5 * 10**9, 1.0, 2.0) == (2 * 10**9, 3 * 10**9 + 1)
+
+
+@pytest.mark.parametrize("chunk_copy", [True, False])
+def test_clip_rosbag(rosbag, out_path, chunk_copy):
+    with BagClipper(rosbag) as clipper:
+        clipper.clip_rosbag(1.0, 3.0, out_path("clip"), chunk_copy=chunk_copy)
+    assert read_rosbag(out_path("clip")) == in_window(read_rosbag(rosbag), 1.0, 3.0)
+
+
+def test_clip_rosbag_invalid_window(rosbag, out_path):
+    with BagClipper(rosbag) as clipper:
+        with pytest.raises(exceptions.InvalidTimestampError):
+            clipper.clip_rosbag(3.0, 1.0, out_path("clip"))
+
+
+def test_clip_intervals(rosbag, out_path):
+    intervals = [(0.0, 1.0), (0.5, 2.0), (3.0, 3.5)]
+    with BagClipper(rosbag) as clipper:
+        clipper.clip_rosbag_intervals(intervals, out_path("clip"), max_open_writers=1)
+    messages = read_rosbag(rosbag)
+    outbag = out_path("clip")
+    for idx, (start, end) in enumerate(intervals, start=1):
+        clip = read_rosbag(outbag.with_name(f"{outbag.stem}_{idx:02d}{outbag.suffix}"))
+        assert clip == in_window(messages, start, end)
+
+
+def test_clip_intervals_merge(rosbag, out_path):
+    with BagClipper(rosbag) as clipper:
+        clipper.clip_rosbag_intervals(
+            [(0.0, 1.0), (0.5, 2.0), (3.0, 3.5)], out_path("clip"), merge=True
+        )
+    messages = read_rosbag(rosbag)
+    # Messages of overlapping intervals are written once
+    merged = read_rosbag(out_path("clip"))
+    assert Counter(merged) == Counter(
+        in_window(messages, 0.0, 2.0) + in_window(messages, 3.0, 3.5)
+    )
@@ -0,0 +1,38 @@
+"""Tests of the dataset tools compute_duration and topic_compare"""
+
+import shutil
+
+import pytest
+from conftest import SPEC
+
+from rosbag_tools.compute_duration.duration_calculator import DurationCalculator
+from rosbag_tools.topic_compare.topic_comparator import BagTopicComparator
+
+
+@pytest.fixture
+def dataset(ros1_bag, ros2_bag, tmp_path):
+    """Dataset with a ROS 2 rosbag at its root and a ROS 1 rosbag in a subdirectory"""
+    folder = tmp_path / "dataset"
+    (folder / "day1").mkdir(parents=True)
+    shutil.copy(ros1_bag, folder / "day1" / "a.bag")
+    shutil.copytree(ros2_bag, folder / "b")
+    return folder
+
+
+def test_compute_duration_finds_nested_rosbags(dataset):
+    calculator = DurationCalculator(dataset)
+    calculator.extract_data(use_cache=False)
+    assert not calculator.errors
+    assert set(calculator.durations) == {"a", "b", calculator.TOTAL_KEY}
+    duration = calculator.durations["a"]
+    assert calculator.durations["b"] == duration == pytest.approx(SPEC.duration, abs=0.1)
+    assert calculator.total == pytest.approx(2 * duration)
+
+
+def test_topic_compare_finds_nested_rosbags(dataset):
+    comparator = BagTopicComparator(dataset)
+    comparator.extract_data(use_cache=False)
+    assert not comparator.errors
+    assert set(comparator.topics["topics"]) == {"a", "b"}
+    assert sorted(comparator.topics["common"]) == sorted(t.topic for t in SPEC.topics)
+    assert comparator.topics["difference"] == {"a": [], "b": []}
@@ -0,0 +1,110 @@
+"""Tests of the fast odometry decoder, rosbag_tools.export_odom.decoding"""
+
+import itertools
+
+import numpy as np
+import pytest
+from rosbags.serde import deserialize_cdr, deserialize_ros1, serialize_cdr, serialize_ros1
+from rosbags.typesys import types
+from rosbags.typesys.types import builtin_interfaces__msg__Time as Time
+from rosbags.typesys.types import geometry_msgs__msg__Point as Point
+from rosbags.typesys.types import geometry_msgs__msg__Pose as Pose
+from rosbags.typesys.types import geometry_msgs__msg__PoseWithCovariance as PoseCov
+from rosbags.typesys.types import geometry_msgs__msg__Quaternion as Quaternion
+from rosbags.typesys.types import geometry_msgs__msg__Twist as Twist
+from rosbags.typesys.types import geometry_msgs__msg__TwistWithCovariance as TwistCov
+from rosbags.typesys.types import geometry_msgs__msg__Vector3 as Vector3
+from rosbags.typesys.types import nav_msgs__msg__Odometry as Odometry
+from rosbags.typesys.types import std_msgs__msg__Header as Header
+
+from rosbag_tools.export_odom.decoding import (
+    ODOMETRY_MSGTYPE,
+    OdometryDecoder,
+    pose_from_message,
+)
+
+# Frame id lengths that give every alignment of the fields that follow them
+FRAME_ID_LENGTHS = list(itertools.product(range(9), range(9)))
+SERIALIZATIONS = {
+    "ros1": (True, serialize_ros1, deserialize_ros1),
+    "cdr": (False, serialize_cdr, deserialize_cdr),
+}
+
+
+def make_message(idx, frame_len, child_len, rng):
+    """Odometry message with random stamp and pose, and frame ids of the given lengths"""
+    values = rng.normal(0.0, 100.0, 7)
+    return Odometry(
+        Header(
+            Time(int(rng.integers(0, 2**31)), int(rng.integers(0, 10**9))),
+            "f" * frame_len,
+        ),
+        "c" * child_len,
+        PoseCov(Pose(Point(*values[:3]), Quaternion(*values[3:])), rng.normal(size=36)),
+        TwistCov(
+            Twist(Vector3(idx, 0.0, 0.0), Vector3(0.0, 0.0, idx)), rng.normal(size=36)
+        ),
+    )
+
+
+def expected_batch(datas, deserialize):
+    """Stamps and poses of fully deserialized messages"""
+    stamps, poses = zip(
+        *(pose_from_message(deserialize(data, ODOMETRY_MSGTYPE)) for data in datas)
+    )
+    return np.array(stamps), np.array(poses).T
+
+
+@pytest.mark.parametrize("serialization", SERIALIZATIONS)
+@pytest.mark.parametrize("frame_len, child_len", FRAME_ID_LENGTHS)
+def test_decode_frame_id_lengths(serialization, frame_len, child_len):
+    is_ros1, serialize, deserialize = SERIALIZATIONS[serialization]
+    rng = np.random.default_rng(frame_len * 9 + child_len)
+    datas = [
+        bytes(serialize(make_message(idx, frame_len, child_len, rng), ODOMETRY_MSGTYPE))
+        for idx in range(3)
+    ]
+    decoder = OdometryDecoder(types, is_ros1, deserialize)
+    assert decoder.is_standard
+
+    batch = decoder.decode(datas)
+    stamps, poses = expected_batch(datas, deserialize)
+    assert decoder.fallbacks == 0
+    np.testing.assert_array_equal(batch.stamps, stamps)
+    np.testing.assert_array_equal(batch.poses, poses)
+
+
+@pytest.mark.parametrize("serialization", SERIALIZATIONS)
+def test_decode_mixed_batch(serialization):
+    """Messages of a batch have their own frame id lengths"""
+    is_ros1, serialize, deserialize = SERIALIZATIONS[serialization]
+    rng = np.random.default_rng(0)
+    datas = [
+        bytes(serialize(make_message(idx, *lengths, rng), ODOMETRY_MSGTYPE))
+        for idx, lengths in enumerate([(0, 0), (5, 1), (3, 30), (17, 8), (1, 2)])
+    ]
+    decoder = OdometryDecoder(types, is_ros1, deserialize)
+    batch = decoder.decode(datas)
+    stamps, poses = expected_batch(datas, deserialize)
+    assert decoder.fallbacks == 0
+    np.testing.assert_array_equal(batch.stamps, stamps)
+    np.testing.assert_array_equal(batch.poses, poses)
+
+
+def test_decode_big_endian_cdr():
+    """Big-endian CDR messages are fully deserialized"""
+    rng = np.random.default_rng(0)
+    datas = [
+        bytes(serialize_cdr(make_message(0, 4, 5, rng), ODOMETRY_MSGTYPE)),
+        bytes(serialize_cdr(make_message(1, 4, 5, rng), ODOMETRY_MSGTYPE, False)),
+    ]
+    decoder = OdometryDecoder(types, False, deserialize_cdr)
+    batch = decoder.decode(datas)
+    stamps, poses = expected_batch(datas, deserialize_cdr)
+    assert decoder.fallbacks == 1
+    np.testing.assert_array_equal(batch.stamps, stamps)
+    np.testing.assert_array_equal(batch.poses, poses)
+
+
+def test_decode_empty_batch():
+    assert OdometryDecoder(types, True, deserialize_ros1).decode([]).size == 0
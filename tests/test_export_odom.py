@@ -0,0 +1,37 @@
+"""Tests of rosbag_tools.export_odom"""
+
+import numpy as np
+import pytest
+from conftest import SPEC, read_rosbag
+
+from rosbag_tools.export_odom.decoding import OdometryDecoder
+from rosbag_tools.export_odom.odometry_exporter import OdometryExporter
+
+ODOM_TOPIC = SPEC.topics_of("odometry")[0]
+
+
+def test_export_tum(rosbag, tmp_path):
+    with OdometryExporter(rosbag) as exporter:
+        outpath = exporter.export_odometry(ODOM_TOPIC, "tum", tmp_path / "odom.txt")
+    rows = np.loadtxt(outpath, comments="#", ndmin=2)
+    assert len(rows) == sum(msg[0] == ODOM_TOPIC for msg in read_rosbag(rosbag))
+    # Unit circle, at a yaw of 90° from the position angle
+    np.testing.assert_allclose(np.hypot(rows[:, 1], rows[:, 2]), 1.0)
+
+
+@pytest.mark.parametrize("export_format, name", [("bag", "odom.bag"), ("bag2", "odom")])
+def test_export_rosbag_does_not_decode(
+    rosbag, tmp_path, monkeypatch, export_format, name
+):
+    def decode(self, datas):
+        raise AssertionError("Messages are decoded")
+
+    monkeypatch.setattr(OdometryDecoder, "decode", decode)
+    with OdometryExporter(rosbag) as exporter:
+        outpath = exporter.export_odometry(ODOM_TOPIC, export_format, tmp_path / name)
+    exported = read_rosbag(outpath)
+    expected = [msg for msg in read_rosbag(rosbag) if msg[0] == ODOM_TOPIC]
+    assert [msg[:2] for msg in exported] == [msg[:2] for msg in expected]
+    if (rosbag.suffix == ".bag") == (export_format == "bag"):
+        # Same serialization : messages are copied as they are
+        assert exported == expected
@@ -0,0 +1,141 @@
+"""Tests of the MCAP reader and writer, rosbag_tools.mcap"""
+
+import pytest
+from conftest import SPEC, read_rosbag
+from rosbags.rosbag2 import WriterError
+
+from benchmarks.synthetic import START_TIME, generate_messages
+from rosbag_tools.clip.clipper import BagClipper
+from rosbag_tools.mcap import McapReader, McapWriter
+
+MESSAGES = [
+    (topic.topic, topic.msgtype, tstamp, data)
+    for topic, tstamp, data in generate_messages(SPEC)
+]
+
+
+@pytest.fixture(scope="module", params=["", "lz4", "zstd"])
+def mcap_file(request, tmp_path_factory):
+    """MCAP file of the synthetic messages, with small chunks, in each compression"""
+    path = tmp_path_factory.mktemp("mcap") / f"{request.param or 'none'}.mcap"
+    writer = McapWriter(path)
+    writer.set_compression(request.param)
+    writer.chunk_threshold = 256 * 1024
+    with writer:
+        conns = {
+            topic.topic: writer.add_connection(topic.topic, topic.msgtype)
+            for topic in SPEC.topics
+        }
+        for topic, _, tstamp, data in MESSAGES:
+            writer.write(conns[topic], tstamp, data)
+    return path
+
+
+def test_round_trip(mcap_file):
+    assert read_rosbag(mcap_file) == [
+        (t, tstamp, data) for t, _, tstamp, data in MESSAGES
+    ]
+    with McapReader(mcap_file) as reader:
+        # Metadata comes from the summary section
+        assert len(reader._file.chunks) > 10
+        assert reader.message_count == len(MESSAGES)
+        assert reader.start_time == MESSAGES[0][2]
+        assert reader.end_time == MESSAGES[-1][2] + 1
+        assert {
+            topic: (info.msgtype, info.msgcount) for topic, info in reader.topics.items()
+        } == {
+            topic.topic: (topic.msgtype, int(SPEC.duration * topic.rate))
+            for topic in SPEC.topics
+        }
+
+
+@pytest.mark.parametrize("start, stop", [(0.5, 1.5), (1.0, 1.0), (2.99, 10.0)])
+def test_time_window(mcap_file, start, stop):
+    start_ns, stop_ns = START_TIME + int(start * 1e9), START_TIME + int(stop * 1e9)
+    imu_topic = SPEC.topics_of("imu")[0]
+    expected = [
+        (topic, tstamp, data)
+        for topic, _, tstamp, data in MESSAGES
+        if start_ns <= tstamp < stop_ns and topic == imu_topic
+    ]
+    with McapReader(mcap_file) as reader:
+        conns = [conn for conn in reader.connections if conn.topic == imu_topic]
+        messages = reader.messages(conns, start_ns, stop_ns)
+        assert [(conn.topic, tstamp, data) for conn, tstamp, data in messages] == expected
+        assert reader.count_messages(conns, start_ns, stop_ns) == len(expected)
+
+
+def test_writer_does_not_overwrite(mcap_file):
+    with pytest.raises(WriterError):
+        McapWriter(mcap_file)
+
+
+def test_clip_to_mcap(ros2_bag, tmp_path):
+    with BagClipper(ros2_bag) as clipper:
+        clipper.clip_rosbag(1.0, 2.0, tmp_path / "clip.mcap")
+    with BagClipper(tmp_path / "clip.mcap") as clipper:
+        clipper.clip_rosbag(0.0, 0.5, tmp_path / "clip2.mcap")
+    start, stop = START_TIME + 10**9, START_TIME + 1_500_000_000
+    expected = [msg for msg in read_rosbag(ros2_bag) if start <= msg[1] <= stop]
+    assert read_rosbag(tmp_path / "clip2.mcap") == expected
+
+
+def test_read_with_reference_library(mcap_file):
+    """Files written by McapWriter are valid for the reference MCAP library"""
+    mcap_reader = pytest.importorskip("mcap.reader")
+
+    with mcap_file.open("rb") as stream:
+        reader = mcap_reader.make_reader(stream, validate_crcs=True)
+        assert reader.get_header().profile == "ros2"
+        summary = reader.get_summary()
+        assert summary.statistics.message_count == len(MESSAGES)
+        assert len(summary.chunk_indexes) > 10
+        messages = [
+            (channel.topic, schema.name, message.log_time, message.data)
+            for schema, channel, message in reader.iter_messages(log_time_order=True)
+        ]
+        assert messages == MESSAGES
+        assert {schema.encoding for schema in summary.schemas.values()} == {"ros2msg"}
+        assert {channel.message_encoding for channel in summary.channels.values()} == {
+            "cdr"
+        }
+
+    # Sequential read of every record, with the chunk CRCs
+    with mcap_file.open("rb") as stream:
+        reader = mcap_reader.NonSeekingReader(stream, validate_crcs=True)
+        assert sum(1 for _ in reader.iter_messages()) == len(MESSAGES)
+
+
+@pytest.mark.parametrize("compression", ["NONE", "LZ4", "ZSTD"])
+def test_read_reference_file(tmp_path, compression):
+    """Files written by the reference MCAP library are read by McapReader"""
+    mcap_writer = pytest.importorskip("mcap.writer")
+    from rosbags.typesys.msg import generate_msgdef
+
+    path = tmp_path / "reference.mcap"
+    with path.open("wb") as stream:
+        writer = mcap_writer.Writer(
+            stream,
+            chunk_size=256 * 1024,
+            compression=mcap_writer.CompressionType[compression],
+        )
+        writer.start(profile="ros2")
+        channels = {}
+        for topic in SPEC.topics:
+            msgdef, _ = generate_msgdef(topic.msgtype, ros_version=2)
+            schema_id = writer.register_schema(topic.msgtype, "ros2msg", msgdef.encode())
+            channels[topic.topic] = writer.register_channel(topic.topic, "cdr", schema_id)
+        for topic, _, tstamp, data in MESSAGES:
+            writer.add_message(channels[topic], tstamp, data, tstamp)
+        writer.finish()
+
+    assert read_rosbag(path) == [(t, tstamp, data) for t, _, tstamp, data in MESSAGES]
+    with McapReader(path) as reader:
+        assert reader.message_count == len(MESSAGES)
+        assert {conn.topic: conn.msgtype for conn in reader.connections} == {
+            topic.topic: topic.msgtype for topic in SPEC.topics
+        }
+        start = START_TIME + 10**9
+        assert reader.count_messages(start=start, stop=start + 10**9) == sum(
+            start <= tstamp < start + 10**9 for _, _, tstamp, _ in MESSAGES
+        )
@@ -0,0 +1,121 @@
+"""Tests of rosbag_tools.pipeline"""
+
+from types import SimpleNamespace
+
+import pytest
+from conftest import read_rosbag
+
+from benchmarks.synthetic import START_TIME
+from rosbag_tools import exceptions
+from rosbag_tools.pipeline.pipeline import (
+    BagPipeline,
+    Decimate,
+    SplitRouter,
+    TimeWindow,
+    TopicFilter,
+)
+
+SESSION = SimpleNamespace(
+    topics=("/imu", "/odom", "/camera"),
+    start_time=100 * 10**9,
+    end_time=110 * 10**9,
+    duration=10 * 10**9,
+)
+
+
+def messages(*topics, count=4):
+    """One message per second on each topic, from the start of SESSION"""
+    return [
+        (SimpleNamespace(topic=topic), SESSION.start_time + sec * 10**9, b"", (0,))
+        for sec in range(count)
+        for topic in topics
+    ]
+
+
+def run_stage(stage, msgs):
+    stage.bind(SESSION)
+    return list(stage.process(iter(msgs)))
+
+
+def test_time_window():
+    stage = TimeWindow(1.0, 2.0)
+    kept = run_stage(stage, messages("/imu"))
+    assert [msg[1] for msg in kept] == [101 * 10**9, 102 * 10**9]
+    assert stage.window() == (101 * 10**9, 102 * 10**9 + 1)
+
+
+def test_time_window_invalid():
+    with pytest.raises(exceptions.InvalidTimestampError):
+        TimeWindow(2.0, 1.0)
+
+
+@pytest.mark.parametrize(
+    "patterns, keep, expected",
+    [
+        ("/imu", False, {"/odom", "/camera"}),
+        (["/imu", "/cam*"], False, {"/odom"}),
+        ("/imu", True, {"/imu"}),
+    ],
+)
+def test_topic_filter(patterns, keep, expected):
+    stage = TopicFilter(patterns, keep=keep)
+    kept = run_stage(stage, messages(*SESSION.topics))
+    assert {msg[0].topic for msg in kept} == expected
+    assert set(stage.topics) == expected
+    connections = [SimpleNamespace(topic=topic) for topic in SESSION.topics]
+    assert {conn.topic for conn in stage.select(connections)} == expected
+
+
+def test_decimate():
+    kept = run_stage(Decimate(2, "/imu"), messages("/imu", "/odom", count=5))
+    imu = [msg[1] for msg in kept if msg[0].topic == "/imu"]
+    assert imu == [SESSION.start_time + sec * 10**9 for sec in (0, 2, 4)]
+    assert sum(msg[0].topic == "/odom" for msg in kept) == 5
+
+
+def test_decimate_invalid():
+    with pytest.raises(ValueError):
+        Decimate(0)
+
+
+def test_split_router():
+    routed = run_stage(SplitRouter([2.0, 1.0]), messages("/imu"))
+    assert [msg[3] for msg in routed] == [(0,), (0, 1), (1, 2), (2,)]
+
+
+def test_split_router_invalid():
+    with pytest.raises(exceptions.InvalidTimestampError):
+        run_stage(SplitRouter([20.0]), messages("/imu"))
+
+
+def test_bag_pipeline(rosbag, out_path, spec):
+    imu_topic = spec.topics_of("imu")[0]
+    image_topic = spec.topics_of("image")[0]
+    stages = [
+        TimeWindow(1.0, 3.0),
+        TopicFilter(image_topic),
+        Decimate(2, imu_topic),
+        SplitRouter([2.0]),
+    ]
+    with BagPipeline(rosbag, stages) as pipeline:
+        pipeline.run(out_path("pipeline"))
+
+    window = (START_TIME + 10**9, START_TIME + 3 * 10**9)
+    kept, imu_count = [], 0
+    for msg in read_rosbag(rosbag):
+        if not window[0] <= msg[1] <= window[1] or msg[0] == image_topic:
+            continue
+        if msg[0] == imu_topic:
+            imu_count += 1
+            if imu_count % 2 == 0:
+                continue
+        kept.append(msg)
+
+    outbag = out_path("pipeline")
+    first, second = (
+        read_rosbag(outbag.with_name(f"{outbag.stem}_{idx:02d}{outbag.suffix}"))
+        for idx in (1, 2)
+    )
+    split = START_TIME + 2 * 10**9
+    assert first == [msg for msg in kept if msg[1] <= split]
+    assert second == [msg for msg in kept if msg[1] >= split]
@@ -0,0 +1,56 @@
+"""Tests of rosbag_tools.profiling"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from rosbag_tools import profiling
+from rosbag_tools.profiling import (
+    Profiler,
+    profile_messages,
+    profile_stage,
+    profile_write,
+)
+
+
+@pytest.fixture
+def rss(monkeypatch):
+    """Fake process peak RSS, that the test sets"""
+    value = SimpleNamespace(peak=100)
+    monkeypatch.setattr(profiling, "peak_rss", lambda: value.peak)
+    return value
+
+
+def test_stage_rss_growth(rss):
+    conn = SimpleNamespace(topic="/a")
+
+    def messages():
+        for _ in range(3):
+            rss.peak += 10
+            yield conn, 0, b"data"
+
+    with Profiler() as profiler:
+        with profile_stage("open"):
+            rss.peak += 50
+        with profile_stage("open"):
+            pass
+        write = profile_write("write", lambda conn, tstamp, data: None)
+        for msg in profile_messages("read", messages()):
+            write(*msg)
+
+    stages = profiler.to_dict()["stages"]
+    # Growth of the process peak RSS from the start to the end of the stage blocks
+    assert stages["open"]["rss_growth"] == 50
+    assert stages["open"]["calls"] == 2
+    assert stages["read"]["rss_growth"] == 30
+    assert stages["read"]["messages"] == 3
+    # Stages timed per call have no blocks
+    assert stages["write"]["rss_growth"] is None
+    assert stages["write"]["bytes"] == 12
+    assert profiler.to_dict()["peak_rss"] == 180
+    assert "Process peak RSS" in profiler.summary()
+
+
+def test_no_active_profiler():
+    messages = iter([])
+    assert profile_messages("read", messages) is messages
@@ -0,0 +1,60 @@
+"""Tests of rosbag_tools.reading"""
+
+import shutil
+
+import pytest
+import yaml
+from conftest import SPEC, read_rosbag
+from rosbags.rosbag1 import Reader as Reader1
+from rosbags.rosbag2 import Reader as Reader2
+
+from benchmarks.synthetic import START_TIME
+from rosbag_tools.mcap import McapWriter
+from rosbag_tools.reading import count_messages, read_messages
+
+START, STOP = START_TIME + 10**9, START_TIME + 2_500_000_000
+
+
+@pytest.fixture
+def ros2_mcap_bag(ros2_bag, tmp_path):
+    """Synthetic ROS 2 rosbag in the mcap storage"""
+    path = shutil.copytree(ros2_bag, tmp_path / "mcap")
+    (path / "synthetic.db3").unlink()
+    writer = McapWriter(path / "synthetic.mcap")
+    with writer:
+        conns = {
+            topic.topic: writer.add_connection(topic.topic, topic.msgtype)
+            for topic in SPEC.topics
+        }
+        for topic, tstamp, data in read_rosbag(ros2_bag):
+            writer.write(conns[topic], tstamp, data)
+
+    metadata = yaml.safe_load((path / "metadata.yaml").read_text())
+    bag_info = metadata["rosbag2_bagfile_information"]
+    bag_info["storage_identifier"] = "mcap"
+    bag_info["relative_file_paths"] = ["synthetic.mcap"]
+    bag_info["files"][0]["path"] = "synthetic.mcap"
+    (path / "metadata.yaml").write_text(yaml.safe_dump(metadata))
+    return path
+
+
+def test_count_messages(rosbag):
+    expected = [msg for msg in read_rosbag(rosbag) if START <= msg[1] < STOP]
+    Reader = Reader1 if rosbag.suffix == ".bag" else Reader2
+    with Reader(rosbag) as reader:
+        assert count_messages(reader, start=START, stop=STOP) == len(expected)
+        assert count_messages(reader) == SPEC.message_count
+        read = [
+            (c.topic, t, d) for c, t, d in read_messages(reader, start=START, stop=STOP)
+        ]
+    assert read == expected
+
+
+def test_count_messages_without_timestamp_index(ros2_bag, ros2_mcap_bag):
+    with Reader2(ros2_mcap_bag) as reader:
+        # The whole rosbag is counted from its metadata
+        assert count_messages(reader) == SPEC.message_count
+        # Messages of a time window cannot be counted without reading them
+        assert count_messages(reader, start=START, stop=STOP) is None
+        messages = list(read_messages(reader, start=START, stop=STOP))
+    assert len(messages) == sum(START <= msg[1] < STOP for msg in read_rosbag(ros2_bag))
@@ -0,0 +1,54 @@
+"""Tests of rosbag_tools.split"""
+
+from collections import Counter
+
+import pytest
+from conftest import read_rosbag
+
+from benchmarks.synthetic import START_TIME
+from rosbag_tools.split.splitter import BagSplitter, section_indices
+
+
+@pytest.mark.parametrize(
+    "timestamp, expected",
+    [
+        (5, (0,)),
+        (10, (0, 1)),
+        (15, (1,)),
+        (20, (1, 2)),
+        (25, (2,)),
+    ],
+)
+def test_section_indices(timestamp, expected):
+    assert section_indices([10, 20], timestamp) == expected
+
+
+def test_section_indices_without_split():
+    assert section_indices([], 10) == (0,)
+
+
+@pytest.mark.parametrize("chunk_copy", [True, False])
+def test_split_rosbag(rosbag, out_path, chunk_copy):
+    with BagSplitter(rosbag) as splitter:
+        splitter.split_rosbag(
+            [1.5, 2.0], out_path("split"), chunk_copy=chunk_copy, max_open_writers=1
+        )
+    outbag = out_path("split")
+    sections = [
+        read_rosbag(outbag.with_name(f"{outbag.stem}_{idx:02d}{outbag.suffix}"))
+        for idx in (1, 2, 3)
+    ]
+    bounds = (START_TIME, START_TIME + 1_500_000_000, START_TIME + 2 * 10**9)
+    assert all(tstamp <= bounds[1] for _, tstamp, _ in sections[0])
+    assert all(bounds[1] <= tstamp <= bounds[2] for _, tstamp, _ in sections[1])
+    assert all(bounds[2] <= tstamp for _, tstamp, _ in sections[2])
+
+    # Messages on a split timestamp are in both sections around it
+    boundary = [msg for msg in read_rosbag(rosbag) if msg[1] in bounds[1:]]
+    assert len(boundary) == 2
+    assert boundary[0] in sections[0] and boundary[0] in sections[1]
+    assert boundary[1] in sections[1] and boundary[1] in sections[2]
+
+    merged = Counter(msg for section in sections for msg in section)
+    expected = Counter(read_rosbag(rosbag) + boundary)
+    assert merged == expected
@@ -0,0 +1,45 @@
+"""Startup tests of the rosbag-tools CLI"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Dependencies that are only imported by the tools that need them
+HEAVY_MODULES = ("rosbags", "pandas", "numpy", "yaml", "tqdm", "matplotlib")
+
+HELP_SCRIPT = """
+import sys
+
+from rosbag_tools.__main__ import cli_main
+
+sys.argv = ["rosbag-tools", *sys.argv[1:]]
+try:
+    cli_main()
+except SystemExit:
+    pass
+print(",".join(sorted({name.split(".")[0] for name in sys.modules})))
+"""
+
+
+def loaded_modules(*args: str) -> set:
+    """Top-level modules loaded by `rosbag-tools <args>`, in a fresh interpreter"""
+    # The package is importable from the child interpreter as it is from pytest
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    result = subprocess.run(
+        [sys.executable, "-c", HELP_SCRIPT, *args],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.strip().splitlines()[-1].split(","))
+
+
+@pytest.mark.parametrize("args", [("--help",), ("clip", "--help")])
+def test_help_does_not_import_heavy_dependencies(args):
+    modules = loaded_modules(*args)
+    assert "rosbag_tools" in modules
+    for name in HEAVY_MODULES:
+        assert name not in modules, f"'rosbag-tools {' '.join(args)}' imports {name}"
@@ -0,0 +1,106 @@
+"""Tests of rosbag_tools.topic_remove"""
+
+import shutil
+
+import pytest
+import yaml
+from click.testing import CliRunner
+from conftest import SPEC, read_rosbag
+from rosbags.rosbag2 import Reader as Reader2
+from rosbags.rosbag2 import Writer as Writer2
+
+from benchmarks.synthetic import generate_messages
+from rosbag_tools.topic_remove.main import cli
+from rosbag_tools.topic_remove.topic_remover import BagTopicRemover
+
+IMAGE_TOPIC = SPEC.topics_of("image")[0]
+
+
+@pytest.fixture
+def ros2_copy(ros2_bag, tmp_path):
+    """Copy of the synthetic ROS 2 rosbag, that can be modified"""
+    return shutil.copytree(ros2_bag, tmp_path / ros2_bag.name)
+
+
+def test_export(rosbag, out_path):
+    with BagTopicRemover(rosbag) as remover:
+        remover.remove(["/odom*", IMAGE_TOPIC])
+        remover.export(out_path("filt"))
+    kept = {topic.topic for topic in SPEC.topics if topic.kind == "imu"}
+    assert read_rosbag(out_path("filt")) == [
+        msg for msg in read_rosbag(rosbag) if msg[0] in kept
+    ]
+
+
+@pytest.mark.parametrize("vacuum", [False, True])
+def test_remove_in_place(ros2_bag, ros2_copy, vacuum):
+    db_size = sum(db.stat().st_size for db in ros2_copy.glob("*.db3"))
+    with BagTopicRemover(ros2_copy) as remover:
+        remover.remove([IMAGE_TOPIC])
+        remover.remove_in_place(vacuum=vacuum)
+
+    expected = [msg for msg in read_rosbag(ros2_bag) if msg[0] != IMAGE_TOPIC]
+    assert read_rosbag(ros2_copy) == expected
+    with Reader2(ros2_copy) as reader:
+        assert reader.message_count == len(expected)
+        assert {topic: info.msgcount for topic, info in reader.topics.items()} == {
+            topic.topic: int(SPEC.duration * topic.rate)
+            for topic in SPEC.topics
+            if topic.topic != IMAGE_TOPIC
+        }
+        assert reader.start_time == expected[0][1]
+        assert reader.end_time == expected[-1][1] + 1
+
+    bag_info = yaml.safe_load((ros2_copy / "metadata.yaml").read_text())[
+        "rosbag2_bagfile_information"
+    ]
+    assert [f["message_count"] for f in bag_info["files"]] == [len(expected)]
+    assert bag_info["files"][0]["starting_time"]["nanoseconds_since_epoch"] == (
+        expected[0][1]
+    )
+    if vacuum:
+        # The space of the deleted messages is given back
+        assert sum(db.stat().st_size for db in ros2_copy.glob("*.db3")) < db_size
+
+
+def test_remove_in_place_cli(ros2_bag, ros2_copy):
+    result = CliRunner().invoke(
+        cli, [str(ros2_copy), "-t", IMAGE_TOPIC, "--in-place", "--vacuum", "-q"]
+    )
+    assert result.exit_code == 0, result.output
+    assert read_rosbag(ros2_copy) == [
+        msg for msg in read_rosbag(ros2_bag) if msg[0] != IMAGE_TOPIC
+    ]
+
+
+def test_remove_in_place_rejects_ros1(ros1_bag):
+    with BagTopicRemover(ros1_bag) as remover:
+        with pytest.raises(NotImplementedError):
+            remover.check_in_place()
+    result = CliRunner().invoke(cli, [str(ros1_bag), "-t", IMAGE_TOPIC, "--in-place"])
+    assert result.exit_code == 2
+    assert "--in-place cannot be used" in result.output
+
+
+def test_remove_in_place_rejects_compressed_file(tmp_path):
+    path = tmp_path / "compressed"
+    writer = Writer2(path)
+    writer.set_compression(Writer2.CompressionMode.FILE, Writer2.CompressionFormat.ZSTD)
+    with writer:
+        conns = {
+            topic.topic: writer.add_connection(topic.topic, topic.msgtype)
+            for topic in SPEC.topics
+        }
+        for topic, timestamp, data in generate_messages(SPEC):
+            writer.write(conns[topic.topic], timestamp, data)
+    files = sorted(p.name for p in path.iterdir())
+
+    with BagTopicRemover(path) as remover:
+        remover.remove([IMAGE_TOPIC])
+        with pytest.raises(NotImplementedError):
+            remover.remove_in_place()
+    result = CliRunner().invoke(cli, [str(path), "-t", IMAGE_TOPIC, "--in-place"])
+    assert result.exit_code == 2
+    assert "compressed by file" in result.output
+    # The rosbag is not modified
+    assert sorted(p.name for p in path.iterdir()) == files
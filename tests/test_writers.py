@@ -0,0 +1,109 @@
+"""Tests of rosbag_tools.writers"""
+
+from types import SimpleNamespace
+
+import pytest
+
+from rosbag_tools.writers import WriterPool
+
+
+class FakeWriter:
+    """Writer that records when it is opened, written and closed"""
+
+    events = []
+
+    def __init__(self, path):
+        self.path = path
+        self.messages = []
+
+    def open(self):
+        self.events.append(("open", self.path.name))
+
+    def write(self, conn, timestamp, data):
+        self.messages.append((conn, timestamp, data))
+
+    def close(self):
+        self.events.append(("close", self.path.name))
+
+
+@pytest.fixture
+def events():
+    FakeWriter.events = []
+    return FakeWriter.events
+
+
+def make_pool(n_outputs, max_open, stops=None):
+    connections = [SimpleNamespace(id=1, topic="/a"), SimpleNamespace(id=2, topic="/b")]
+    return WriterPool(
+        [f"out{idx}" for idx in range(n_outputs)],
+        FakeWriter,
+        connections,
+        # Only /a is written
+        lambda writer, conns: {
+            conn.id: conn.topic for conn in conns if conn.topic == "/a"
+        },
+        max_open=max_open,
+        stops=stops,
+    )
+
+
+def test_writer_pool_writes_mapped_connections(events):
+    conn_a, conn_b = SimpleNamespace(id=1), SimpleNamespace(id=2)
+    with make_pool(1, 1) as pool:
+        pool.write(0, conn_a, 10, b"a")
+        pool.write(0, conn_b, 11, b"b")
+        writer, _ = pool.get(0)
+    assert writer.messages == [("/a", 10, b"a")]
+
+
+def test_writer_pool_evicts_least_recently_used(events):
+    conn = SimpleNamespace(id=1)
+    pool = make_pool(3, 2)
+    pool.write(0, conn, 1, b"")
+    pool.write(1, conn, 2, b"")
+    pool.write(0, conn, 3, b"")
+    pool.write(2, conn, 4, b"")
+    assert events == [
+        ("open", "out0"),
+        ("open", "out1"),
+        ("close", "out1"),
+        ("open", "out2"),
+    ]
+    with pytest.raises(RuntimeError):
+        pool.write(1, conn, 5, b"")
+    pool.close()
+
+
+def test_writer_pool_evicts_ended_outputs(events):
+    conn = SimpleNamespace(id=1)
+    # Output 0 ends at 10, output 1 goes on until 30
+    pool = make_pool(3, 2, stops=[10, 30, 40])
+    pool.write(1, conn, 1, b"")
+    pool.write(0, conn, 2, b"")
+    # Output 1 is the least recently used, but output 0 has ended
+    pool.write(2, conn, 20, b"")
+    assert events[-2:] == [("close", "out0"), ("open", "out2")]
+    pool.close()
+
+
+def test_writer_pool_creates_missing_outputs(events):
+    with make_pool(2, 1):
+        pass
+    assert events == [
+        ("open", "out0"),
+        ("close", "out0"),
+        ("open", "out1"),
+        ("close", "out1"),
+    ]
+
+
+def test_writer_pool_does_not_create_outputs_on_error(events):
+    with pytest.raises(KeyError):
+        with make_pool(2, 1):
+            raise KeyError("error")
+    assert not events
+
+
+def test_writer_pool_max_open():
+    with pytest.raises(ValueError):
+        make_pool(2, 0)